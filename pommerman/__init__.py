@@ -2,11 +2,18 @@
 import gym
 import inspect
 from . import agents
+from . import board_library
 from . import configs
 from . import constants
 from . import forward_model
+from . import game_state
 from . import helpers
+from . import observation
+from . import replay
+from . import state_file
+from . import transition_cache
 from . import utility
+from . import zobrist
 from . import network
 
 gym.logger.set_level(40)
@@ -32,7 +39,8 @@ def _register():
 # Register environments with gym
 _register()
 
-def make(config_id, agent_list, game_state_file=None, render_mode='human'):
+def make(config_id, agent_list, game_state_file=None, render_mode='human',
+         obs_dtype=None, library=None, prefetch=0):
     '''Makes the pommerman env and registers it with gym'''
     assert config_id in REGISTRY, "Unknown configuration '{}'. " \
         "Possible values: {}".format(config_id, REGISTRY)
@@ -46,6 +54,12 @@ def make(config_id, agent_list, game_state_file=None, render_mode='human'):
     env.set_agents(agent_list)
     env.set_init_game_state(game_state_file)
     env.set_render_mode(render_mode)
+    if obs_dtype is not None:
+        env.set_obs_dtype(obs_dtype)
+    if library is not None:
+        env.set_board_library(library)
+    if prefetch:
+        env.set_prefetch(prefetch)
     return env
 
 
@@ -1,5 +1,7 @@
 '''This is the base abstraction for agents in pommerman.
 All agents should inherent from this class'''
+import random
+
 from .. import characters
 
 
@@ -8,8 +10,12 @@ class BaseAgent:
 
     def __init__(self, character=characters.Bomber):
         self._character = character
+        self._rng = random.Random()
 
     def __getattr__(self, attr):
+        # Unpickling looks attributes up before _character is set.
+        if attr == '_character':
+            raise AttributeError(attr)
         return getattr(self._character, attr)
 
     def act(self, obs, action_space):
@@ -24,6 +30,13 @@ class BaseAgent:
         """
         pass
 
+    def seed(self, seed=None):
+        """Seeds the random.Random that the agent draws its randomness from.
+
+        Pomme.seed calls this with a child seed of the env's seed.
+        """
+        self._rng = random.Random(seed)
+
     def init_agent(self, id_, game_type):
         self._character = self._character(id_, game_type)
 
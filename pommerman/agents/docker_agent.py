@@ -1,4 +1,5 @@
 '''An example docker agent.'''
+import collections
 import json
 import time
 import os
@@ -7,12 +8,17 @@ import requests
 import docker
 
 from . import BaseAgent
-from .. import utility
 from .. import characters
+from .. import observation
+from .. import utility
 
 
 class DockerAgent(BaseAgent):
-    """The Docker Agent that Connects to a Docker container where the character runs."""
+    """The Docker Agent that Connects to a Docker container where the character runs.
+
+    It keeps its connections to the container open, see utility.make_session,
+    and records the seconds its action requests take in action_latencies.
+    """
 
     def __init__(self,
                  docker_image,
@@ -20,9 +26,15 @@ class DockerAgent(BaseAgent):
                  server='http://localhost',
                  character=characters.Bomber,
                  docker_client=None,
-                 env_vars=None):
+                 env_vars=None,
+                 pool_size=1,
+                 retries=0):
         super(DockerAgent, self).__init__(character)
 
+        self._session = utility.make_session(pool_size, retries)
+        # The seconds taken by each of the last action requests.
+        self.action_latencies = collections.deque(maxlen=1000)
+
         self._docker_image = docker_image
         self._docker_client = docker_client
         if not self._docker_client:
@@ -93,7 +105,7 @@ class DockerAgent(BaseAgent):
                     raise
 
                 request_url = '%s:%s/ping' % (self._server, self._port)
-                req = requests.get(request_url)
+                req = self._session.get(request_url)
                 self._acknowledged = True
                 return True
             except requests.exceptions.ConnectionError as e:
@@ -112,7 +124,7 @@ class DockerAgent(BaseAgent):
         super(DockerAgent, self).init_agent(id, game_type)
         request_url = "http://localhost:{}/init_agent".format(self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={
@@ -123,10 +135,12 @@ class DockerAgent(BaseAgent):
             print('Timeout in init_agent()!')
 
     def act(self, obs, action_space):
-        obs_serialized = json.dumps(obs, cls=utility.PommermanJSONEncoder)
+        obs_serialized = json.dumps(
+            observation.materialize(obs), cls=utility.PommermanJSONEncoder)
         request_url = "http://localhost:{}/action".format(self._port)
+        start = time.perf_counter()
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.15,
                 json={
@@ -144,12 +158,15 @@ class DockerAgent(BaseAgent):
                 return [0] * num_actions
             else:
                 return 0
+        finally:
+            # Failed requests are timed too, up to when they failed.
+            self.action_latencies.append(time.perf_counter() - start)
         return action
 
     def episode_end(self, reward):
         request_url = "http://localhost:{}/episode_end".format(self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={
@@ -161,12 +178,13 @@ class DockerAgent(BaseAgent):
     def shutdown(self):
         request_url = "http://localhost:{}/shutdown".format(self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={ })
         except requests.exceptions.Timeout as e:
             print('Timeout in shutdown()!')
+        self._session.close()
 
         print("Stopping container..")
         if self._container:
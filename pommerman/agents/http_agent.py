@@ -1,5 +1,6 @@
 '''The HTTP agent - provides observation using http push to remote
    agent and expects action in the reply'''
+import collections
 import json
 import time
 import os
@@ -7,23 +8,31 @@ import threading
 import requests
 
 from . import BaseAgent
-from .. import utility
 from .. import characters
+from .. import observation
+from .. import utility
 
 
 class HttpAgent(BaseAgent):
     """The HTTP Agent that connects to a port with a remote agent where the
        character runs. It uses the same interface as the docker agent and
-       is useful for debugging."""
+       is useful for debugging. It keeps its connections to the remote agent
+       open, see utility.make_session, and records the seconds its action
+       requests take in action_latencies."""
 
     def __init__(self,
                  port=8080,
                  host='localhost',
                  timeout=120,
-                 character=characters.Bomber):
+                 character=characters.Bomber,
+                 pool_size=1,
+                 retries=0):
         self._port = port
         self._host = host
         self._timeout = timeout
+        self._session = utility.make_session(pool_size, retries)
+        # The seconds taken by each of the last action requests.
+        self.action_latencies = collections.deque(maxlen=1000)
         super(HttpAgent, self).__init__(character)
         self._wait_for_remote()
 
@@ -45,7 +54,7 @@ class HttpAgent(BaseAgent):
                     raise
 
                 request_url = 'http://%s:%s/ping' % (self._host, self._port)
-                req = requests.get(request_url)
+                req = self._session.get(request_url)
                 self._acknowledged = True
                 return True
             except requests.exceptions.ConnectionError as e:
@@ -61,7 +70,7 @@ class HttpAgent(BaseAgent):
         super(HttpAgent, self).init_agent(id, game_type)
         request_url = "http://{}:{}/init_agent".format(self._host, self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={
@@ -72,10 +81,12 @@ class HttpAgent(BaseAgent):
             print('Timeout in init_agent()!')
 
     def act(self, obs, action_space):
-        obs_serialized = json.dumps(obs, cls=utility.PommermanJSONEncoder)
+        obs_serialized = json.dumps(
+            observation.materialize(obs), cls=utility.PommermanJSONEncoder)
         request_url = "http://{}:{}/action".format(self._host, self._port)
+        start = time.perf_counter()
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.15,
                 json={
@@ -93,12 +104,15 @@ class HttpAgent(BaseAgent):
                 return [0] * num_actions
             else:
                 return 0
+        finally:
+            # Failed requests are timed too, up to when they failed.
+            self.action_latencies.append(time.perf_counter() - start)
         return action
 
     def episode_end(self, reward):
         request_url = "http://{}:{}/episode_end".format(self._host, self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={
@@ -110,9 +124,10 @@ class HttpAgent(BaseAgent):
     def shutdown(self):
         request_url = "http://{}:{}/shutdown".format(self._host, self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={ })
         except requests.exceptions.Timeout as e:
             print('Timeout in shutdown()!')
+        self._session.close()
@@ -1,4 +1,6 @@
 '''An agent that preforms a random action each step'''
+from gym import spaces
+
 from . import BaseAgent
 
 
@@ -6,4 +8,8 @@ class RandomAgent(BaseAgent):
     """The Random Agent that returns random actions given an action_space."""
 
     def act(self, obs, action_space):
-        return action_space.sample()
+        # Draw from the agent's own generator rather than gym's global one.
+        if isinstance(action_space, spaces.Tuple):
+            return tuple(
+                self._rng.randrange(space.n) for space in action_space.spaces)
+        return self._rng.randrange(action_space.n)
@@ -46,7 +46,7 @@ class SimpleAgent(BaseAgent):
         ammo = int(obs['ammo'])
         blast_strength = int(obs['blast_strength'])
         items, dist, prev = self._djikstra(
-            board, my_position, bombs, enemies, depth=10)
+            board, my_position, bombs, enemies, depth=10, rng=self._rng)
 
         # Move if we are in an unsafe place.
         unsafe_directions = self._directions_in_range_of_bomb(
@@ -54,7 +54,7 @@ class SimpleAgent(BaseAgent):
         if unsafe_directions:
             directions = self._find_safe_directions(
                 board, my_position, unsafe_directions, bombs, enemies)
-            return random.choice(directions).value
+            return self._rng.choice(directions).value
 
         # Lay pomme if we are adjacent to an enemy.
         if self._is_adjacent_enemy(items, dist, enemies) and self._maybe_bomb(
@@ -64,7 +64,7 @@ class SimpleAgent(BaseAgent):
         # Move towards an enemy if there is one in exactly three reachable spaces.
         direction = self._near_enemy(my_position, items, dist, prev, enemies, 3)
         if direction is not None and (self._prev_direction != direction or
-                                      random.random() < .5):
+                                      self._rng.random() < .5):
             self._prev_direction = direction
             return direction.value
 
@@ -109,10 +109,11 @@ class SimpleAgent(BaseAgent):
         self._recently_visited_positions = self._recently_visited_positions[
             -self._recently_visited_length:]
 
-        return random.choice(directions).value
+        return self._rng.choice(directions).value
 
     @staticmethod
-    def _djikstra(board, my_position, bombs, enemies, depth=None, exclude=None):
+    def _djikstra(board, my_position, bombs, enemies, depth=None, exclude=None,
+                  rng=random):
         assert (depth is not None)
 
         if exclude is None:
@@ -131,18 +132,20 @@ class SimpleAgent(BaseAgent):
         prev = {}
         Q = queue.Queue()
 
+        # Classify the whole board up front.
+        values = board.tolist()
+        excluded = utility.item_table(exclude)[board].tolist()
+        passable = utility.passable_cells(board, enemies).tolist()
+
         my_x, my_y = my_position
         for r in range(max(0, my_x - depth), min(len(board), my_x + depth)):
             for c in range(max(0, my_y - depth), min(len(board), my_y + depth)):
                 position = (r, c)
-                if any([
-                        out_of_range(my_position, position),
-                        utility.position_in_items(board, position, exclude),
-                ]):
+                if out_of_range(my_position, position) or excluded[r][c]:
                     continue
 
                 prev[position] = None
-                item = constants.Item(board[position])
+                item = utility.ITEMS_BY_VALUE[values[r][c]]
                 items[item].append(position)
                 
                 if position == my_position:
@@ -159,8 +162,8 @@ class SimpleAgent(BaseAgent):
         while not Q.empty():
             position = Q.get()
 
-            if utility.position_is_passable(board, position, enemies):
-                x, y = position
+            x, y = position
+            if passable[x][y]:
                 val = dist[(x, y)] + 1
                 for row, col in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
                     new_position = (row + x, col + y)
@@ -171,7 +174,7 @@ class SimpleAgent(BaseAgent):
                         dist[new_position] = val
                         prev[new_position] = position
                         Q.put(new_position)
-                    elif (val == dist[new_position] and random.random() < .5):
+                    elif (val == dist[new_position] and rng.random() < .5):
                         dist[new_position] = val
                         prev[new_position] = position   
 
@@ -0,0 +1,178 @@
+'''Libraries of pre-generated games that Pomme.reset can draw from.
+
+A library is a single .npy file holding a uint8 array of shape
+(num_boards, 2, board_size, board_size): the board and the items hidden
+under it for each game, made with utility.make_board and make_items. Loaded
+with mmap_mode='r', a reset costs an index lookup and a copy, and all the
+worker processes using a library share the same page cache.
+
+A Prefetcher instead makes fresh games on a background worker while the
+current episode is played.
+'''
+import multiprocessing
+import queue
+import random
+import threading
+
+import gym
+import numpy as np
+
+from . import constants
+from . import utility
+
+# The index of the boards and of the items on axis 1 of a library.
+BOARD = 0
+ITEMS = 1
+
+
+def generate(board_size, num_rigid, num_wood, num_items, num_agents,
+             num_boards, seed=None):
+    """Generates a library of boards and items.
+
+    Args:
+      board_size: The dimension of the boards.
+      num_rigid: The number of rigid walls on each board.
+      num_wood: The number of wood walls on each board.
+      num_items: The number of items hidden under the wood of each board.
+      num_agents: The number of agents placed on each board.
+      num_boards: The number of games in the library.
+      seed: The seed of the random.Random the games are drawn from.
+
+    Returns:
+      A uint8 array of shape (num_boards, 2, board_size, board_size).
+    """
+    rng = random.Random(seed)
+    ret = np.zeros((num_boards, 2, board_size, board_size), dtype=np.uint8)
+    for num in range(num_boards):
+        ret[num, BOARD], ret[num, ITEMS], _ = make_game(
+            board_size, num_rigid, num_wood, num_items, num_agents, rng)
+    return ret
+
+
+def make_game(board_size, num_rigid, num_wood, num_items, num_agents,
+              rng=None):
+    """Makes the board and items of a new game.
+
+    Returns:
+      board: The board from utility.make_board.
+      items: The uint8 grid of the items from utility.make_items, 0 where
+        there is none.
+      agent_positions: The start position of each agent.
+    """
+    board = utility.make_board(
+        board_size, num_rigid, num_wood, num_agents, rng=rng)
+    items = np.zeros_like(board)
+    for position, item in utility.make_items(board, num_items,
+                                             rng=rng).items():
+        items[position] = item
+    agent_positions = [
+        tuple(np.argwhere(board == utility.agent_value(agent_id))[0])
+        for agent_id in range(num_agents)
+    ]
+    return board, items, agent_positions
+
+
+def generate_for_config(config_id, num_boards, seed=None):
+    '''Generates a library with the board settings of a registered config'''
+    kwargs = gym.spec(config_id)._kwargs
+    num_agents = 2 if kwargs['game_type'] == constants.GameType.OneVsOne \
+        else 4
+    return generate(kwargs['board_size'], kwargs['num_rigid'],
+                    kwargs['num_wood'], kwargs['num_items'], num_agents,
+                    num_boards, seed)
+
+
+def save(path, library):
+    '''Writes a library to a .npy file'''
+    np.save(path, np.asarray(library, dtype=np.uint8))
+
+
+def load(path, board_size=None):
+    """Memory-maps a library written by save.
+
+    Args:
+      path: The .npy file.
+      board_size: If given, the board size the library must have.
+
+    Returns:
+      The read-only library array.
+    """
+    library = np.load(path, mmap_mode='r')
+    check(library, board_size)
+    return library
+
+
+def check(library, board_size=None):
+    '''Raises a ValueError if library is not a library of board_size boards'''
+    if library.ndim != 4 or library.shape[1] != 2 or \
+       library.shape[2] != library.shape[3] or library.dtype != np.uint8:
+        raise ValueError('Not a board library: {} array of shape {}.'.format(
+            library.dtype, library.shape))
+    if not len(library):
+        raise ValueError('The board library is empty.')
+    if board_size is not None and library.shape[2] != board_size:
+        raise ValueError('The board library has {0}x{0} boards, not '
+                         '{1}x{1}.'.format(library.shape[2], board_size))
+
+
+class Prefetcher(object):
+    """Makes games with make_game on a background worker ahead of use.
+
+    A single worker draws the games in order from its rng and keeps up to
+    queue_size of them ready, so the games are the same however the worker
+    is scheduled.
+
+    Args:
+      board_size, num_rigid, num_wood, num_items, num_agents: The
+        settings of make_game.
+      rng: The random.Random the games are drawn from. It belongs to the
+        worker from now on, or is copied to the worker process.
+      queue_size: The number of games kept ready.
+      use_process: Whether the worker is a process rather than a thread.
+        A process does not compete with the game for the GIL.
+    """
+
+    def __init__(self, board_size, num_rigid, num_wood, num_items,
+                 num_agents, rng, queue_size=4, use_process=False):
+        if use_process:
+            self._games = multiprocessing.Queue(queue_size)
+            self._stop = multiprocessing.Event()
+            worker = multiprocessing.Process
+        else:
+            self._games = queue.Queue(queue_size)
+            self._stop = threading.Event()
+            worker = threading.Thread
+        settings = (board_size, num_rigid, num_wood, num_items, num_agents,
+                    rng)
+        self._worker = worker(
+            target=_prefetch,
+            args=(settings, self._games, self._stop),
+            daemon=True)
+        self._worker.start()
+
+    def get(self):
+        '''Returns the next (board, items, agent_positions) of make_game'''
+        return self._games.get()
+
+    def close(self):
+        '''Stops the worker and drops the games it made'''
+        self._stop.set()
+        # Keep the queue drained so that the worker is not stuck putting.
+        while self._worker.is_alive():
+            try:
+                self._games.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._worker.join()
+
+
+def _prefetch(settings, games, stop):
+    '''Puts games from make_game on the games queue until stop is set'''
+    while not stop.is_set():
+        game = make_game(*settings)
+        while not stop.is_set():
+            try:
+                games.put(game, timeout=0.1)
+                break
+            except queue.Full:
+                pass
@@ -6,8 +6,71 @@ from . import constants
 from . import utility
 
 
+def _to_position(value):
+    '''Converts a (row, col) array entry to a tuple of ints'''
+    return (int(value[0]), int(value[1]))
+
+
+def _to_direction(value):
+    '''Converts a stored moving direction to an Action or None'''
+    return constants.Action(value) if value else None
+
+
+def _from_direction(direction):
+    '''Converts an Action or None to a stored moving direction'''
+    return 0 if direction is None else constants.Action(direction).value
+
+
+class _StateField(object):
+    """An attribute that is stored in a GameState array when bound.
+
+    Unbound objects keep the value in their own __dict__. Bound objects read
+    and write entry `_state_index` of the array `array_name` of `_state`.
+    """
+
+    def __init__(self, array_name, to_python, from_python=None):
+        self._array_name = array_name
+        self._to_python = to_python
+        self._from_python = from_python
+        self._name = None
+
+    def __set_name__(self, owner, name):
+        self._name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if obj._state is None:
+            try:
+                return obj.__dict__[self._name]
+            except KeyError:
+                raise AttributeError(self._name)
+        array = getattr(obj._state, self._array_name)
+        return self._to_python(array[obj._state_index])
+
+    def __set__(self, obj, value):
+        if obj._state is None:
+            obj.__dict__[self._name] = value
+            return
+        if self._from_python is not None:
+            value = self._from_python(value)
+        getattr(obj._state, self._array_name)[obj._state_index] = value
+
+
 class Bomber(object):
-    """Container to keep the agent state."""
+    """Container to keep the agent state.
+
+    Once bound to a game_state.GameState, the bomber is a view of its row in
+    the agent arrays of that state.
+    """
+    _state = None
+    _state_index = None
+
+    position = _StateField('agent_position', _to_position)
+    is_alive = _StateField('agent_alive', bool)
+    ammo = _StateField('agent_ammo', int)
+    blast_strength = _StateField('agent_blast_strength', int)
+    can_kick = _StateField('agent_can_kick', bool)
 
     def __init__(self, agent_id=None, game_type=None):
         self._game_type = game_type
@@ -44,6 +107,25 @@ class Bomber(object):
             ]
             self.enemies.append(constants.Item.AgentDummy)
 
+    def bind(self, state, game=0):
+        """Moves this bomber's attributes into row agent_id of a GameState.
+
+        Args:
+          state: The game_state.GameState to bind to, or None to unbind and
+            keep a copy of the current values.
+          game: The game of the state this bomber plays in.
+        """
+        values = {
+            name: getattr(self, name)
+            for name in ['position', 'is_alive', 'ammo', 'blast_strength',
+                         'can_kick']
+            if hasattr(self, name)
+        }
+        self._state = state
+        self._state_index = None if state is None else (game, self.agent_id)
+        for name, value in values.items():
+            setattr(self, name, value)
+
     def maybe_lay_bomb(self):
         if self.ammo > 0:
             self.ammo -= 1
@@ -102,7 +184,19 @@ class Bomber(object):
 
 
 class Bomb(object):
-    """Container for the Bomb object."""
+    """Container for the Bomb object.
+
+    Bombs made with Bomb.view are views of an entry in the bomb arrays of a
+    game_state.GameState.
+    """
+    _state = None
+    _state_index = None
+
+    position = _StateField('bomb_position', _to_position)
+    life = _StateField('bomb_life', int)
+    blast_strength = _StateField('bomb_blast_strength', int)
+    moving_direction = _StateField('bomb_moving_direction', _to_direction,
+                                   _from_direction)
 
     def __init__(self,
                  bomber,
@@ -116,6 +210,21 @@ class Bomb(object):
         self.blast_strength = blast_strength
         self.moving_direction = moving_direction
 
+    @classmethod
+    def view(cls, bomber, state, index):
+        """Makes a bomb that reads and writes entry `index` of a GameState.
+
+        Args:
+          bomber: The agent that laid the bomb.
+          state: The game_state.GameState holding the bomb.
+          index: The (game, bomb) index of the bomb in the state.
+        """
+        bomb = cls.__new__(cls)
+        bomb.bomber = bomber
+        bomb._state = state
+        bomb._state_index = index
+        return bomb
+
     def tick(self):
         self.life -= 1
 
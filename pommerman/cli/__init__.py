@@ -1,2 +1,3 @@
 '''CLI module entry point'''
+from . import make_board_library
 from . import run_battle
@@ -0,0 +1,58 @@
+"""Generate board libraries for Pomme.reset to draw from.
+
+This writes one <config>.npy file per config, each holding num_boards
+games made with the board settings of the config. Pass a file to the env
+with `--board_library` or `pommerman.make(..., library=path)`.
+
+An example making 100000 boards for each config:
+pom_board_library --num_boards=100000 --out_dir=./board_libraries
+"""
+import argparse
+import os
+
+from .. import REGISTRY
+from .. import board_library
+from .. import utility
+
+
+def main():
+    '''CLI entry point to generate board libraries'''
+    parser = argparse.ArgumentParser(description='Board library generator.')
+    parser.add_argument(
+        '--configs',
+        default=None,
+        help='Comma delineated list of the configs to generate for. '
+        'Defaults to all of them.')
+    parser.add_argument(
+        '--num_boards',
+        default=10000,
+        type=int,
+        help='The number of boards per config.')
+    parser.add_argument(
+        '--seed',
+        default=None,
+        type=int,
+        help='The root seed. Each config gets its own child seed.')
+    parser.add_argument(
+        '--out_dir',
+        default='.',
+        help='The directory to write the <config>.npy files to.')
+    args = parser.parse_args()
+
+    config_ids = args.configs.split(',') if args.configs else REGISTRY
+    if not os.path.isdir(args.out_dir):
+        os.makedirs(args.out_dir)
+
+    seeds = utility.spawn_seeds(args.seed, len(config_ids))
+    for config_id, seed in zip(config_ids, seeds):
+        assert config_id in REGISTRY, "Unknown configuration '{}'. " \
+            "Possible values: {}".format(config_id, REGISTRY)
+        library = board_library.generate_for_config(config_id,
+                                                    args.num_boards, seed)
+        path = os.path.join(args.out_dir, config_id + '.npy')
+        board_library.save(path, library)
+        print('Wrote {} boards to {}'.format(len(library), path))
+
+
+if __name__ == "__main__":
+    main()
@@ -24,7 +24,7 @@ import numpy as np
 
 from .. import helpers
 from .. import make
-from pommerman import utility
+from .. import recorder
 
 
 def run(args, num_times=1, seed=None):
@@ -35,6 +35,7 @@ def run(args, num_times=1, seed=None):
     agent_env_vars = args.agent_env_vars
     game_state_file = args.game_state_file
     render_mode = args.render_mode
+    board_library = args.board_library
     do_sleep = args.do_sleep
 
     agents = [
@@ -42,7 +43,10 @@ def run(args, num_times=1, seed=None):
         for agent_id, agent_string in enumerate(args.agents.split(','))
     ]
 
-    env = make(config, agents, game_state_file, render_mode=render_mode)
+    env = make(config, agents, game_state_file, render_mode=render_mode,
+               library=board_library)
+    if args.concurrent_act:
+        env.set_concurrent_act(len(agents), args.act_deadline)
 
     def _run(record_pngs_dir=None, record_json_dir=None):
         '''Runs a game'''
@@ -54,16 +58,18 @@ def run(args, num_times=1, seed=None):
 
         obs = env.reset()
         done = False
+        game_recorder = None
+        if record_json_dir:
+            recording = os.path.join(record_json_dir, 'game.jsonl')
+            game_recorder = recorder.GameRecorder(env, recording)
 
         while not done:
             if args.render:
                 env.render(
                     record_pngs_dir=record_pngs_dir,
-                    record_json_dir=record_json_dir,
                     do_sleep=do_sleep)
-            if args.render is False and record_json_dir:
-                env.save_json(record_json_dir)
-                time.sleep(1.0 / env._render_fps)
+            if game_recorder:
+                game_recorder.record()
             actions = env.act(obs)
             obs, reward, done, info = env.step(actions)
 
@@ -71,29 +77,26 @@ def run(args, num_times=1, seed=None):
         if args.render:
             env.render(
                 record_pngs_dir=record_pngs_dir,
-                record_json_dir=record_json_dir,
                 do_sleep=do_sleep)
             if do_sleep:
                 time.sleep(5)
             env.render(close=True)
-            
-        if args.render is False and record_json_dir:
-            env.save_json(record_json_dir)
-            time.sleep(1.0 / env._render_fps)
 
-        if record_json_dir:
+        if game_recorder:
+            game_recorder.record()
+            game_recorder.close()
             finished_at = datetime.now().isoformat()
             _agents = args.agents.split(',')
-            utility.join_json_state(record_json_dir, _agents, finished_at,
-                                    config, info)
+            recorder.export_json(
+                recording, os.path.join(record_json_dir, 'game_state.json'),
+                _agents, finished_at, config, info)
 
         return info
 
     if seed is None:
         # Pick a random seed between 0 and 2^31 - 1
         seed = random.randint(0, np.iinfo(np.int32).max)
-    np.random.seed(seed)
-    random.seed(seed)
+    # The env seeds its board generator and its agents from this.
     env.seed(seed)
 
     infos = []
@@ -163,7 +166,23 @@ def main():
     parser.add_argument(
         '--game_state_file',
         default=None,
-        help="File from which to load game state.")
+        help="File from which to load game state, a state_file or JSON.")
+    parser.add_argument(
+        '--board_library',
+        default=None,
+        help="Board library .npy file from which to draw the boards. "
+        "See pom_board_library.")
+    parser.add_argument(
+        '--concurrent_act',
+        default=False,
+        action='store_true',
+        help="Whether to ask all the agents for their actions at once.")
+    parser.add_argument(
+        '--act_deadline',
+        default=None,
+        type=float,
+        help="With --concurrent_act, the seconds to wait for the agents "
+        "each step. The agents that are late Stop. Waits for all if None.")
     parser.add_argument(
         '--do_sleep',
         default=True,
@@ -15,6 +15,7 @@ import os
 
 import argparse
 import docker
+import numpy as np
 from tensorforce.execution import Runner
 from tensorforce.contrib.openai_gym import OpenAIGym
 import gym
@@ -24,6 +25,8 @@ from pommerman.agents import TensorForceAgent
 
 
 CLIENT = docker.from_env()
+# The number of feature buffers WrappedEnv hands out in turn.
+NUM_STATE_BUFFERS = 4
 
 
 def clean_up_agents(agents):
@@ -38,6 +41,13 @@ class WrappedEnv(OpenAIGym):
     def __init__(self, gym, visualize=False):
         self.gym = gym
         self.visualize = visualize
+        # The features are written into these buffers in turn, so no buffer
+        # is allocated per step. The Runner feeds each state to the agent,
+        # which copies it into its graph, before the next step, and a state
+        # stays intact for NUM_STATE_BUFFERS - 1 steps after it. Copy a state
+        # to keep it longer.
+        self._agent_states = None
+        self._next_state = 0
 
     def execute(self, action):
         if self.visualize:
@@ -49,15 +59,21 @@ class WrappedEnv(OpenAIGym):
         all_actions = self.gym.act(obs)
         all_actions.insert(self.gym.training_agent, actions)
         state, reward, terminal, _ = self.gym.step(all_actions)
-        agent_state = self.gym.featurize(state[self.gym.training_agent])
+        self._next_state = (self._next_state + 1) % NUM_STATE_BUFFERS
+        agent_state = self.gym.featurize_into(
+            state[self.gym.training_agent],
+            self._agent_states[self._next_state])
         agent_reward = reward[self.gym.training_agent]
         return agent_state, terminal, agent_reward
 
     def reset(self):
         obs = self.gym.reset()
-        agent_obs = self.gym.featurize(obs[3])
-        return agent_obs
-
+        agent_state = self.gym.featurize(obs[3])
+        self._agent_states = [agent_state] + [
+            np.empty_like(agent_state) for _ in range(NUM_STATE_BUFFERS - 1)
+        ]
+        self._next_state = 0
+        return agent_state
 
 def main():
     '''CLI interface to bootstrap taining'''
@@ -102,6 +118,11 @@ def main():
         default=None,
         help="File from which to load game state. Defaults to "
         "None.")
+    parser.add_argument(
+        "--board_library",
+        default=None,
+        help="Board library .npy file from which to draw the boards. "
+        "Defaults to None.")
     args = parser.parse_args()
 
     config = args.config
@@ -117,7 +138,8 @@ def main():
         for agent_id, agent_string in enumerate(args.agents.split(","))
     ]
 
-    env = make(config, agents, game_state_file)
+    env = make(config, agents, game_state_file,
+               library=args.board_library)
     training_agent = None
 
     for agent in agents:
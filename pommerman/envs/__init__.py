@@ -2,3 +2,13 @@
 from . import v0
 from . import v1
 from . import v2
+
+
+def __getattr__(name):
+    # VecPomme is imported on first use, as its shared memory needs Python
+    # 3.8 while the envs do not.
+    if name == 'VecPomme':
+        from .vec_env import VecPomme
+        return VecPomme
+    raise AttributeError(
+        "module '{}' has no attribute '{}'".format(__name__, name))
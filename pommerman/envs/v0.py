@@ -3,8 +3,11 @@
 This evironment acts as game manager for Pommerman. Further environments,
 such as in v1.py, will inherit from this.
 """
+import concurrent.futures
+import copy
 import json
 import os
+import random
 
 import numpy as np
 import time
@@ -12,11 +15,17 @@ from gym import spaces
 from gym.utils import seeding
 import gym
 
+from .. import board_library
 from .. import characters
 from .. import constants
 from .. import forward_model
+from .. import game_state
 from .. import graphics
+from .. import observation
+from .. import state_file
+from .. import transition_cache
 from .. import utility
+from .. import zobrist
 
 
 class Pomme(gym.Env):
@@ -36,6 +45,9 @@ class Pomme(gym.Env):
                  max_steps=1000,
                  is_partially_observable=False,
                  env=None,
+                 obs_dtype='float64',
+                 board_library=None,
+                 prefetch=0,
                  **kwargs):
         self._render_fps = render_fps
         self._intended_actions = []
@@ -50,6 +62,19 @@ class Pomme(gym.Env):
         self._viewer = None
         self._is_partially_observable = is_partially_observable
         self._env = env
+        self.set_obs_dtype(obs_dtype)
+        # The boards and items are drawn from this. Seed it with seed().
+        self._rng = random.Random()
+        self.set_board_library(board_library)
+        self._prefetcher = None
+        self.set_prefetch(prefetch)
+        # The zobrist.StateHash of the game. It is made by the first call to
+        # state_hash and then kept up to date by step.
+        self._state_hash = None
+        self._transition_cache = None
+        self._act_pool = None
+        self._act_deadline = None
+        self._running_acts = {}
 
         self.training_agent = None
         self.model = forward_model.ForwardModel()
@@ -72,6 +97,87 @@ class Pomme(gym.Env):
     def set_render_mode(self, mode):
         self._mode = mode
 
+    def set_obs_dtype(self, obs_dtype):
+        """Sets the dtype of the bomb and flame maps in the observations.
+
+        Args:
+          obs_dtype: 'float64' for the float maps, or 'compact' for uint8 maps
+            holding the same values. The board is uint8 either way.
+        """
+        assert obs_dtype in game_state.OBS_DTYPES, \
+            "Unknown obs_dtype '{}'. Possible values: {}".format(
+                obs_dtype, list(game_state.OBS_DTYPES))
+        self._obs_dtype = obs_dtype
+
+    def set_board_library(self, library):
+        """Makes reset draw its games from a board library.
+
+        Args:
+          library: The path of a board_library .npy file, which is
+            memory-mapped, or a library array. None makes reset generate
+            fresh boards again.
+        """
+        if isinstance(library, str):
+            library = board_library.load(library, self._board_size)
+        elif library is not None:
+            board_library.check(library, self._board_size)
+        self._board_library = library
+
+    def set_prefetch(self, queue_size, use_process=False):
+        """Makes reset pop games that a background worker made in advance.
+
+        The worker draws from a child of the env's seeded rng, so the games
+        are reproducible from the env's seed. It is started on the next
+        reset, and restarted by seed and set_agents.
+
+        Args:
+          queue_size: The number of games to keep ready. 0 turns
+            prefetching off.
+          use_process: Whether the worker is a process rather than a
+            thread.
+        """
+        self._stop_prefetcher()
+        self._prefetch = queue_size
+        self._prefetch_in_process = use_process
+
+    def set_transition_cache(self, cache):
+        """Makes step look its transitions up in a cache first.
+
+        Args:
+          cache: A transition_cache.TransitionCache, which may be shared
+            with other envs of the same config, or None to step uncached.
+        """
+        self._transition_cache = cache
+
+    def set_concurrent_act(self, num_threads, deadline=None):
+        """Makes act ask all the agents for their actions at once.
+
+        Remote agents, e.g. DockerAgent and HttpAgent, then wait on their
+        requests together, so a step takes as long as the slowest agent
+        rather than all of them in turn.
+
+        Args:
+          num_threads: The number of threads asking the agents. 0 asks them
+            one after another again.
+          deadline: The seconds act waits for the agents, or None to wait
+            for all of them. The agents that are late Stop, and are not
+            asked again until they answer.
+        """
+        if self._act_pool is not None:
+            self._act_pool.shutdown(wait=False)
+            self._act_pool = None
+        if num_threads:
+            self._act_pool = concurrent.futures.ThreadPoolExecutor(
+                num_threads)
+        self._act_deadline = deadline
+        self._running_acts = {}
+
+    def _stop_prefetcher(self):
+        '''Stops the prefetch worker, if one is running'''
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
     def _set_observation_space(self):
         """The Observation Space for each agent.
 
@@ -97,7 +203,54 @@ class Pomme(gym.Env):
             np.array(min_obs), np.array(max_obs))
 
     def set_agents(self, agents):
+        self._stop_prefetcher()
         self._agents = agents
+        self._make_state()
+
+    def _make_state(self):
+        """Makes the GameState holding this env's game.
+
+        The agents' characters are bound to it, so that the engine can step
+        the state's arrays while the agents keep working as before.
+        """
+        self._state = game_state.GameState(self._board_size, len(self._agents))
+        self._state_hash = None
+        for agent in self._agents:
+            agent.bind(self._state)
+
+    # The board, bombs, items and flames live in self._state. These
+    # properties keep the attributes that the rest of the code base uses.
+    @property
+    def _board(self):
+        return self._state.board[0]
+
+    @_board.setter
+    def _board(self, board):
+        self._state.board[0] = board
+
+    @property
+    def _bombs(self):
+        return self._state.get_bombs(0, self._agents)
+
+    @_bombs.setter
+    def _bombs(self, bombs):
+        self._state.set_bombs(0, bombs)
+
+    @property
+    def _items(self):
+        return self._state.get_items(0)
+
+    @_items.setter
+    def _items(self, items):
+        self._state.set_items(0, items)
+
+    @property
+    def _flames(self):
+        return self._state.get_flames(0)
+
+    @_flames.setter
+    def _flames(self, flames):
+        self._state.set_flames(0, flames)
 
     def set_training_agent(self, agent_id):
         self.training_agent = agent_id
@@ -105,6 +258,9 @@ class Pomme(gym.Env):
     def set_init_game_state(self, game_state_file):
         """Set the initial game state.
 
+        The file is either a state_file of one or more game states, in which
+        case each reset loads one of them at random, or a JSON file.
+
         The expected game_state_file JSON format is:
           - agents: list of agents serialized (agent_id, is_alive, position,
             ammo, blast_strength, can_kick)
@@ -117,28 +273,41 @@ class Pomme(gym.Env):
           - step_count: step count
 
         Args:
-          game_state_file: JSON File input.
+          game_state_file: State or JSON File input.
         """
         self._init_game_state = None
         if game_state_file:
-            with open(game_state_file, 'r') as f:
-                self._init_game_state = json.loads(f.read())
+            if state_file.is_state_file(game_state_file):
+                self._init_game_state = state_file.load(game_state_file)
+            else:
+                with open(game_state_file, 'r') as f:
+                    self._init_game_state = json.loads(f.read())
 
     def make_board(self):
         self._board = utility.make_board(self._board_size, self._num_rigid,
-                                         self._num_wood, len(self._agents))
+                                         self._num_wood, len(self._agents),
+                                         rng=self._rng)
 
     def make_items(self):
-        self._items = utility.make_items(self._board, self._num_items)
+        self._items = utility.make_items(self._board, self._num_items,
+                                         rng=self._rng)
 
     def act(self, obs):
         agents = [agent for agent in self._agents \
                   if agent.agent_id != self.training_agent]
-        return self.model.act(agents, obs, self.action_space)
+        return self.model.act(
+            agents,
+            obs,
+            self.action_space,
+            pool=self._act_pool,
+            deadline=self._act_deadline,
+            running=self._running_acts)
 
     def get_observations(self):
-        self.observations = self.model.get_observations(
-            self._board, self._agents, self._bombs, self._flames,
+        self.observations = self.model.make_observations(
+            self._board, self._agents,
+            self._state.get_observation_maps(
+                0, game_state.OBS_DTYPES[self._obs_dtype]),
             self._is_partially_observable, self._agent_view_size,
             self._game_type, self._env)
         for obs in self.observations:
@@ -160,47 +329,98 @@ class Pomme(gym.Env):
     def reset(self):
         assert (self._agents is not None)
 
-        if self._init_game_state is not None:
+        self._state_hash = None
+        if isinstance(self._init_game_state, list):
+            self._load_init_state()
+        elif self._init_game_state is not None:
             self.set_json_info()
         else:
             self._step_count = 0
-            self.make_board()
-            self.make_items()
+            start_positions = None
+            if self._board_library is not None:
+                self._draw_from_library()
+            elif self._prefetch:
+                start_positions = self._draw_prefetched()
+            else:
+                self.make_board()
+                self.make_items()
             self._bombs = []
             self._flames = []
             self._powerups = []
             for agent_id, agent in enumerate(self._agents):
-                pos = np.where(self._board == utility.agent_value(agent_id))
-                row = pos[0][0]
-                col = pos[1][0]
+                if start_positions is None:
+                    pos = np.where(
+                        self._board == utility.agent_value(agent_id))
+                    row = pos[0][0]
+                    col = pos[1][0]
+                else:
+                    row, col = start_positions[agent_id]
                 agent.set_start_position((row, col))
                 agent.reset()
 
         return self.get_observations()
 
+    def _load_init_state(self):
+        '''Loads one of the game states of the state file, at random'''
+        snapshots = self._init_game_state
+        snapshot = snapshots[self._rng.randrange(len(snapshots))] \
+            if len(snapshots) > 1 else snapshots[0]
+        if snapshot.state.board_size != self._board_size:
+            self._board_size = snapshot.state.board_size
+            self._make_state()
+        self.set_state(snapshot)
+        for agent in self._agents:
+            agent.set_start_position(agent.position)
+            agent.reset(agent.ammo, agent.is_alive, agent.blast_strength,
+                        agent.can_kick)
+
+    def _draw_from_library(self):
+        '''Copies a random game of the board library into the state'''
+        game = self._board_library[self._rng.randrange(
+            len(self._board_library))]
+        self._state.board[0] = game[board_library.BOARD]
+        self._state.items[0] = game[board_library.ITEMS]
+
+    def _draw_prefetched(self):
+        '''Copies the next prefetched game into the state'''
+        if self._prefetcher is None:
+            self._prefetcher = board_library.Prefetcher(
+                self._board_size, self._num_rigid, self._num_wood,
+                self._num_items, len(self._agents),
+                random.Random(self._rng.getrandbits(64)), self._prefetch,
+                self._prefetch_in_process)
+        board, items, start_positions = self._prefetcher.get()
+        self._state.board[0] = board
+        self._state.items[0] = items
+        return start_positions
+
     def seed(self, seed=None):
+        """Seeds the boards of this env and its agents.
+
+        The board generator and each agent get their own child seed, so games
+        are reproducible from the seed alone, even with many envs running
+        side by side.
+
+        Returns:
+          The list with the root seed used.
+        """
         self.np_random, seed = seeding.np_random(seed)
+        agents = self._agents or []
+        board_seed, *agent_seeds = utility.spawn_seeds(seed, 1 + len(agents))
+        self._stop_prefetcher()
+        self._rng = random.Random(board_seed)
+        for agent, agent_seed in zip(agents, agent_seeds):
+            agent.seed(agent_seed)
         return [seed]
 
     def step(self, actions):
         self._intended_actions = actions
 
-        max_blast_strength = self._agent_view_size or 10
-        result = self.model.step(
-            actions,
-            self._board,
-            self._agents,
-            self._bombs,
-            self._items,
-            self._flames,
-            max_blast_strength=max_blast_strength)
-        self._board, self._agents, self._bombs, self._items, self._flames = \
-                                                                    result[:5]
-
-        done = self._get_done()
+        if self._transition_cache is None:
+            reward, done, info = self._step_game(actions)
+        else:
+            reward, done, info = self._step_game_cached(actions)
         obs = self.get_observations()
-        reward = self._get_rewards()
-        info = self._get_info(done, reward)
 
         if done:
             # Callback to let the agents know that the game has ended.
@@ -210,6 +430,87 @@ class Pomme(gym.Env):
         self._step_count += 1
         return obs, reward, done, info
 
+    def _step_game(self, actions):
+        '''Steps the game and returns its reward, done and info'''
+        max_blast_strength = self._agent_view_size or 10
+        self.model.step_state(
+            actions, self._state, max_blast_strength=max_blast_strength)
+        if self._state_hash is not None:
+            self._state_hash.update(self._state)
+
+        done = self._get_done()
+        reward = self._get_rewards()
+        return reward, done, self._get_info(done, reward)
+
+    def _step_game_cached(self, actions):
+        '''Like _step_game, but going through the transition cache'''
+        cache = self._transition_cache
+        # v2 passes on the whole action list of a dead agent.
+        actions = tuple(
+            tuple(action) if isinstance(action, list) else action
+            for action in actions)
+        key = (self.state_hash(), self._step_count, self.training_agent,
+               actions)
+        before = transition_cache.game_bytes(self._state)
+        value = cache.get(key, before)
+        if value is None:
+            reward, done, info = self._step_game(actions)
+            after = self._state.snapshot()
+            num_bytes = sum(
+                getattr(after, name).nbytes for name in game_state.ALL_ARRAYS)
+            cache.put(key, before,
+                      (after, self._state_hash.copy(), reward, done, info),
+                      num_bytes)
+        else:
+            after, state_hash, reward, done, info = value
+            self._state.restore(after)
+            self._state_hash = state_hash.copy()
+        # The caller owns what is returned, the cache keeps its own.
+        return list(reward), done, copy.deepcopy(info)
+
+    def get_state(self):
+        """Returns a game_state.Snapshot of the current game.
+
+        This is a handful of array copies, so search agents can afford to
+        branch often. The agents' own memory is not included.
+        """
+        state_hash = self._state_hash
+        return game_state.Snapshot(
+            self._state.snapshot(), self._step_count, self._get_state_info(),
+            None if state_hash is None else state_hash.copy())
+
+    def set_state(self, snapshot):
+        """Restores a snapshot made by get_state on an env of the same config.
+
+        Call get_observations afterwards if the observations are needed.
+        """
+        self._state.restore(snapshot.state)
+        self._step_count = snapshot.step_count
+        self._state_hash = snapshot.get_state_hash()
+        self._set_state_info(snapshot.info)
+
+    def state_hash(self):
+        """Returns the 64-bit zobrist hash of the current game.
+
+        The hash covers the board, the items under the wood, the bombs, the
+        flames, the agents and the parity of the step count, see
+        zobrist.hash_state. The first call computes it from scratch. From
+        then on step updates it incrementally, so calling this every step
+        is cheap.
+        """
+        if self._state_hash is None:
+            self._state_hash = zobrist.StateHash(self._state, 0,
+                                                 self._step_count)
+        return self._state_hash.value
+
+    def _get_state_info(self):
+        '''Returns the env specific part of a snapshot'''
+        return {'intended_actions': self._intended_actions}
+
+    def _set_state_info(self, info):
+        '''Restores the env specific part of a snapshot'''
+        self._intended_actions = info['intended_actions']
+
     def render(self,
                mode=None,
                close=False,
@@ -272,6 +573,8 @@ class Pomme(gym.Env):
             time.sleep(1.0 / self._render_fps)
 
     def close(self):
+        self._stop_prefetcher()
+        self.set_concurrent_act(0)
         if self._viewer is not None:
             self._viewer.close()
             self._viewer = None
@@ -279,22 +582,63 @@ class Pomme(gym.Env):
         for agent in self._agents:
             agent.shutdown()
 
+    @classmethod
+    def featurize(cls, obs):
+        out = np.empty(cls.featurize_size(obs), dtype=np.float32)
+        return cls.featurize_into(obs, out)
+
     @staticmethod
-    def featurize(obs):
-        board = obs["board"].reshape(-1).astype(np.float32)
-        bomb_blast_strength = obs["bomb_blast_strength"].reshape(-1) \
-                                                        .astype(np.float32)
-        bomb_life = obs["bomb_life"].reshape(-1).astype(np.float32)
-        position = utility.make_np_float(obs["position"])
-        ammo = utility.make_np_float([obs["ammo"]])
-        blast_strength = utility.make_np_float([obs["blast_strength"]])
-        can_kick = utility.make_np_float([obs["can_kick"]])
-
-        teammate = utility.make_np_float([obs["teammate"].value])
-        enemies = utility.make_np_float([e.value for e in obs["enemies"]])
-        return np.concatenate(
-            (board, bomb_blast_strength, bomb_life, position, ammo,
-             blast_strength, can_kick, teammate, enemies))
+    def featurize_size(obs):
+        '''Returns the length of the featurized obs'''
+        return 3 * obs["board"].size + 6 + len(obs["enemies"])
+
+    @staticmethod
+    def featurize_into(obs, out):
+        """Writes the features of obs into a preallocated buffer.
+
+        The maps are cast straight into their slices of out, so no temporary
+        arrays are made. Maps that obs has not computed yet are read from the
+        shared maps they would copy, see observation.peek.
+
+        Args:
+          obs: An agent's observation.
+          out: A float32 array of length featurize_size(obs), e.g. a row of a
+            rollout tensor.
+
+        Returns:
+          out.
+        """
+        board = obs["board"]
+        size = board.size
+        out[:size] = board.reshape(-1)
+        out[size:2 * size] = observation.peek(
+            obs, "bomb_blast_strength").reshape(-1)
+        out[2 * size:3 * size] = observation.peek(
+            obs, "bomb_life").reshape(-1)
+        offset = 3 * size
+        out[offset:offset + 2] = obs["position"]
+        out[offset + 2] = obs["ammo"]
+        out[offset + 3] = obs["blast_strength"]
+        out[offset + 4] = obs["can_kick"]
+        out[offset + 5] = obs["teammate"].value
+        for num, enemy in enumerate(obs["enemies"]):
+            out[offset + 6 + num] = enemy.value
+        return out
+
+    @classmethod
+    def featurize_batch(cls, obs_list, out):
+        """Writes the features of each obs into the matching row of out.
+
+        Args:
+          obs_list: A list of observations of the same size.
+          out: A float32 array of shape (len(obs_list), featurize_size(obs)).
+
+        Returns:
+          out.
+        """
+        for obs, row in zip(obs_list, out):
+            cls.featurize_into(obs, row)
+        return out
 
     def save_json(self, record_json_dir):
         info = self.get_json_info()
@@ -304,39 +648,78 @@ class Pomme(gym.Env):
         with open(path, 'w') as f:
             f.write(json.dumps(info, sort_keys=True, indent=4))
 
-    def get_json_info(self):
-        """Returns a json snapshot of the current game state."""
-        ret = {
-            'board_size': self._board_size,
-            'step_count': self._step_count,
-            'board': self._board,
-            'agents': self._agents,
-            'bombs': self._bombs,
-            'flames': self._flames,
-            'items': [[k, i] for k, i in self._items.items()],
-            'intended_actions': self._intended_actions
-        }
+    def get_json_info(self, snapshot=None):
+        """Returns a json snapshot of the current game state.
+
+        Args:
+          snapshot: A game_state.Snapshot of this env to describe instead of
+            the current game.
+        """
+        ret = self._json_info(snapshot or self.get_state())
         for key, value in ret.items():
             ret[key] = json.dumps(value, cls=utility.PommermanJSONEncoder)
         return ret
 
+    def _json_info(self, snapshot):
+        """Returns the fields of get_json_info before they are encoded.
+
+        Only the snapshot and the settings of the env are read, so this can
+        run on another thread while the game goes on.
+        """
+        state = snapshot.state
+        num_bombs = state.num_bombs[0]
+        agents = [{
+            'agent_id': agent_id,
+            'is_alive': is_alive,
+            'position': position,
+            'ammo': ammo,
+            'blast_strength': blast_strength,
+            'can_kick': can_kick
+        } for agent_id, (position, is_alive, ammo, blast_strength, can_kick)
+                  in enumerate(
+                      zip(state.agent_position[0].tolist(),
+                          state.agent_alive[0].tolist(),
+                          state.agent_ammo[0].tolist(),
+                          state.agent_blast_strength[0].tolist(),
+                          state.agent_can_kick[0].tolist()))]
+        bombs = [{
+            'position': position,
+            'bomber_id': bomber_id,
+            'life': life,
+            'blast_strength': blast_strength,
+            'moving_direction': moving_direction or None
+        } for position, bomber_id, life, blast_strength, moving_direction in
+                 zip(state.bomb_position[0, :num_bombs].tolist(),
+                     state.bomb_bomber[0, :num_bombs].tolist(),
+                     state.bomb_life[0, :num_bombs].tolist(),
+                     state.bomb_blast_strength[0, :num_bombs].tolist(),
+                     state.bomb_moving_direction[0, :num_bombs].tolist())]
+        return {
+            'board_size': state.board_size,
+            'step_count': snapshot.step_count,
+            'board': state.board[0],
+            'agents': agents,
+            'bombs': bombs,
+            'flames': state.get_flames(0),
+            'items': [[k, i] for k, i in state.get_items(0).items()],
+            'intended_actions': snapshot.info['intended_actions']
+        }
+
     def set_json_info(self):
         """Sets the game state as the init_game_state."""
         board_size = int(self._init_game_state['board_size'])
-        self._board_size = board_size
+        if board_size != self._board_size:
+            self._board_size = board_size
+            self._make_state()
         self._step_count = int(self._init_game_state['step_count'])
 
-        board_array = json.loads(self._init_game_state['board'])
-        self._board = np.ones((board_size, board_size)).astype(np.uint8)
-        self._board *= constants.Item.Passage.value
-        for x in range(self._board_size):
-            for y in range(self._board_size):
-                self._board[x, y] = board_array[x][y]
+        self._board = np.array(
+            json.loads(self._init_game_state['board']), dtype=np.uint8)
 
-        self._items = {}
+        # The items, bombs and flames are built first and then assigned, as
+        # they are copies of what is in self._state.
         item_array = json.loads(self._init_game_state['items'])
-        for i in item_array:
-            self._items[tuple(i[0])] = i[1]
+        self._items = {tuple(i[0]): i[1] for i in item_array}
 
         agent_array = json.loads(self._init_game_state['agents'])
         for a in agent_array:
@@ -347,7 +730,7 @@ class Pomme(gym.Env):
                 int(a['ammo']), bool(a['is_alive']), int(a['blast_strength']),
                 bool(a['can_kick']))
 
-        self._bombs = []
+        bombs = []
         bomb_array = json.loads(self._init_game_state['bombs'])
         for b in bomb_array:
             bomber = next(x for x in self._agents \
@@ -355,12 +738,13 @@ class Pomme(gym.Env):
             moving_direction = b['moving_direction']
             if moving_direction is not None:
                 moving_direction = constants.Action(moving_direction)
-            self._bombs.append(
+            bombs.append(
                 characters.Bomb(bomber, tuple(b['position']), int(b['life']),
                                 int(b['blast_strength']), moving_direction))
+        self._bombs = bombs
 
-        self._flames = []
         flame_array = json.loads(self._init_game_state['flames'])
-        for f in flame_array:
-            self._flames.append(
-                characters.Flame(tuple(f['position']), f['life']))
+        self._flames = [
+            characters.Flame(tuple(f['position']), f['life'])
+            for f in flame_array
+        ]
@@ -15,8 +15,11 @@ The collapsing works in the following manner:
    and turn it into rigid walls. This has the effect of destroying any items,
    bombs (which don't go off), and agents in those squares.
 """
+import json
+
+import numpy as np
+
 from .. import constants
-from .. import utility
 from . import v0
 
 
@@ -42,65 +45,64 @@ class Pomme(v0.Pomme):
         be turned into rigid walls. All agents in that ring die and all bombs
         are removed without detonating.
         
-        For further rings, the values get closer to the center.
+        For further rings, the values get closer to the center. The board is
+        collapsed in place.
 
         Args:
           ring: Integer value of which cells to collapse.
         """
-        board = self._board.copy()
-
-        def collapse(r, c):
-            '''Handles the collapsing of the board. Will
-            kill of remove any item/agent that is on the
-            collapsing tile.'''
-            if utility.position_is_agent(board, (r, c)):
-                # Agent. Kill it.
-                num_agent = board[r][c] - constants.Item.Agent0.value
-                agent = self._agents[num_agent]
+        state = self._state
+        board = state.board[0]
+        end = self._board_size - ring
+        cells = np.zeros(board.shape, dtype=bool)
+        cells[ring:end, ring:end] = True
+        cells[ring + 1:end - 1, ring + 1:end - 1] = False
+
+        # Agents. Kill them.
+        for agent in self._agents:
+            if agent.is_alive and cells[agent.position]:
                 agent.die()
-            if utility.position_is_bomb(self._bombs, (r, c)):
-                # Bomb. Remove the bomb. Update agent's ammo tally.
-                new_bombs = []
-                for b in self._bombs:
-                    if b.position == (r, c):
-                        b.bomber.incr_ammo()
-                    else:
-                        new_bombs.append(b)
-                self._bombs = new_bombs
-            if utility.position_is_flames(board, (r, c)):
-                self._flames = [f for f in self._flames if f.position != (r,c)]
-            if (r, c) in self._items:
-                # Item. Remove the item.
-                del self._items[(r, c)]
-            board[r][c] = constants.Item.Rigid.value
-
-        for cell in range(ring, self._board_size - ring):
-            collapse(ring, cell)
-            if ring != cell:
-                collapse(cell, ring)
-
-            end = self._board_size - ring - 1
-            collapse(end, cell)
-            if end != cell:
-                collapse(cell, end)
-
-        return board
-
-    def get_json_info(self):
-        ret = super().get_json_info()
-        ret['collapses'] = json.dumps(self.collapses, cls=json_encoder)
+
+        # Bombs. Remove the bombs. Update the agents' ammo tallies.
+        positions = state.bomb_position[0]
+        collapsed = state.bomb_mask()[0] & cells[positions[:, 0],
+                                                 positions[:, 1]]
+        for bomber_id in state.bomb_bomber[0][collapsed]:
+            self._agents[bomber_id].incr_ammo()
+        state.keep_bombs(~collapsed[None, :])
+
+        # Flames and items. Remove them.
+        state.flames[0][cells & (board == constants.Item.Flames.value)] = 0
+        state.items[0][cells] = 0
+
+        board[cells] = constants.Item.Rigid.value
+
+    def _json_info(self, snapshot):
+        ret = super()._json_info(snapshot)
+        ret['collapses'] = list(snapshot.info['collapses'])
         return ret
 
     def set_json_info(self):
         super().set_json_info()
         self.collapses = json.loads(self._init_game_state['collapses'])
 
+    def _get_state_info(self):
+        ret = super()._get_state_info()
+        ret['collapses'] = tuple(self.collapses)
+        return ret
+
+    def _set_state_info(self, info):
+        super()._set_state_info(info)
+        self.collapses = list(info['collapses'])
+
     def step(self, actions):
         obs, reward, done, info = super().step(actions)
 
         for ring, collapse in enumerate(self.collapses):
             if self._step_count == collapse:
-                self._board = self._collapse_board(ring)
+                self._collapse_board(ring)
+                # The collapse is not tracked by the hash, recompute it.
+                self._state_hash = None
                 break
 
         return obs, reward, done, info
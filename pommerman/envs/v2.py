@@ -5,11 +5,12 @@ radio_num_words (default = 2) from a vocabulary of size radio_vocab_size
 (default = 8) to its teammate each turn. These vectors are passed into the
 observation stream for each agent.
 """
+import json
+
 from gym import spaces
 import numpy as np
 
 from .. import constants
-from .. import utility
 from . import v0
 
 
@@ -79,6 +80,15 @@ class Pomme(v0.Pomme):
         self.observations = observations
         return observations
 
+    def _get_state_info(self):
+        ret = super()._get_state_info()
+        ret['radio_from_agent'] = dict(self._radio_from_agent)
+        return ret
+
+    def _set_state_info(self, info):
+        super()._set_state_info(info)
+        self._radio_from_agent = dict(info['radio_from_agent'])
+
     def step(self, actions):
         personal_actions = []
         radio_actions = []
@@ -98,28 +108,38 @@ class Pomme(v0.Pomme):
 
         return super().step(personal_actions)
 
-    @staticmethod
-    def featurize(obs):
-        ret = super().featurize(obs)
-        message = obs['message']
-        message = utility.make_np_float(message)
-        return np.concatenate((ret, message))
-
-    def get_json_info(self):
-        ret = super().get_json_info()
-        ret['radio_vocab_size'] = json.dumps(
-            self._radio_vocab_size, cls=json_encoder)
-        ret['radio_num_words'] = json.dumps(
-            self._radio_num_words, cls=json_encoder)
-        ret['_radio_from_agent'] = json.dumps(
-            self._radio_from_agent, cls=json_encoder)
+    @classmethod
+    def featurize_size(cls, obs):
+        return super().featurize_size(obs) + len(obs['message'])
+
+    @classmethod
+    def featurize_into(cls, obs, out):
+        '''Writes the v0 features of obs followed by the radio message'''
+        super().featurize_into(obs, out)
+        offset = super().featurize_size(obs)
+        for num, word in enumerate(obs['message']):
+            out[offset + num] = word
+        return out
+
+    def _json_info(self, snapshot):
+        ret = super()._json_info(snapshot)
+        ret['radio_vocab_size'] = self._radio_vocab_size
+        ret['radio_num_words'] = self._radio_num_words
+        # JSON keys must be strings, so the messages go by Item value.
+        ret['_radio_from_agent'] = {
+            agent.value: message
+            for agent, message in snapshot.info['radio_from_agent'].items()
+        }
         return ret
 
     def set_json_info(self):
         super().set_json_info()
-        self.radio_vocab_size = json.loads(
+        self._radio_vocab_size = json.loads(
             self._init_game_state['radio_vocab_size'])
-        self.radio_num_words = json.loads(
+        self._radio_num_words = json.loads(
             self._init_game_state['radio_num_words'])
-        self._radio_from_agent = json.loads(
-            self._init_game_state['_radio_from_agent'])
+        self._radio_from_agent = {
+            constants.Item(int(value)): tuple(message)
+            for value, message in json.loads(
+                self._init_game_state['_radio_from_agent']).items()
+        }
@@ -0,0 +1,337 @@
+'''Many Pomme envs stepped in parallel by worker processes.
+
+VecPomme splits its envs into contiguous shards, one per worker process.
+The actions, the featurized observations, the rewards and the dones are
+numpy arrays in multiprocessing.shared_memory blocks, so a step only sends
+each worker a short command and waits for its reply. Nothing per env is
+pickled.
+
+    env = VecPomme('PommeFFACompetition-v0',
+                   [None, agents.SimpleAgent, agents.SimpleAgent,
+                    agents.SimpleAgent], num_envs=64, seed=0)
+    obs = env.reset()
+    while training:
+        obs, rewards, dones, final_obs = env.step(policy(obs))
+    env.close()
+
+step is step_async followed by step_wait, and the caller can work between
+the two while the workers step. Stepping the two halves of the envs in turn
+keeps both the caller and the workers busy: the policy runs on the
+observations of one half while the other half steps.
+
+    obs = env.reset()
+    obs = [obs[env.halves[0]], obs[env.halves[1]]]
+    env.step_async(policy(obs[0]), half=0)
+    while training:
+        env.step_async(policy(obs[1]), half=1)
+        obs[0], rewards, dones, final_obs = env.step_wait(half=0)
+        env.step_async(policy(obs[0]), half=0)
+        obs[1], rewards, dones, final_obs = env.step_wait(half=1)
+'''
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import traceback
+
+import numpy as np
+
+from .. import agents
+from .. import make
+from .. import utility
+
+
+class _ExternalAgent(agents.BaseAgent):
+    '''An agent whose actions are set from outside before each act'''
+
+    def __init__(self):
+        super(_ExternalAgent, self).__init__()
+        self.action = 0
+
+    def act(self, obs, action_space):
+        return self.action
+
+
+class _SharedArray(object):
+    """A numpy array in a shared memory block.
+
+    The block is made by the parent and handed to the workers, which view the
+    same memory as an array of the same shape and dtype.
+    """
+
+    def __init__(self, shape, dtype):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.shm = shared_memory.SharedMemory(
+            create=True,
+            size=max(1, int(np.prod(shape)) * self.dtype.itemsize))
+
+    def array(self):
+        '''Returns an array viewing the block'''
+        return np.ndarray(self.shape, self.dtype, buffer=self.shm.buf)
+
+
+def _work(config_id, agent_factories, seeds, start, buffers, pipe):
+    """Runs the envs of one shard until told to close.
+
+    Args:
+      config_id: The config of the envs.
+      agent_factories: See VecPomme.
+      seeds: The seed of each env of the shard.
+      start: The index of the first env of the shard in the buffers.
+      buffers: The dict of _SharedArrays of VecPomme.
+      pipe: The end of the pipe to VecPomme. Each command gets a reply, None
+        or the traceback of the error.
+    """
+    arrays = {name: buf.array() for name, buf in buffers.items()}
+    end = start + len(seeds)
+    actions = arrays['actions'][start:end]
+    obs = arrays['obs'][start:end]
+    final_obs = arrays['final_obs'][start:end]
+    rewards = arrays['rewards'][start:end]
+    dones = arrays['dones'][start:end]
+
+    envs = []
+    external = []
+    for seed in seeds:
+        env_agents = [
+            _ExternalAgent() if factory is None else factory()
+            for factory in agent_factories
+        ]
+        env = make(config_id, env_agents)
+        env.seed(seed)
+        envs.append(env)
+        external.append([
+            agent for agent, factory in zip(env_agents, agent_factories)
+            if factory is None
+        ])
+    env_obs = [None] * len(envs)
+
+    def featurize(num, out):
+        '''Writes the features of the external agents of env num into out'''
+        for agent, row in zip(external[num], out):
+            envs[num].featurize_into(env_obs[num][agent.agent_id], row)
+
+    while True:
+        command = pipe.recv()
+        try:
+            if command == 'reset':
+                for num, env in enumerate(envs):
+                    env_obs[num] = env.reset()
+                    featurize(num, obs[num])
+            elif command == 'step':
+                for num, env in enumerate(envs):
+                    for agent, action in zip(external[num],
+                                             actions[num].tolist()):
+                        agent.action = action
+                    env_obs[num], reward, done = env.step(
+                        env.act(env_obs[num]))[:3]
+                    rewards[num] = reward
+                    dones[num] = done
+                    if done:
+                        featurize(num, final_obs[num])
+                        env_obs[num] = env.reset()
+                    featurize(num, obs[num])
+            elif command == 'close':
+                for env in envs:
+                    env.close()
+                pipe.send(None)
+                break
+            pipe.send(None)
+        except Exception:  # pylint: disable=broad-except
+            pipe.send(traceback.format_exc())
+
+
+class VecPomme(object):
+    """Steps num_envs Pomme envs of one config on worker processes.
+
+    The agents given as None are played by the caller, who passes their
+    actions to step and gets their featurized observations back. The other
+    agents act on their own in the workers. An env whose game is done is
+    reset straight away, and the last observations of its game are in
+    final_obs. Dead external agents stop until their game is done.
+
+    Args:
+      config_id: The config of the envs, e.g. 'PommeFFACompetition-v0'.
+      agent_factories: One entry per agent: a callable returning a new
+        agents.BaseAgent, e.g. the agent class, or None for an agent played
+        by the caller. The callables must be picklable where processes are
+        spawned rather than forked.
+      num_envs: The number of envs.
+      num_workers: The number of worker processes. Defaults to the number of
+        CPUs, at most num_envs.
+      seed: The root seed of the envs, see utility.spawn_seeds.
+
+    Attributes:
+      external_agents: The ids of the agents played by the caller.
+      halves: The slices of the envs of each half, for stepping them in turn.
+        Each worker steps envs of only one half.
+      observation_size: The length of a featurized observation.
+      action_size: The length of an action, 1 plus the radio words in v2.
+    """
+
+    def __init__(self, config_id, agent_factories, num_envs,
+                 num_workers=None, seed=None):
+        self.num_envs = num_envs
+        self.num_agents = len(agent_factories)
+        self.external_agents = [
+            agent_id for agent_id, factory in enumerate(agent_factories)
+            if factory is None
+        ]
+
+        # Make one env here for the sizes of the observations and actions.
+        env = make(config_id, [agents.BaseAgent() for _ in agent_factories])
+        self.observation_size = env.featurize_size(env.reset()[0])
+        self.action_size = 1 + (getattr(env, '_radio_num_words', 0) or 0)
+        env.close()
+
+        num_external = len(self.external_agents)
+        action_shape = (num_envs, num_external)
+        if self.action_size > 1:
+            action_shape += (self.action_size,)
+        obs_shape = (num_envs, num_external, self.observation_size)
+        self._buffers = {
+            'actions': _SharedArray(action_shape, np.int64),
+            'obs': _SharedArray(obs_shape, np.float32),
+            'final_obs': _SharedArray(obs_shape, np.float32),
+            'rewards': _SharedArray((num_envs, self.num_agents), np.float32),
+            'dones': _SharedArray((num_envs,), np.bool_),
+        }
+        self._arrays = {
+            name: buf.array() for name, buf in self._buffers.items()
+        }
+
+        num_workers = min(num_workers or os.cpu_count(), num_envs)
+        seeds = utility.spawn_seeds(seed, num_envs)
+        bounds = np.linspace(0, num_envs,
+                             num_workers + 1).astype(int).tolist()
+        half_worker = num_workers // 2
+        self.halves = [
+            slice(0, bounds[half_worker]),
+            slice(bounds[half_worker], num_envs)
+        ]
+        self._half_pipes = None
+        self._waiting = set()
+        self._pipes = []
+        self._workers = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            pipe, worker_pipe = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_work,
+                args=(config_id, agent_factories, seeds[start:end], start,
+                      self._buffers, worker_pipe),
+                daemon=True)
+            worker.start()
+            worker_pipe.close()
+            self._pipes.append(pipe)
+            self._workers.append(worker)
+        self._half_pipes = [
+            self._pipes[:half_worker], self._pipes[half_worker:]
+        ]
+
+    def _send(self, command, half, actions=None):
+        """Sends a command to the workers of a half, or of every env.
+
+        The actions, if given, are written to the envs of the half first.
+
+        Raises:
+          ValueError: If the workers of the half are busy, or the half has
+            no workers.
+        """
+        halves = [0, 1] if half is None else [half]
+        if self._waiting.intersection(halves):
+            raise ValueError('The envs are still stepping, call step_wait.')
+        pipes = self._pipes if half is None else self._half_pipes[half]
+        if not pipes:
+            raise ValueError('Stepping by halves needs two workers or more.')
+        if actions is not None:
+            self._arrays['actions'][self._rows(half)] = actions
+        for pipe in pipes:
+            pipe.send(command)
+        self._waiting.update(halves)
+
+    def _wait(self, half):
+        '''Waits for the workers of a half, or of every env, to reply'''
+        halves = [0, 1] if half is None else [half]
+        if not self._waiting.issuperset(halves):
+            raise ValueError('The envs are not stepping, call step_async.')
+        pipes = self._pipes if half is None else self._half_pipes[half]
+        errors = [pipe.recv() for pipe in pipes]
+        self._waiting.difference_update(halves)
+        for error in errors:
+            if error is not None:
+                raise RuntimeError('A VecPomme worker failed:\n' + error)
+
+    def _rows(self, half):
+        '''Returns the slice of the envs of a half, or of every env'''
+        return slice(None) if half is None else self.halves[half]
+
+    def reset(self):
+        """Resets every env.
+
+        Returns:
+          The float32 observations of the external agents, of shape
+          (num_envs, len(external_agents), observation_size).
+        """
+        self._send('reset', None)
+        self._wait(None)
+        return self._arrays['obs'].copy()
+
+    def step_async(self, actions, half=None):
+        """Starts stepping every env, or the envs of a half, and returns.
+
+        Args:
+          actions: The actions of the external agents of the envs to step, of
+            shape (num_envs, len(external_agents)), plus (action_size,) in v2.
+            For a half, the first axis is the number of envs of the half.
+          half: 0 or 1 to step only the envs of self.halves[half].
+        """
+        self._send('step', half, actions)
+
+    def step_wait(self, half=None):
+        """Waits for the step started by step_async with the same half.
+
+        The envs whose game is done are reset.
+
+        Returns:
+          obs: The observations after the step, as from reset. For the envs
+            that were reset, these are of the new game.
+          rewards: The float32 rewards of every agent, (num_envs, num_agents).
+          dones: Whether the game of each env is done, (num_envs,).
+          final_obs: Like obs, but the rows of the envs that are done have
+            the last observations of their game. The other rows are stale.
+          For a half, each has just the rows of the envs of the half.
+        """
+        self._wait(half)
+        rows = self._rows(half)
+        return tuple(self._arrays[name][rows].copy()
+                     for name in ['obs', 'rewards', 'dones', 'final_obs'])
+
+    def step(self, actions):
+        '''Steps every env, see step_async and step_wait'''
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        '''Closes the envs, stops the workers and frees the shared memory'''
+        if self._workers is None:
+            return
+        for half in list(self._waiting):
+            try:
+                self._wait(half)
+            except RuntimeError:
+                pass
+        self._send('close', None)
+        self._wait(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = None
+        self._arrays = None
+        for buf in self._buffers.values():
+            buf.shm.close()
+            buf.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,10 +1,15 @@
 '''Module to manage and advanced game state'''
 from collections import defaultdict
+import concurrent.futures
+import functools
+import os
 
 import numpy as np
 
 from . import constants
 from . import characters
+from . import game_state
+from . import observation
 from . import utility
 
 
@@ -12,77 +17,108 @@ class ForwardModel(object):
     """Class for helping with the [forward] modeling of the game state."""
 
     def run(self,
-            num_times,
-            board,
-            agents,
-            bombs,
-            items,
-            flames,
-            is_partially_observable,
-            agent_view_size,
-            action_space,
+            snapshot,
+            policies,
+            horizon,
+            game_type,
+            max_steps,
+            num_rollouts=1,
+            action_space=None,
+            is_partially_observable=False,
+            agent_view_size=None,
+            game_env=None,
+            max_blast_strength=10,
             training_agent=None,
-            is_communicative=False):
-        """Run the forward model.
+            obs_dtype='float64',
+            pool=None,
+            num_tasks=None,
+            seed=None):
+        """Runs rollouts of the forward model from a snapshot.
+
+        Each rollout restores the snapshot into a private GameState and steps
+        it with step_state for up to `horizon` steps, stopping early once the
+        game is done. The agents of the env are not touched and episode_end
+        is not called. Env features outside of the model, i.e. the v1
+        collapses and the v2 radio, are not played.
 
         Args:
-          num_times: The number of times to run it for. This is a maximum and
-            it will stop early if we reach a done.
-          board: The board state to run it from.
-          agents: The agents to use to run it.
-          bombs: The starting bombs.
-          items: The starting items.
-          flames: The starting flames.
-          is_partially_observable: Whether the board is partially observable or
-            not. Only applies to TeamRadio.
-          agent_view_size: If it's partially observable, then the size of the
-            square that the agent can view.
-          action_space: The actions that each agent can take.
+          snapshot: The game_state.Snapshot to start from, e.g. from
+            Pomme.get_state.
+          policies: One object per agent slot with an act(obs, action_space)
+            method, e.g. an agents.BaseAgent, or None to always Stop. Radio
+            actions are reduced to their movement action.
+          horizon: The maximum number of steps of a rollout.
+          game_type: The constants.GameType of the game.
+          max_steps: The step count at which the game ends.
+          num_rollouts: The number of independent rollouts to run.
+          action_space: The action space passed to the policies.
+          is_partially_observable: Whether the policies see fogged boards.
+          agent_view_size: The view size of the fog.
+          game_env: The game_env put in the observations.
+          max_blast_strength: The cap on blast strength from IncrRange.
           training_agent: The training agent to pass to done.
-          is_communicative: Whether the action depends on communication
-            observations as well.
+          obs_dtype: The dtype of the observation maps, see
+            Pomme.set_obs_dtype.
+          pool: An optional multiprocessing.Pool to split the rollouts over.
+            The policies and the snapshot are pickled to the workers, so a
+            policy's memory only carries over between the rollouts of a
+            task.
+          num_tasks: The number of tasks the rollouts are split into with a
+            pool. Defaults to four per process of the pool.
+          seed: The root seed of the rollouts, see utility.spawn_seeds. Each
+            rollout seeds the policies that have a seed method, e.g. the
+            agents.BaseAgents, with its own child seeds. So the rollouts
+            differ from each other, and are the same with or without a pool.
 
         Returns:
-          steps: The list of step results, which are each a dict of "obs",
-            "next_obs", "reward", "action".
-          board: Updated board.
-          agents: Updated agents, same models though.
-          bombs: Updated bombs.
-          items: Updated items.
-          flames: Updated flames.
-          done: Whether we completed the game in these steps.
-          info: The result of the game if it's completed.
+          A dict of arrays with a leading axis over the rollouts:
+            actions: (num_rollouts, horizon, num_agents) uint8 actions.
+            rewards: (num_rollouts, horizon, num_agents) int8 rewards.
+            done: (num_rollouts, horizon) bool, True from the step where the
+              game ended on.
+            length: (num_rollouts,) the number of steps played. The steps
+              after it hold Stop actions and the final rewards.
         """
-        steps = []
-        for _ in num_times:
-            obs = self.get_observations(
-                board, agents, bombs, is_partially_observable, agent_view_size)
-            actions = self.act(
-                agents, obs, action_space, is_communicative=is_communicative)
-            board, agents, bombs, items, flames = self.step(
-                actions, board, agents, bombs, items, flames)
-            next_obs = self.get_observations(
-                board, agents, bombs, is_partially_observable, agent_view_size)
-            reward = self.get_rewards(agents, game_type, step_count, max_steps)
-            done = self.get_done(agents, game_type, step_count, max_steps,
-                                 training_agent)
-            info = self.get_info(done, rewards, game_type, agents)
-
-            steps.append({
-                "obs": obs,
-                "next_obs": next_obs,
-                "reward": reward,
-                "actions": actions,
-            })
-            if done:
-                # Callback to let the agents know that the game has ended.
-                for agent in agents:
-                    agent.episode_end(reward[agent.agent_id])
-                break
-        return steps, board, agents, bombs, items, flames, done, info
+        settings = {
+            'horizon': horizon,
+            'game_type': game_type,
+            'max_steps': max_steps,
+            'action_space': action_space,
+            'is_partially_observable': is_partially_observable,
+            'agent_view_size': agent_view_size,
+            'game_env': game_env,
+            'max_blast_strength': max_blast_strength,
+            'training_agent': training_agent,
+            'obs_dtype': obs_dtype,
+        }
+        seeds = np.array(
+            utility.spawn_seeds(seed, num_rollouts * len(policies)),
+            dtype=np.uint64).reshape(num_rollouts, len(policies))
+        if pool is None:
+            return _run_rollouts(snapshot, policies, seeds, settings)
+
+        if num_tasks is None:
+            num_processes = getattr(pool, '_processes', None) or \
+                os.cpu_count() or 1
+            num_tasks = 4 * num_processes
+        num_tasks = max(1, min(num_rollouts, num_tasks))
+        results = pool.starmap(
+            _run_rollouts,
+            [(snapshot, policies, task_seeds, settings)
+             for task_seeds in np.array_split(seeds, num_tasks)])
+        return {
+            key: np.concatenate([result[key] for result in results])
+            for key in results[0]
+        }
 
     @staticmethod
-    def act(agents, obs, action_space, is_communicative=False):
+    def act(agents,
+            obs,
+            action_space,
+            is_communicative=False,
+            pool=None,
+            deadline=None,
+            running=None):
         """Returns actions for each agent in this list.
 
         Args:
@@ -91,6 +127,14 @@ class ForwardModel(object):
           action_space: The action space for the environment using this model.
           is_communicative: Whether the action depends on communication
             observations as well.
+          pool: An optional concurrent.futures.ThreadPoolExecutor. With it,
+            the agents are all asked at once, e.g. so that remote agents
+            wait on their requests together.
+          deadline: With a pool, the seconds to wait for the agents. The
+            agents that are late Stop.
+          running: With a pool, a dict kept across calls of the acts still
+            running by agent id. An agent still acting on an earlier step
+            is not asked again and Stops.
 
         Returns a list of actions.
         """
@@ -114,12 +158,17 @@ class ForwardModel(object):
             else:
                 return [constants.Action.Stop.value, 0, 0]
 
+        act_agent = act_with_communication if is_communicative \
+            else act_ex_communication
+        if pool is not None:
+            stop = [constants.Action.Stop.value, 0, 0] if is_communicative \
+                else constants.Action.Stop.value
+            return _act_concurrently(agents, act_agent, stop, pool, deadline,
+                                     running)
+
         ret = []
         for agent in agents:
-            if is_communicative:
-                ret.append(act_with_communication(agent))
-            else:
-                ret.append(act_ex_communication(agent))
+            ret.append(act_agent(agent))
         return ret
 
     @staticmethod
@@ -202,224 +251,43 @@ class ForwardModel(object):
                    and not utility.position_is_wall(curr_board, desired_position):
                     desired_bomb_positions[num_bomb] = desired_position
 
-        # Position switches:
-        # Agent <-> Agent => revert both to previous position.
-        # Bomb <-> Bomb => revert both to previous position.
-        # Agent <-> Bomb => revert Bomb to previous position.
-        crossings = {}
-
-        def crossing(current, desired):
-            '''Checks to see if an agent is crossing paths'''
-            current_x, current_y = current
-            desired_x, desired_y = desired
-            if current_x != desired_x:
-                assert current_y == desired_y
-                return ('X', min(current_x, desired_x), current_y)
-            assert current_x == desired_x
-            return ('Y', current_x, min(current_y, desired_y))
-
-        for num_agent, agent in enumerate(alive_agents):
-            if desired_agent_positions[num_agent] != agent.position:
-                desired_position = desired_agent_positions[num_agent]
-                border = crossing(agent.position, desired_position)
-                if border in crossings:
-                    # Crossed another agent - revert both to prior positions.
-                    desired_agent_positions[num_agent] = agent.position
-                    num_agent2, _ = crossings[border]
-                    desired_agent_positions[num_agent2] = alive_agents[
-                        num_agent2].position
-                else:
-                    crossings[border] = (num_agent, True)
-
-        for num_bomb, bomb in enumerate(curr_bombs):
-            if desired_bomb_positions[num_bomb] != bomb.position:
-                desired_position = desired_bomb_positions[num_bomb]
-                border = crossing(bomb.position, desired_position)
-                if border in crossings:
-                    # Crossed - revert to prior position.
-                    desired_bomb_positions[num_bomb] = bomb.position
-                    num, is_agent = crossings[border]
-                    if not is_agent:
-                        # Crossed bomb - revert that to prior position as well.
-                        desired_bomb_positions[num] = curr_bombs[num].position
-                else:
-                    crossings[border] = (num_bomb, False)
-
-        # Deal with multiple agents or multiple bomb collisions on desired next
-        # position by resetting desired position to current position for
-        # everyone involved in the collision.
-        agent_occupancy = defaultdict(int)
-        bomb_occupancy = defaultdict(int)
-        for desired_position in desired_agent_positions:
-            agent_occupancy[desired_position] += 1
-        for desired_position in desired_bomb_positions:
-            bomb_occupancy[desired_position] += 1
-
-        # Resolve >=2 agents or >=2 bombs trying to occupy the same space.
-        change = True
-        while change:
-            change = False
-            for num_agent, agent in enumerate(alive_agents):
-                desired_position = desired_agent_positions[num_agent]
-                curr_position = agent.position
-                # Either another agent is going to this position or more than
-                # one bomb is going to this position. In both scenarios, revert
-                # to the original position.
-                if desired_position != curr_position and \
-                      (agent_occupancy[desired_position] > 1 or bomb_occupancy[desired_position] > 1):
-                    desired_agent_positions[num_agent] = curr_position
-                    agent_occupancy[curr_position] += 1
-                    change = True
-
-            for num_bomb, bomb in enumerate(curr_bombs):
-                desired_position = desired_bomb_positions[num_bomb]
-                curr_position = bomb.position
-                if desired_position != curr_position and \
-                      (bomb_occupancy[desired_position] > 1 or agent_occupancy[desired_position] > 1):
-                    desired_bomb_positions[num_bomb] = curr_position
-                    bomb_occupancy[curr_position] += 1
-                    change = True
-
-        # Handle kicks.
-        agent_indexed_by_kicked_bomb = {}
-        kicked_bomb_indexed_by_agent = {}
-        delayed_bomb_updates = []
-        delayed_agent_updates = []
-
-        # Loop through all bombs to see if they need a good kicking or cause
-        # collisions with an agent.
-        for num_bomb, bomb in enumerate(curr_bombs):
-            desired_position = desired_bomb_positions[num_bomb]
-
-            if agent_occupancy[desired_position] == 0:
-                # There was never an agent around to kick or collide.
-                continue
-
-            agent_list = [
-                (num_agent, agent) for (num_agent, agent) in enumerate(alive_agents) \
-                if desired_position == desired_agent_positions[num_agent]]
-            if not agent_list:
-                # Agents moved from collision.
-                continue
-
-            # The agent_list should contain a single element at this point.
-            assert (len(agent_list) == 1)
-            num_agent, agent = agent_list[0]
-
-            if desired_position == agent.position:
-                # Agent did not move
-                if desired_position != bomb.position:
-                    # Bomb moved, but agent did not. The bomb should revert
-                    # and stop.
-                    delayed_bomb_updates.append((num_bomb, bomb.position))
-                continue
-
-            # NOTE: At this point, we have that the agent in question tried to
-            # move into this position.
-            if not agent.can_kick:
-                # If we move the agent at this point, then we risk having two
-                # agents on a square in future iterations of the loop. So we
-                # push this change to the next stage instead.
-                delayed_bomb_updates.append((num_bomb, bomb.position))
-                delayed_agent_updates.append((num_agent, agent.position))
-                continue
-
-            # Agent moved and can kick - see if the target for the kick never had anyhing on it
-            direction = constants.Action(actions[agent.agent_id])
-            target_position = utility.get_next_position(desired_position,
-                                                        direction)
-            if utility.position_on_board(curr_board, target_position) and \
-                       agent_occupancy[target_position] == 0 and \
-                       bomb_occupancy[target_position] == 0 and \
-                       not utility.position_is_powerup(curr_board, target_position) and \
-                       not utility.position_is_wall(curr_board, target_position):
-                # Ok to update bomb desired location as we won't iterate over it again here
-                # but we can not update bomb_occupancy on target position and need to check it again
-                # However we need to set the bomb count on the current position to zero so
-                # that the agent can stay on this position.
-                bomb_occupancy[desired_position] = 0
-                delayed_bomb_updates.append((num_bomb, target_position))
-                agent_indexed_by_kicked_bomb[num_bomb] = num_agent
-                kicked_bomb_indexed_by_agent[num_agent] = num_bomb
-                bomb.moving_direction = direction
-                # Bombs may still collide and we then need to reverse bomb and agent ..
-            else:
-                delayed_bomb_updates.append((num_bomb, bomb.position))
-                delayed_agent_updates.append((num_agent, agent.position))
-
-        for (num_bomb, bomb_position) in delayed_bomb_updates:
-            desired_bomb_positions[num_bomb] = bomb_position
-            bomb_occupancy[bomb_position] += 1
-            change = True
-
-        for (num_agent, agent_position) in delayed_agent_updates:
-            desired_agent_positions[num_agent] = agent_position
-            agent_occupancy[agent_position] += 1
-            change = True
-
-        while change:
-            change = False
-            for num_agent, agent in enumerate(alive_agents):
-                desired_position = desired_agent_positions[num_agent]
-                curr_position = agent.position
-                # Agents and bombs can only share a square if they are both in their
-                # original position (Agent dropped bomb and has not moved)
-                if desired_position != curr_position and \
-                      (agent_occupancy[desired_position] > 1 or bomb_occupancy[desired_position] != 0):
-                    # Late collisions resulting from failed kicks force this agent to stay at the
-                    # original position. Check if this agent successfully kicked a bomb above and undo
-                    # the kick.
-                    if num_agent in kicked_bomb_indexed_by_agent:
-                        num_bomb = kicked_bomb_indexed_by_agent[num_agent]
-                        bomb = curr_bombs[num_bomb]
-                        desired_bomb_positions[num_bomb] = bomb.position
-                        bomb_occupancy[bomb.position] += 1
-                        del agent_indexed_by_kicked_bomb[num_bomb]
-                        del kicked_bomb_indexed_by_agent[num_agent]
-                    desired_agent_positions[num_agent] = curr_position
-                    agent_occupancy[curr_position] += 1
-                    change = True
-
-            for num_bomb, bomb in enumerate(curr_bombs):
-                desired_position = desired_bomb_positions[num_bomb]
-                curr_position = bomb.position
-
-                # This bomb may be a boomerang, i.e. it was kicked back to the
-                # original location it moved from. If it is blocked now, it
-                # can't be kicked and the agent needs to move back to stay
-                # consistent with other movements.
-                if desired_position == curr_position and num_bomb not in agent_indexed_by_kicked_bomb:
-                    continue
-
-                bomb_occupancy_ = bomb_occupancy[desired_position]
-                agent_occupancy_ = agent_occupancy[desired_position]
-                # Agents and bombs can only share a square if they are both in their
-                # original position (Agent dropped bomb and has not moved)
-                if bomb_occupancy_ > 1 or agent_occupancy_ != 0:
-                    desired_bomb_positions[num_bomb] = curr_position
-                    bomb_occupancy[curr_position] += 1
-                    num_agent = agent_indexed_by_kicked_bomb.get(num_bomb)
-                    if num_agent is not None:
-                        agent = alive_agents[num_agent]
-                        desired_agent_positions[num_agent] = agent.position
-                        agent_occupancy[agent.position] += 1
-                        del kicked_bomb_indexed_by_agent[num_agent]
-                        del agent_indexed_by_kicked_bomb[num_bomb]
-                    change = True
+        # Settle the disputes between the desired moves. See _resolve_moves.
+        agent_cells = [
+            agent.position[0] * board_size + agent.position[1]
+            for agent in alive_agents
+        ]
+        bomb_cells = [
+            bomb.position[0] * board_size + bomb.position[1]
+            for bomb in curr_bombs
+        ]
+        desired_agent_cells, desired_bomb_cells, agent_indexed_by_kicked_bomb = \
+            _resolve_moves(
+                np.asarray(curr_board).reshape(-1), board_size, agent_cells,
+                [row * board_size + col
+                 for row, col in desired_agent_positions],
+                [agent.can_kick for agent in alive_agents],
+                [actions[agent.agent_id] for agent in alive_agents],
+                bomb_cells,
+                [row * board_size + col
+                 for row, col in desired_bomb_positions])
 
         for num_bomb, bomb in enumerate(curr_bombs):
-            if desired_bomb_positions[num_bomb] == bomb.position and \
-               not num_bomb in agent_indexed_by_kicked_bomb:
+            num_agent = agent_indexed_by_kicked_bomb.get(num_bomb)
+            if desired_bomb_cells[num_bomb] == bomb_cells[num_bomb] and \
+               num_agent is None:
                 # Bomb was not kicked this turn and its desired position is its
                 # current location. Stop it just in case it was moving before.
                 bomb.stop()
             else:
                 # Move bomb to the new position.
-                # NOTE: We already set the moving direction up above.
-                bomb.position = desired_bomb_positions[num_bomb]
+                if num_agent is not None:
+                    bomb.moving_direction = constants.Action(
+                        actions[alive_agents[num_agent].agent_id])
+                bomb.position = divmod(desired_bomb_cells[num_bomb],
+                                       board_size)
 
         for num_agent, agent in enumerate(alive_agents):
-            if desired_agent_positions[num_agent] != agent.position:
+            if desired_agent_cells[num_agent] != agent_cells[num_agent]:
                 agent.move(actions[agent.agent_id])
                 if utility.position_is_powerup(curr_board, agent.position):
                     agent.pick_up(
@@ -439,31 +307,22 @@ class ForwardModel(object):
                 has_new_explosions = True
 
         # Chain the explosions.
-        while has_new_explosions:
+        if has_new_explosions:
+            exploded, flamed = _chain_explosions(
+                np.asarray(curr_board).reshape(-1), board_size,
+                [bomb.position for bomb in curr_bombs],
+                [bomb.blast_strength for bomb in curr_bombs],
+                [bomb.exploded() for bomb in curr_bombs])
+            exploded_map.reshape(-1)[flamed] = 1
+
             next_bombs = []
-            has_new_explosions = False
-            for bomb in curr_bombs:
-                if not bomb.exploded():
+            for bomb, is_exploded in zip(curr_bombs, exploded):
+                if is_exploded:
+                    bomb.fire()
+                    bomb.bomber.incr_ammo()
+                else:
                     next_bombs.append(bomb)
-                    continue
-
-                bomb.bomber.incr_ammo()
-                for _, indices in bomb.explode().items():
-                    for r, c in indices:
-                        if not all(
-                            [r >= 0, c >= 0, r < board_size, c < board_size]):
-                            break
-                        if curr_board[r][c] == constants.Item.Rigid.value:
-                            break
-                        exploded_map[r][c] = 1
-                        if curr_board[r][c] == constants.Item.Wood.value:
-                            break
-
             curr_bombs = next_bombs
-            for bomb in curr_bombs:
-                if bomb.in_range(exploded_map):
-                    bomb.fire()
-                    has_new_explosions = True
 
         # Update the board's bombs.
         for bomb in curr_bombs:
@@ -485,6 +344,228 @@ class ForwardModel(object):
 
         return curr_board, curr_agents, curr_bombs, curr_items, curr_flames
 
+    @staticmethod
+    def get_state(board, agents, bombs, items, flames):
+        """Snapshots the objects used by step.
+
+        Returns:
+          A read-only game_state.GameState holding the game. It can be stepped
+          after a copy with step_state, or unpacked again with set_state.
+        """
+        state = game_state.GameState(len(board), len(agents))
+        state.set_game(0, board, agents, bombs, items, flames)
+        return state.snapshot()
+
+    @staticmethod
+    def set_state(snapshot, agents):
+        """Restores a snapshot made by get_state.
+
+        The agents are updated in place.
+
+        Returns:
+          board, bombs, items, flames: New objects to pass on to step.
+        """
+        return snapshot.get_game(0, agents)
+
+    @staticmethod
+    def step_state(actions, state, max_blast_strength=10):
+        """Steps a game_state.GameState holding a single game, in place.
+
+        This follows the same rules as step, but reads the characters from
+        the arrays of the state once and writes them back at the end instead
+        of going through lists of objects. Positions are (row, col) tuples
+        and a bomb moving direction of 0 means the bomb is not moving.
+
+        Args:
+          actions: The list of actions, one per agent.
+          state: The game_state.GameState to step.
+          max_blast_strength: The cap on blast strength from IncrRange.
+        """
+        board = state.board[0]
+        items = state.items[0]
+        flames = state.flames[0]
+        board_size = state.board_size
+        stop = constants.Action.Stop.value
+        lay_bomb = constants.Action.Bomb.value
+        passage = constants.Item.Passage.value
+        flames_value = constants.Item.Flames.value
+        bomb_value = constants.Item.Bomb.value
+        walls = (constants.Item.Rigid.value, constants.Item.Wood.value)
+        powerups = (constants.Item.ExtraBomb.value,
+                    constants.Item.IncrRange.value, constants.Item.Kick.value)
+
+        # Tick the flames. Bit 0 holds the ones that die now: replace them
+        # with passages, or with the item hidden there. A cell keeps showing
+        # flames until all of its flames are dead.
+        if flames.any():
+            dead = (flames & 1).astype(bool)
+            flames >>= 1
+            board[dead] = items[dead]
+            items[dead] = 0
+            board[flames != 0] = flames_value
+
+        positions = [tuple(p) for p in state.agent_position[0].tolist()]
+        ammo = state.agent_ammo[0].tolist()
+        blast_strengths = state.agent_blast_strength[0].tolist()
+        can_kick = state.agent_can_kick[0].tolist()
+        alive_ids = np.flatnonzero(state.agent_alive[0]).tolist()
+
+        num_bombs = int(state.num_bombs[0])
+        bomb_positions = [
+            tuple(p) for p in state.bomb_position[0, :num_bombs].tolist()
+        ]
+        bomb_bombers = state.bomb_bomber[0, :num_bombs].tolist()
+        bomb_lives = state.bomb_life[0, :num_bombs].tolist()
+        bomb_blast_strengths = \
+            state.bomb_blast_strength[0, :num_bombs].tolist()
+        bomb_directions = state.bomb_moving_direction[0, :num_bombs].tolist()
+
+        def next_position(position, direction):
+            '''Returns the position one step in the direction'''
+            row, col = position
+            d_row, d_col = _ACTION_OFFSETS[direction]
+            return (row + d_row, col + d_col)
+
+        def on_board(position):
+            '''Checks if a position is on the board'''
+            row, col = position
+            return 0 <= row < board_size and 0 <= col < board_size
+
+        # Figure out desired next position for alive agents. See step for
+        # how the disputes are resolved.
+        desired_agent_positions = [positions[id_] for id_ in alive_ids]
+        for num_agent, id_ in enumerate(alive_ids):
+            position = positions[id_]
+            board[position] = passage
+            action = constants.Action(actions[id_]).value
+            if action == stop:
+                pass
+            elif action == lay_bomb:
+                if position not in bomb_positions and ammo[id_] > 0:
+                    ammo[id_] -= 1
+                    bomb_positions.append(position)
+                    bomb_bombers.append(id_)
+                    bomb_lives.append(constants.DEFAULT_BOMB_LIFE + 1)
+                    bomb_blast_strengths.append(blast_strengths[id_])
+                    bomb_directions.append(0)
+            else:
+                desired_position = next_position(position, action)
+                if on_board(desired_position) and \
+                   board[desired_position] not in walls:
+                    desired_agent_positions[num_agent] = desired_position
+
+        # Gather desired next positions for moving bombs. Handle kicks later.
+        desired_bomb_positions = list(bomb_positions)
+        for num_bomb, position in enumerate(bomb_positions):
+            board[position] = passage
+            direction = bomb_directions[num_bomb]
+            if direction:
+                desired_position = next_position(position, direction)
+                if on_board(desired_position) and \
+                   board[desired_position] not in powerups and \
+                   board[desired_position] not in walls:
+                    desired_bomb_positions[num_bomb] = desired_position
+
+        # Settle the disputes between the desired moves. See _resolve_moves.
+        agent_cells = [
+            positions[id_][0] * board_size + positions[id_][1]
+            for id_ in alive_ids
+        ]
+        bomb_cells = [row * board_size + col for row, col in bomb_positions]
+        desired_agent_cells, desired_bomb_cells, agent_indexed_by_kicked_bomb = \
+            _resolve_moves(
+                board.reshape(-1), board_size, agent_cells,
+                [row * board_size + col
+                 for row, col in desired_agent_positions],
+                [can_kick[id_] for id_ in alive_ids],
+                [actions[id_] for id_ in alive_ids], bomb_cells,
+                [row * board_size + col
+                 for row, col in desired_bomb_positions])
+
+        for num_bomb, cell in enumerate(desired_bomb_cells):
+            num_agent = agent_indexed_by_kicked_bomb.get(num_bomb)
+            if num_agent is not None:
+                bomb_directions[num_bomb] = constants.Action(
+                    actions[alive_ids[num_agent]]).value
+            elif cell == bomb_cells[num_bomb]:
+                bomb_directions[num_bomb] = 0
+            bomb_positions[num_bomb] = divmod(cell, board_size)
+
+        for num_agent, id_ in enumerate(alive_ids):
+            desired_cell = desired_agent_cells[num_agent]
+            if desired_cell == agent_cells[num_agent]:
+                continue
+            desired_position = divmod(desired_cell, board_size)
+            positions[id_] = desired_position
+            item_value = board[desired_position]
+            if item_value == powerups[0]:
+                ammo[id_] = min(ammo[id_] + 1, 10)
+            elif item_value == powerups[1]:
+                blast_strengths[id_] = min(blast_strengths[id_] + 1,
+                                           max_blast_strength)
+            elif item_value == powerups[2]:
+                can_kick[id_] = True
+
+        # Explode bombs.
+        exploded_map = np.zeros_like(board)
+        has_new_explosions = False
+        for num_bomb, position in enumerate(bomb_positions):
+            bomb_lives[num_bomb] -= 1
+            if bomb_lives[num_bomb] == 0:
+                has_new_explosions = True
+            elif board[position] == flames_value:
+                bomb_lives[num_bomb] = 0
+                has_new_explosions = True
+
+        # Chain the explosions.
+        remaining = list(range(len(bomb_positions)))
+        if has_new_explosions:
+            exploded, flamed = _chain_explosions(
+                board.reshape(-1), board_size, bomb_positions,
+                bomb_blast_strengths, [life == 0 for life in bomb_lives])
+            exploded_map.reshape(-1)[flamed] = 1
+
+            remaining = []
+            for num_bomb, is_exploded in enumerate(exploded):
+                if is_exploded:
+                    id_ = bomb_bombers[num_bomb]
+                    ammo[id_] = min(ammo[id_] + 1, 10)
+                else:
+                    remaining.append(num_bomb)
+
+        # Update the board's bombs.
+        for num_bomb in remaining:
+            board[bomb_positions[num_bomb]] = bomb_value
+
+        # Update the board's flames. New flames have life 2.
+        flames |= exploded_map << 2
+        board[flames != 0] = flames_value
+
+        # Kill agents on flames. Otherwise, update position on the board.
+        alive = state.agent_alive[0]
+        for id_ in alive_ids:
+            if board[positions[id_]] == flames_value:
+                alive[id_] = False
+            else:
+                board[positions[id_]] = constants.Item.Agent0.value + id_
+
+        state.agent_position[0] = positions
+        state.agent_ammo[0] = ammo
+        state.agent_blast_strength[0] = blast_strengths
+        state.agent_can_kick[0] = can_kick
+
+        num_bombs = len(remaining)
+        state.num_bombs[0] = num_bombs
+        if num_bombs:
+            state.bomb_position[0, :num_bombs] = \
+                [bomb_positions[num] for num in remaining]
+            for name, values in [('bomb_bomber', bomb_bombers),
+                                 ('bomb_life', bomb_lives),
+                                 ('bomb_blast_strength', bomb_blast_strengths),
+                                 ('bomb_moving_direction', bomb_directions)]:
+                getattr(state, name)[0, :num_bombs] = \
+                    [values[num] for num in remaining]
+
     def get_observations(self, curr_board, agents, bombs, flames,
                          is_partially_observable, agent_view_size,
                          game_type, game_env):
@@ -493,80 +574,95 @@ class ForwardModel(object):
         The agent gets to choose whether it wants to keep the fogged part in
         memory.
         """
-        board_size = len(curr_board)
+        maps = self.get_observation_maps(len(curr_board), bombs, flames)
+        return self.make_observations(curr_board, agents, maps,
+                                      is_partially_observable,
+                                      agent_view_size, game_type, game_env)
 
-        def make_bomb_maps(position):
-            ''' Makes an array of an agents bombs and the bombs attributes '''
-            blast_strengths = np.zeros((board_size, board_size))
-            life = np.zeros((board_size, board_size))
-            moving_direction = np.zeros((board_size, board_size))
-
-            for bomb in bombs:
-                x, y = bomb.position
-                if not is_partially_observable \
-                   or in_view_range(position, x, y):
-                    blast_strengths[(x, y)] = bomb.blast_strength
-                    life[(x, y)] = bomb.life
-                    if bomb.moving_direction is not None:
-                        moving_direction[(x, y)] = bomb.moving_direction.value
-            return blast_strengths, life, moving_direction
-
-        def make_flame_map(position):
-            ''' Makes an array of an agents flame life'''
-            life = np.zeros((board_size, board_size))
-
-            for flame in flames:
-                x, y = flame.position
-                if not is_partially_observable \
-                   or in_view_range(position, x, y):
-                    # +1 needed because flame removal check is done
-                    # before flame is ticked down, i.e. flame life
-                    # in environment is 2 -> 1 -> 0 -> dead
-                    life[(x, y)] = flame.life + 1
-            return life
-
-        def in_view_range(position, v_row, v_col):
-            '''Checks to see if a tile is in an agents viewing area'''
-            row, col = position
-            return all([
-                row >= v_row - agent_view_size, row <= v_row + agent_view_size,
-                col >= v_col - agent_view_size, col <= v_col + agent_view_size
-            ])
+    @staticmethod
+    def get_observation_maps(board_size, bombs, flames, dtype=np.float64):
+        """Makes the unfogged bomb and flame maps shared by all agents.
+
+        Args:
+          dtype: The dtype of the maps, e.g. game_state.OBS_DTYPES['compact'].
 
+        Returns:
+          A dict with the bomb_blast_strength, bomb_life,
+          bomb_moving_direction and flame_life maps.
+        """
+        blast_strengths = np.zeros((board_size, board_size), dtype=dtype)
+        life = np.zeros((board_size, board_size), dtype=dtype)
+        moving_direction = np.zeros((board_size, board_size), dtype=dtype)
+        for bomb in bombs:
+            position = bomb.position
+            blast_strengths[position] = bomb.blast_strength
+            life[position] = bomb.life
+            if bomb.moving_direction is not None:
+                moving_direction[position] = bomb.moving_direction.value
+
+        flame_life = np.zeros((board_size, board_size), dtype=dtype)
+        for flame in flames:
+            # +1 needed because flame removal check is done
+            # before flame is ticked down, i.e. flame life
+            # in environment is 2 -> 1 -> 0 -> dead
+            flame_life[flame.position] = flame.life + 1
+
+        return {
+            'bomb_blast_strength': blast_strengths,
+            'bomb_life': life,
+            'bomb_moving_direction': moving_direction,
+            'flame_life': flame_life
+        }
+
+    @staticmethod
+    def make_observations(curr_board, agents, maps, is_partially_observable,
+                          agent_view_size, game_type, game_env):
+        """Gets the observations from the maps of get_observation_maps.
+
+        Under partial observability each agent's board and maps are cut with
+        a cached view mask of its position. Otherwise every agent gets its own
+        copy of the maps, and the board itself. The board and the maps are
+        observation.Observation fields that are only made when first read.
+        """
+        board_size = len(curr_board)
         attrs = [
             'position', 'blast_strength', 'can_kick', 'teammate', 'ammo',
             'enemies'
         ]
         alive_agents = [
-            utility.agent_value(agent.agent_id)
+            constants.Item.Agent0.value + agent.agent_id
             for agent in agents
             if agent.is_alive
         ]
+        if is_partially_observable:
+            # The board changes in place on the next step, unlike the maps.
+            board = curr_board.copy()
+            fog = np.asarray(constants.Item.Fog.value, dtype=board.dtype)
 
         observations = []
         for agent in agents:
+            # Skip the attribute forwarding of agents.BaseAgent.
+            character = getattr(agent, '_character', agent)
             agent_obs = {'alive': alive_agents}
-            board = curr_board
             if is_partially_observable:
-                board = board.copy()
-                for row in range(board_size):
-                    for col in range(board_size):
-                        if not in_view_range(agent.position, row, col):
-                            board[row, col] = constants.Item.Fog.value
-            agent_obs['board'] = board
-            bomb_blast_strengths, bomb_life, bomb_moving_direction = make_bomb_maps(agent.position)
-            agent_obs['bomb_blast_strength'] = bomb_blast_strengths
-            agent_obs['bomb_life'] = bomb_life
-            agent_obs['bomb_moving_direction'] = bomb_moving_direction
-            flame_life = make_flame_map(agent.position)
-            agent_obs['flame_life'] = flame_life
+                in_view = _view_mask(board_size, agent_view_size,
+                                     character.position)
+                agent_obs['board'] = observation.Lazy(
+                    functools.partial(np.where, in_view, board, fog))
+                for key, value in maps.items():
+                    agent_obs[key] = observation.Lazy(
+                        functools.partial(np.where, in_view, value,
+                                          value.dtype.type(0)))
+            else:
+                agent_obs['board'] = curr_board
+                for key, value in maps.items():
+                    agent_obs[key] = observation.Lazy(value.copy, value)
             agent_obs['game_type'] = game_type.value
             agent_obs['game_env'] = game_env
 
             for attr in attrs:
-                assert hasattr(agent, attr)
-                agent_obs[attr] = getattr(agent, attr)
-            observations.append(agent_obs)
+                agent_obs[attr] = getattr(character, attr)
+            observations.append(observation.Observation(agent_obs))
 
         return observations
 
@@ -672,3 +768,820 @@ class ForwardModel(object):
             else:
                 # No team has yet won or lost.
                 return [0] * 4
+
+
+def _act_concurrently(agents, act_agent, stop, pool, deadline, running):
+    '''Calls act_agent for each agent on the pool, see ForwardModel.act'''
+    if running is None:
+        running = {}
+    futures = []
+    for agent in agents:
+        future = running.get(agent.agent_id)
+        if not agent.is_alive or (future is not None and not future.done()):
+            # Dead agents and agents still acting on an earlier step Stop.
+            futures.append(None)
+            continue
+        future = running[agent.agent_id] = pool.submit(act_agent, agent)
+        futures.append(future)
+    concurrent.futures.wait(
+        [future for future in futures if future is not None],
+        timeout=deadline)
+    return [
+        future.result() if future is not None and future.done() else stop
+        for future in futures
+    ]
+
+
+def _run_rollouts(snapshot, policies, seeds, settings):
+    """Runs the rollouts of ForwardModel.run in this process.
+
+    Args:
+      seeds: The (num_rollouts, num_agents) seeds of the policies in each
+        rollout.
+    """
+    horizon = settings['horizon']
+    game_type = settings['game_type']
+    max_steps = settings['max_steps']
+    action_space = settings['action_space']
+    max_blast_strength = settings['max_blast_strength']
+    dtype = game_state.OBS_DTYPES[settings['obs_dtype']]
+    num_agents = len(policies)
+    num_rollouts = len(seeds)
+    stop = constants.Action.Stop.value
+
+    # The observations are made from bombers bound to a private state. They
+    # are bound before restoring, as binding writes their defaults.
+    state = snapshot.state.copy()
+    bombers = [characters.Bomber(agent_id, game_type)
+               for agent_id in range(num_agents)]
+    for bomber in bombers:
+        bomber.bind(state)
+
+    actions = np.full((num_rollouts, horizon, num_agents), stop,
+                      dtype=np.uint8)
+    rewards = np.zeros((num_rollouts, horizon, num_agents), dtype=np.int8)
+    done = np.zeros((num_rollouts, horizon), dtype=bool)
+    length = np.zeros(num_rollouts, dtype=np.int64)
+    for rollout in range(num_rollouts):
+        for policy, policy_seed in zip(policies, seeds[rollout].tolist()):
+            if hasattr(policy, 'seed'):
+                policy.seed(policy_seed)
+        state.restore(snapshot.state)
+        step_count = snapshot.step_count
+        # As in Pomme.step, the observations made after a step carry the
+        # step count from before it.
+        obs_step_count = step_count
+        for step in range(horizon):
+            obs = ForwardModel.make_observations(
+                state.board[0], bombers, state.get_observation_maps(0, dtype),
+                settings['is_partially_observable'],
+                settings['agent_view_size'], game_type, settings['game_env'])
+            step_actions = []
+            for policy, bomber, agent_obs in zip(policies, bombers, obs):
+                if policy is None or not bomber.is_alive:
+                    step_actions.append(stop)
+                    continue
+                agent_obs['step_count'] = obs_step_count
+                action = policy.act(agent_obs, action_space)
+                if isinstance(action, (list, tuple)):
+                    action = action[0]
+                step_actions.append(int(action))
+
+            ForwardModel.step_state(step_actions, state, max_blast_strength)
+            length[rollout] = step + 1
+            step_done = ForwardModel.get_done(bombers, step_count, max_steps,
+                                              game_type,
+                                              settings['training_agent'])
+            actions[rollout, step] = step_actions
+            rewards[rollout, step] = ForwardModel.get_rewards(
+                bombers, game_type, step_count, max_steps)
+            obs_step_count = step_count
+            step_count += 1
+            if step_done:
+                done[rollout, step:] = True
+                rewards[rollout, step + 1:] = rewards[rollout, step]
+                break
+
+    return {
+        'actions': actions,
+        'rewards': rewards,
+        'done': done,
+        'length': length
+    }
+
+
+# Row/column offset of each Action value. Stop and Bomb do not move.
+_ACTION_OFFSETS = [(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1), (0, 0)]
+_ACTION_DELTAS = np.array(_ACTION_OFFSETS)
+
+
+# Cells a moving or kicked bomb can not enter.
+_BOMB_BLOCKERS = utility.item_table([
+    constants.Item.Rigid, constants.Item.Wood, constants.Item.ExtraBomb,
+    constants.Item.IncrRange, constants.Item.Kick
+])
+
+
+_VIEW_MASKS = {}
+
+
+def _view_mask(board_size, agent_view_size, position):
+    '''Returns the read-only mask of the cells an agent at `position` sees,
+    making it on first use'''
+    key = (board_size, agent_view_size, tuple(position))
+    mask = _VIEW_MASKS.get(key)
+    if mask is None:
+        row, col = position
+        mask = np.zeros((board_size, board_size), dtype=bool)
+        mask[max(row - agent_view_size, 0):row + agent_view_size + 1,
+             max(col - agent_view_size, 0):col + agent_view_size + 1] = True
+        mask.setflags(write=False)
+        _VIEW_MASKS[key] = mask
+    return mask
+
+
+# The blast rays in the order of characters.Bomb.explode, as (row step,
+# column step, offset of the first cell). The 'down' ray starts on the bomb.
+_BLAST_DIRECTIONS = [(-1, 0, 1), (1, 0, 0), (0, -1, 1), (0, 1, 1)]
+_BLAST_RAY_STARTS = np.array([start for _, _, start in _BLAST_DIRECTIONS])
+_BLAST_RAYS = {}
+
+
+def _blast_rays(board_size):
+    '''Returns the blast ray table for a board size, making it on first use.
+
+    Entry [cell, direction, i] is the flat index of the i-th cell that a
+    blast from the flat `cell` reaches in that direction, or -1 once the ray
+    has left the board.
+    '''
+    rays = _BLAST_RAYS.get(board_size)
+    if rays is None:
+        rows, cols = np.divmod(np.arange(board_size**2), board_size)
+        offsets = np.arange(board_size)
+        rays = np.empty((board_size**2, 4, board_size), dtype=np.int64)
+        for num, (d_row, d_col, start) in enumerate(_BLAST_DIRECTIONS):
+            ray_rows = rows[:, None] + d_row * (offsets + start)
+            ray_cols = cols[:, None] + d_col * (offsets + start)
+            on_board = (ray_rows >= 0) & (ray_rows < board_size) & \
+                (ray_cols >= 0) & (ray_cols < board_size)
+            rays[:, num] = np.where(on_board, ray_rows * board_size + ray_cols,
+                                    -1)
+        _BLAST_RAYS[board_size] = rays
+    return rays
+
+
+def _blast_footprint(board, board_size, cells, blast_strengths, bases=0):
+    '''Returns the cells reached by the blasts of the given bombs.
+
+    Each ray stops at the board's edge and at Rigid walls, and after the
+    first Wood wall, exactly like walking characters.Bomb.explode.
+
+    Args:
+      board: The flattened board, or the flattened boards of several games.
+      board_size: The size of a single board.
+      cells: The flat cells of the bombs on their own board.
+      blast_strengths: The blast strengths of the bombs.
+      bases: The offset of each bomb's board in `board`.
+
+    Returns:
+      The indices into `board` of the cells in flames. Cells reached by
+      several rays are repeated.
+    '''
+    rays, reached = _blast_reach(board, board_size, cells, blast_strengths,
+                                 bases)
+    return rays[reached]
+
+
+def _blast_reach(board, board_size, cells, blast_strengths, bases=0):
+    '''Returns the (bombs, 4, length) rays of the bombs and which cells of
+    them are reached. See _blast_footprint.'''
+    length = min(int(blast_strengths.max()), board_size)
+    rays = _blast_rays(board_size)[cells, :, :length]
+    valid = (rays >= 0) & (np.arange(length) < (
+        blast_strengths[:, None, None] - _BLAST_RAY_STARTS[:, None]))
+    rays = np.where(valid, rays + np.reshape(bases, (-1, 1, 1)), 0)
+    values = board[rays]
+    reached = valid & (values != constants.Item.Rigid.value)
+    # A cell is reached if nothing before it on the ray blocks the blast.
+    passable = reached & (values != constants.Item.Wood.value)
+    reached[..., 1:] &= np.logical_and.accumulate(passable[..., :-1], axis=-1)
+    return rays, reached
+
+
+def _chain_explosions(board, board_size, positions, blast_strengths,
+                      exploding):
+    '''Finds all bombs set off by the exploding ones.
+
+    The board does not change while the bombs go off, so the blast of each
+    bomb is known up front. The blasts give a graph where bomb i triggers
+    bomb j if its flames reach j's cell, and the bombs that go off are the
+    ones reachable from the exploding ones.
+
+    Args:
+      board: The flattened board.
+      board_size: The size of the board.
+      positions: The (row, col) positions of all live bombs.
+      blast_strengths: The blast strengths of all live bombs.
+      exploding: Whether each bomb goes off on its own, because its life ran
+        out or it sits in flames.
+
+    Returns:
+      exploded: A list saying whether each bomb went off.
+      flamed: The flat cells reached by the blasts, possibly repeated.
+    '''
+    cells = np.array([row * board_size + col for row, col in positions])
+    rays, reached = _blast_reach(board, board_size, cells,
+                                 np.array(blast_strengths))
+    bombs_at = defaultdict(list)
+    for num_bomb, cell in enumerate(cells.tolist()):
+        bombs_at[cell].append(num_bomb)
+
+    exploded = list(exploding)
+    stack = [num_bomb for num_bomb, is_exploded in enumerate(exploded)
+             if is_exploded]
+    while stack:
+        num_bomb = stack.pop()
+        for cell in rays[num_bomb][reached[num_bomb]].tolist():
+            for other in bombs_at.get(cell, ()):
+                if not exploded[other]:
+                    exploded[other] = True
+                    stack.append(other)
+
+    is_exploded = np.array(exploded)
+    return exploded, rays[is_exploded][reached[is_exploded]]
+
+
+def _next_cell(cell, direction, board_size):
+    '''Returns the flat cell one step in the direction, or -1 if off board'''
+    row, col = divmod(cell, board_size)
+    d_row, d_col = _ACTION_OFFSETS[direction]
+    row += d_row
+    col += d_col
+    if 0 <= row < board_size and 0 <= col < board_size:
+        return row * board_size + col
+    return -1
+
+
+def _resolve_moves(board, board_size, agent_cells, desired_agent_cells,
+                   agent_can_kick, agent_actions, bomb_cells,
+                   desired_bomb_cells):
+    '''Settles where the moving agents and bombs end up.
+
+    Everything is in flat cells, and the disputes are counted on occupancy
+    grids with an entry per cell. Each pass of the fixed-point loops sends at
+    least one agent or bomb back for good, so they are bounded by the number
+    of agents and bombs, and they only visit the ones still on the move.
+
+    Args:
+      board: The flattened board, used to check where kicked bombs can go.
+      board_size: The size of the board.
+      agent_cells: The cells of the alive agents.
+      desired_agent_cells: Where each alive agent wants to go.
+      agent_can_kick: Whether each alive agent can kick.
+      agent_actions: The action of each alive agent, giving kick directions.
+      bomb_cells: The cells of the bombs.
+      desired_bomb_cells: Where each bomb wants to go.
+
+    Returns:
+      desired_agent_cells: Where each alive agent ends up.
+      desired_bomb_cells: Where each bomb ends up.
+      agent_indexed_by_kicked_bomb: The agent behind each successful kick,
+        by bomb. The kicked bombs now move in that agent's direction.
+    '''
+    num_cells = board_size * board_size
+    num_agents = len(agent_cells)
+    num_bombs = len(bomb_cells)
+    max_passes = num_agents + num_bombs + 1
+    desired_agent_cells = list(desired_agent_cells)
+    desired_bomb_cells = list(desired_bomb_cells)
+    moving_agents = [
+        num_agent for num_agent, cell in enumerate(agent_cells)
+        if desired_agent_cells[num_agent] != cell
+    ]
+    moving_bombs = [
+        num_bomb for num_bomb, cell in enumerate(bomb_cells)
+        if desired_bomb_cells[num_bomb] != cell
+    ]
+
+    # Position switches:
+    # Agent <-> Agent => revert both to previous position.
+    # Bomb <-> Bomb => revert both to previous position.
+    # Agent <-> Bomb => revert Bomb to previous position.
+    # Every move crosses the border between two cells. Vertical borders are
+    # numbered by the upper cell and horizontal ones by the left cell plus
+    # num_cells.
+    crossings = {}
+    for num_agent in moving_agents:
+        cell = agent_cells[num_agent]
+        desired_cell = desired_agent_cells[num_agent]
+        if desired_cell != cell:
+            border = min(cell, desired_cell)
+            if abs(desired_cell - cell) == 1:
+                border += num_cells
+            if border in crossings:
+                # Crossed another agent - revert both to prior positions.
+                desired_agent_cells[num_agent] = cell
+                num_agent2, _ = crossings[border]
+                desired_agent_cells[num_agent2] = agent_cells[num_agent2]
+            else:
+                crossings[border] = (num_agent, True)
+
+    for num_bomb in moving_bombs:
+        cell = bomb_cells[num_bomb]
+        desired_cell = desired_bomb_cells[num_bomb]
+        if desired_cell != cell:
+            border = min(cell, desired_cell)
+            if abs(desired_cell - cell) == 1:
+                border += num_cells
+            if border in crossings:
+                # Crossed - revert to prior position.
+                desired_bomb_cells[num_bomb] = cell
+                num, is_agent = crossings[border]
+                if not is_agent:
+                    # Crossed bomb - revert that to prior position as well.
+                    desired_bomb_cells[num] = bomb_cells[num]
+            else:
+                crossings[border] = (num_bomb, False)
+
+    # Deal with multiple agents or multiple bomb collisions on desired next
+    # position by resetting desired position to current position for
+    # everyone involved in the collision.
+    agent_occupancy = [0] * num_cells
+    bomb_occupancy = [0] * num_cells
+    for desired_cell in desired_agent_cells:
+        agent_occupancy[desired_cell] += 1
+    for desired_cell in desired_bomb_cells:
+        bomb_occupancy[desired_cell] += 1
+
+    # Resolve >=2 agents or >=2 bombs trying to occupy the same space.
+    for _ in range(max_passes):
+        change = False
+        for num_agent in moving_agents:
+            cell = agent_cells[num_agent]
+            desired_cell = desired_agent_cells[num_agent]
+            # Either another agent is going to this position or more than
+            # one bomb is going to this position. In both scenarios, revert
+            # to the original position.
+            if desired_cell != cell and (agent_occupancy[desired_cell] > 1 or
+                                         bomb_occupancy[desired_cell] > 1):
+                desired_agent_cells[num_agent] = cell
+                agent_occupancy[cell] += 1
+                change = True
+
+        for num_bomb in moving_bombs:
+            cell = bomb_cells[num_bomb]
+            desired_cell = desired_bomb_cells[num_bomb]
+            if desired_cell != cell and (bomb_occupancy[desired_cell] > 1 or
+                                         agent_occupancy[desired_cell] > 1):
+                desired_bomb_cells[num_bomb] = cell
+                bomb_occupancy[cell] += 1
+                change = True
+
+        if not change:
+            break
+
+    # Handle kicks.
+    agent_indexed_by_kicked_bomb = {}
+    kicked_bomb_indexed_by_agent = {}
+    delayed_bomb_updates = []
+    delayed_agent_updates = []
+
+    # Loop through all bombs to see if they need a good kicking or cause
+    # collisions with an agent.
+    for num_bomb, cell in enumerate(bomb_cells):
+        desired_cell = desired_bomb_cells[num_bomb]
+        if agent_occupancy[desired_cell] == 0:
+            # There was never an agent around to kick or collide.
+            continue
+
+        if desired_cell not in desired_agent_cells:
+            # Agents moved from collision.
+            continue
+
+        # There is a single agent on the cell at this point.
+        num_agent = desired_agent_cells.index(desired_cell)
+        agent_cell = agent_cells[num_agent]
+
+        if desired_cell == agent_cell:
+            # Agent did not move
+            if desired_cell != cell:
+                # Bomb moved, but agent did not. The bomb should revert
+                # and stop.
+                delayed_bomb_updates.append((num_bomb, cell))
+            continue
+
+        # NOTE: At this point, we have that the agent in question tried to
+        # move into this position.
+        if not agent_can_kick[num_agent]:
+            # If we move the agent at this point, then we risk having two
+            # agents on a square in future iterations of the loop. So we
+            # push this change to the next stage instead.
+            delayed_bomb_updates.append((num_bomb, cell))
+            delayed_agent_updates.append((num_agent, agent_cell))
+            continue
+
+        # Agent moved and can kick - see if the target for the kick never
+        # had anything on it.
+        direction = constants.Action(agent_actions[num_agent]).value
+        target_cell = _next_cell(desired_cell, direction, board_size)
+        if target_cell >= 0 and \
+           agent_occupancy[target_cell] == 0 and \
+           bomb_occupancy[target_cell] == 0 and \
+           not _BOMB_BLOCKERS[board[target_cell]]:
+            # Ok to update bomb desired location as we won't iterate over it
+            # again here but we can not update bomb_occupancy on target
+            # position and need to check it again. However we need to set the
+            # bomb count on the current position to zero so that the agent
+            # can stay on this position.
+            bomb_occupancy[desired_cell] = 0
+            delayed_bomb_updates.append((num_bomb, target_cell))
+            agent_indexed_by_kicked_bomb[num_bomb] = num_agent
+            kicked_bomb_indexed_by_agent[num_agent] = num_bomb
+            # Bombs may still collide and we then need to reverse bomb and
+            # agent ..
+        else:
+            delayed_bomb_updates.append((num_bomb, cell))
+            delayed_agent_updates.append((num_agent, agent_cell))
+
+    for num_bomb, bomb_cell in delayed_bomb_updates:
+        desired_bomb_cells[num_bomb] = bomb_cell
+        bomb_occupancy[bomb_cell] += 1
+
+    for num_agent, agent_cell in delayed_agent_updates:
+        desired_agent_cells[num_agent] = agent_cell
+        agent_occupancy[agent_cell] += 1
+
+    # Only the late collisions of delayed updates are settled below.
+    passes = max_passes if delayed_bomb_updates or delayed_agent_updates \
+        else 0
+    moving_agents = [
+        num_agent for num_agent in moving_agents
+        if desired_agent_cells[num_agent] != agent_cells[num_agent]
+    ]
+    moving_bombs = [
+        num_bomb for num_bomb, cell in enumerate(bomb_cells)
+        if desired_bomb_cells[num_bomb] != cell or
+        num_bomb in agent_indexed_by_kicked_bomb
+    ]
+    for _ in range(passes):
+        change = False
+        for num_agent in moving_agents:
+            cell = agent_cells[num_agent]
+            desired_cell = desired_agent_cells[num_agent]
+            # Agents and bombs can only share a square if they are both in
+            # their original position (Agent dropped bomb and has not moved)
+            if desired_cell != cell and (agent_occupancy[desired_cell] > 1 or
+                                         bomb_occupancy[desired_cell] != 0):
+                # Late collisions resulting from failed kicks force this agent
+                # to stay at the original position. Check if this agent
+                # successfully kicked a bomb above and undo the kick.
+                if num_agent in kicked_bomb_indexed_by_agent:
+                    num_bomb = kicked_bomb_indexed_by_agent.pop(num_agent)
+                    del agent_indexed_by_kicked_bomb[num_bomb]
+                    desired_bomb_cells[num_bomb] = bomb_cells[num_bomb]
+                    bomb_occupancy[bomb_cells[num_bomb]] += 1
+                desired_agent_cells[num_agent] = cell
+                agent_occupancy[cell] += 1
+                change = True
+
+        for num_bomb in moving_bombs:
+            cell = bomb_cells[num_bomb]
+            desired_cell = desired_bomb_cells[num_bomb]
+            # This bomb may be a boomerang, i.e. it was kicked back to the
+            # original location it moved from. If it is blocked now, it
+            # can't be kicked and the agent needs to move back to stay
+            # consistent with other movements.
+            if desired_cell == cell and \
+               num_bomb not in agent_indexed_by_kicked_bomb:
+                continue
+
+            # Agents and bombs can only share a square if they are both in
+            # their original position (Agent dropped bomb and has not moved)
+            if bomb_occupancy[desired_cell] > 1 or \
+               agent_occupancy[desired_cell] != 0:
+                desired_bomb_cells[num_bomb] = cell
+                bomb_occupancy[cell] += 1
+                num_agent = agent_indexed_by_kicked_bomb.pop(num_bomb, None)
+                if num_agent is not None:
+                    del kicked_bomb_indexed_by_agent[num_agent]
+                    agent_cell = agent_cells[num_agent]
+                    desired_agent_cells[num_agent] = agent_cell
+                    agent_occupancy[agent_cell] += 1
+                change = True
+
+        if not change:
+            break
+
+    return desired_agent_cells, desired_bomb_cells, \
+        agent_indexed_by_kicked_bomb
+
+
+class BatchForwardModel(object):
+    """Steps the games of a game_state.GameState in lockstep.
+
+    step() applies exactly the rules of ForwardModel.step to every game of
+    the state at once, resolving crossings, occupancy disputes, kicks and
+    chained explosions with array operations over all games.
+    """
+
+    @staticmethod
+    def step(actions, state, max_blast_strength=10):
+        """Advances every game of a GameState by one step, in place.
+
+        Args:
+          actions: A (num_games, num_agents) array-like of Action values.
+            Actions of dead agents are ignored.
+          state: The game_state.GameState to step.
+          max_blast_strength: The cap on blast strength from IncrRange.
+        """
+        actions = np.asarray(actions, dtype=np.int64).reshape(
+            state.num_games, state.num_agents)
+        if actions.size and (actions.min() < constants.Action.Stop.value or
+                             actions.max() > constants.Action.Bomb.value):
+            raise constants.InvalidAction(
+                "We did not receive valid actions: ", actions)
+
+        size = state.board_size
+        num_cells = size * size
+
+        def count(games, cells, num_cells):
+            '''Counts (game, cell) pairs into a (num_games, num_cells) grid'''
+            return np.bincount(
+                games * num_cells + cells,
+                minlength=state.num_games * num_cells).reshape(
+                    state.num_games, num_cells)
+
+        passage = constants.Item.Passage.value
+        flames_value = constants.Item.Flames.value
+        board = state.board.reshape(state.num_games, num_cells)
+
+        # Tick the flames. Cells whose flames all died reveal their item, or
+        # become a passage (Passage is 0, as is an empty item cell).
+        dead = (state.flames & 1).astype(bool)
+        state.flames >>= 1
+        state.board[dead] = state.items[dead]
+        state.items[dead] = 0
+        state.board[state.flames != 0] = flames_value
+
+        agent_games = np.broadcast_to(
+            np.arange(state.num_games)[:, None], actions.shape)
+        agent_ids = np.broadcast_to(
+            np.arange(state.num_agents)[None, :], actions.shape)
+        alive = state.agent_alive.copy()
+        agent_cells = state.agent_position[..., 0] * size + \
+            state.agent_position[..., 1]
+        board[agent_games[alive], agent_cells[alive]] = passage
+
+        # Lay bombs. They go at the end of each game's bomb list in agent
+        # order, just like curr_bombs.append.
+        active = state.bomb_mask()
+        bomb_games = np.broadcast_to(
+            np.arange(state.num_games)[:, None], active.shape)
+        bomb_cells = state.bomb_position[..., 0] * size + \
+            state.bomb_position[..., 1]
+        has_bomb = np.zeros((state.num_games, num_cells), dtype=bool)
+        has_bomb[bomb_games[active], bomb_cells[active]] = True
+        lay = alive & (actions == constants.Action.Bomb.value) & \
+            (state.agent_ammo > 0) & ~has_bomb[agent_games, agent_cells]
+        if lay.any():
+            slots = state.num_bombs[:, None] + np.cumsum(lay, axis=1) - 1
+            games, ids = np.nonzero(lay)
+            slots = slots[games, ids]
+            state.agent_ammo[games, ids] -= 1
+            state.bomb_position[games, slots] = state.agent_position[games, ids]
+            state.bomb_bomber[games, slots] = ids
+            state.bomb_life[games, slots] = constants.DEFAULT_BOMB_LIFE + 1
+            state.bomb_blast_strength[games, slots] = \
+                state.agent_blast_strength[games, ids]
+            state.bomb_moving_direction[games, slots] = 0
+            state.num_bombs += lay.sum(axis=1)
+            active = state.bomb_mask()
+            bomb_cells = state.bomb_position[..., 0] * size + \
+                state.bomb_position[..., 1]
+
+        # Desired positions of the agents. Only walls block a move here.
+        next_position = state.agent_position + _ACTION_DELTAS[actions]
+        on_board = ((next_position >= 0) & (next_position < size)).all(-1)
+        next_cells = np.clip(next_position[..., 0], 0, size - 1) * size + \
+            np.clip(next_position[..., 1], 0, size - 1)
+        next_values = board[agent_games, next_cells]
+        moves = alive & on_board & \
+            (actions >= constants.Action.Up.value) & \
+            (actions <= constants.Action.Right.value) & \
+            (next_values != constants.Item.Rigid.value) & \
+            (next_values != constants.Item.Wood.value)
+        desired_agent_cells = np.where(moves, next_cells, agent_cells)
+
+        # Desired positions of the moving bombs.
+        board[bomb_games[active], bomb_cells[active]] = passage
+        next_position = state.bomb_position + \
+            _ACTION_DELTAS[state.bomb_moving_direction]
+        on_board = ((next_position >= 0) & (next_position < size)).all(-1)
+        next_cells = np.clip(next_position[..., 0], 0, size - 1) * size + \
+            np.clip(next_position[..., 1], 0, size - 1)
+        moves = active & on_board & (state.bomb_moving_direction != 0) & \
+            ~_BOMB_BLOCKERS[board[bomb_games, next_cells]]
+        desired_bomb_cells = np.where(moves, next_cells, bomb_cells)
+
+        # Position switches. Every move crosses the border between two cells.
+        # Agent <-> Agent => revert both to previous position.
+        # Bomb <-> Bomb => revert both to previous position.
+        # Agent <-> Bomb => revert Bomb to previous position.
+        def border(cells, desired_cells):
+            '''Numbers the border crossed by moving from cells to desired'''
+            vertical = np.abs(cells - desired_cells) == size
+            return np.where(vertical, np.minimum(cells, desired_cells),
+                            num_cells + np.minimum(cells, desired_cells))
+
+        agent_moves = alive & (desired_agent_cells != agent_cells)
+        agent_borders = border(agent_cells, desired_agent_cells)
+        agent_crossings = count(agent_games[agent_moves],
+                                agent_borders[agent_moves], 2 * num_cells)
+        bomb_moves = active & (desired_bomb_cells != bomb_cells)
+        bomb_borders = border(bomb_cells, desired_bomb_cells)
+        bomb_crossings = count(bomb_games[bomb_moves],
+                               bomb_borders[bomb_moves], 2 * num_cells)
+        crossed = agent_moves & \
+            (agent_crossings[agent_games, agent_borders] > 1)
+        desired_agent_cells[crossed] = agent_cells[crossed]
+        crossed = bomb_moves & (
+            (agent_crossings[bomb_games, bomb_borders] > 0) |
+            (bomb_crossings[bomb_games, bomb_borders] > 1))
+        desired_bomb_cells[crossed] = bomb_cells[crossed]
+
+        # Resolve >=2 agents or >=2 bombs trying to occupy the same space by
+        # reverting everyone involved. Reverting only ever adds occupancy, so
+        # reverting all offenders at once reaches the same fixed point as
+        # ForwardModel.step's sequential loop.
+        agent_occupancy = count(agent_games[alive],
+                                desired_agent_cells[alive], num_cells)
+        bomb_occupancy = count(bomb_games[active],
+                               desired_bomb_cells[active], num_cells)
+
+        def revert_agents(reverted):
+            '''Sends agents back to their cells and occupies them'''
+            desired_agent_cells[reverted] = agent_cells[reverted]
+            np.add.at(agent_occupancy,
+                      (agent_games[reverted], agent_cells[reverted]), 1)
+
+        def revert_bombs(reverted):
+            '''Sends bombs back to their cells and occupies them'''
+            desired_bomb_cells[reverted] = bomb_cells[reverted]
+            np.add.at(bomb_occupancy,
+                      (bomb_games[reverted], bomb_cells[reverted]), 1)
+
+        while True:
+            agents_reverted = alive & \
+                (desired_agent_cells != agent_cells) & (
+                    (agent_occupancy[agent_games, desired_agent_cells] > 1) |
+                    (bomb_occupancy[agent_games, desired_agent_cells] > 1))
+            bombs_reverted = active & \
+                (desired_bomb_cells != bomb_cells) & (
+                    (bomb_occupancy[bomb_games, desired_bomb_cells] > 1) |
+                    (agent_occupancy[bomb_games, desired_bomb_cells] > 1))
+            if not agents_reverted.any() and not bombs_reverted.any():
+                break
+            revert_agents(agents_reverted)
+            revert_bombs(bombs_reverted)
+
+        # Handle kicks. Find the agent, if any, that wants the cell each bomb
+        # wants.
+        agent_at = np.full((state.num_games, num_cells), -1, dtype=np.int64)
+        agent_at[agent_games[alive], desired_agent_cells[alive]] = \
+            agent_ids[alive]
+        kicker = agent_at[bomb_games, desired_bomb_cells]
+        contested = active & (kicker >= 0)
+        kicker = np.maximum(kicker, 0)
+        kicker_moved = desired_agent_cells[bomb_games, kicker] != \
+            agent_cells[bomb_games, kicker]
+
+        # Agent did not move, but the bomb did. The bomb reverts and stops.
+        bomb_blocked = contested & ~kicker_moved & \
+            (desired_bomb_cells != bomb_cells)
+        # The agent moved into the bomb. It kicks the bomb on to the next
+        # cell if it can and that cell never had anything on it.
+        pushes = contested & kicker_moved
+        direction = actions[bomb_games, kicker]
+        target = np.stack(np.divmod(desired_bomb_cells, size), axis=-1) + \
+            _ACTION_DELTAS[direction]
+        on_board = ((target >= 0) & (target < size)).all(-1)
+        target_cells = np.clip(target[..., 0], 0, size - 1) * size + \
+            np.clip(target[..., 1], 0, size - 1)
+        kicked = pushes & state.agent_can_kick[bomb_games, kicker] & \
+            on_board & \
+            (agent_occupancy[bomb_games, target_cells] == 0) & \
+            (bomb_occupancy[bomb_games, target_cells] == 0) & \
+            ~_BOMB_BLOCKERS[board[bomb_games, target_cells]]
+        failed_kicks = pushes & ~kicked
+
+        kicked_by = np.where(kicked, kicker, -1)
+        kicked_bomb = np.full(actions.shape, -1, dtype=np.int64)
+        games, bombs = np.nonzero(kicked)
+        kicked_bomb[games, kicker[games, bombs]] = bombs
+        state.bomb_moving_direction[kicked] = direction[kicked]
+        # Clear the kicked bomb's cell so that the agent can stay on it.
+        bomb_occupancy[bomb_games[kicked], desired_bomb_cells[kicked]] = 0
+
+        # Apply the delayed updates.
+        bombs_reverted = bomb_blocked | failed_kicks
+        agents_reverted = np.zeros(actions.shape, dtype=bool)
+        agents_reverted[bomb_games[failed_kicks], kicker[failed_kicks]] = True
+        revert_bombs(bombs_reverted)
+        desired_bomb_cells[kicked] = target_cells[kicked]
+        np.add.at(bomb_occupancy,
+                  (bomb_games[kicked], target_cells[kicked]), 1)
+        revert_agents(agents_reverted)
+
+        # Late collisions from failed kicks. This loop only runs for games
+        # that had delayed updates, as in ForwardModel.step. A reverted agent
+        # takes back its kick and a reverted kicked bomb takes back its
+        # agent.
+        late = (bombs_reverted | kicked).any(axis=1) | \
+            agents_reverted.any(axis=1)
+        while late.any():
+            agents_reverted = alive & late[:, None] & \
+                (desired_agent_cells != agent_cells) & (
+                    (agent_occupancy[agent_games, desired_agent_cells] > 1) |
+                    (bomb_occupancy[agent_games, desired_agent_cells] != 0))
+            bombs_reverted = active & late[:, None] & \
+                ((desired_bomb_cells != bomb_cells) | (kicked_by >= 0)) & (
+                    (bomb_occupancy[bomb_games, desired_bomb_cells] > 1) |
+                    (agent_occupancy[bomb_games, desired_bomb_cells] != 0))
+            if not agents_reverted.any() and not bombs_reverted.any():
+                break
+
+            games, ids = np.nonzero(agents_reverted & (kicked_bomb >= 0))
+            bombs_reverted[games, kicked_bomb[games, ids]] = True
+            games, bombs = np.nonzero(bombs_reverted & (kicked_by >= 0))
+            agents_reverted[games, kicked_by[games, bombs]] = True
+            kicked_bomb[agents_reverted] = -1
+            kicked_by[bombs_reverted] = -1
+            revert_agents(agents_reverted)
+            revert_bombs(bombs_reverted)
+
+        # Bombs that were not kicked and stay put stop moving.
+        stopped = active & (desired_bomb_cells == bomb_cells) & \
+            (kicked_by < 0)
+        state.bomb_moving_direction[stopped] = 0
+        bomb_cells = desired_bomb_cells
+        state.bomb_position[..., 0], state.bomb_position[..., 1] = \
+            np.divmod(bomb_cells, size)
+
+        # Move the agents and pick up powerups.
+        moved = alive & (desired_agent_cells != agent_cells)
+        agent_cells = desired_agent_cells
+        state.agent_position[..., 0], state.agent_position[..., 1] = \
+            np.divmod(agent_cells, size)
+        picked = np.where(moved, board[agent_games, agent_cells], passage)
+        extra_bomb = picked == constants.Item.ExtraBomb.value
+        state.agent_ammo[extra_bomb] = np.minimum(
+            state.agent_ammo[extra_bomb] + 1, 10)
+        incr_range = picked == constants.Item.IncrRange.value
+        state.agent_blast_strength[incr_range] = np.minimum(
+            state.agent_blast_strength[incr_range] + 1,
+            max_blast_strength)
+        state.agent_can_kick[picked == constants.Item.Kick.value] = True
+
+        # Explode bombs.
+        state.bomb_life[active] -= 1
+        exploding = active & (state.bomb_life == 0)
+        in_flames = active & ~exploding & \
+            (board[bomb_games, bomb_cells] == flames_value)
+        state.bomb_life[in_flames] = 0
+        exploding |= in_flames
+
+        # Chain the explosions.
+        exploded_map = np.zeros(state.board.shape, dtype=bool)
+        remaining = active.copy()
+        while exploding.any():
+            games, bombs = np.nonzero(exploding)
+            refunds = count(games, state.bomb_bomber[games, bombs],
+                            state.num_agents)
+            refunded = refunds > 0
+            state.agent_ammo[refunded] = np.minimum(
+                state.agent_ammo[refunded] + refunds[refunded], 10)
+            exploded_map.reshape(-1)[_blast_footprint(
+                board.reshape(-1), size, bomb_cells[games, bombs],
+                state.bomb_blast_strength[games, bombs],
+                games * num_cells)] = True
+
+            remaining &= ~exploding
+            exploding = remaining & exploded_map.reshape(
+                state.num_games, num_cells)[bomb_games, bomb_cells]
+            state.bomb_life[exploding] = 0
+
+        # Drop the exploded bombs, keeping the rest in the order laid.
+        state.keep_bombs(remaining)
+
+        # Update the board's bombs and flames.
+        board[bomb_games[remaining], bomb_cells[remaining]] = \
+            constants.Item.Bomb.value
+        state.flames[exploded_map] |= 4
+        state.board[state.flames != 0] = flames_value
+
+        # Kill agents on flames. Otherwise, update position on the board.
+        on_fire = alive & (board[agent_games, agent_cells] == flames_value)
+        state.agent_alive[on_fire] = False
+        standing = alive & ~on_fire
+        board[agent_games[standing], agent_cells[standing]] = \
+            constants.Item.Agent0.value + agent_ids[standing]
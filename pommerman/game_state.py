@@ -0,0 +1,340 @@
+'''Struct-of-arrays storage of the game state.
+
+The engine steps these arrays directly, while characters.Bomber and
+characters.Bomb can be bound to them as thin views so that the agent API
+keeps working.
+'''
+import types
+
+import numpy as np
+
+from . import characters
+from . import constants
+from . import zobrist
+
+
+# The attribute arrays of the agents and of the bombs. Copying a GameState
+# copies exactly these plus the grids.
+AGENT_ARRAYS = ['agent_position', 'agent_alive', 'agent_ammo',
+                'agent_blast_strength', 'agent_can_kick']
+BOMB_ARRAYS = ['bomb_position', 'bomb_bomber', 'bomb_life',
+               'bomb_blast_strength', 'bomb_moving_direction']
+GRID_ARRAYS = ['board', 'items', 'flames']
+ALL_ARRAYS = GRID_ARRAYS + AGENT_ARRAYS + BOMB_ARRAYS + ['num_bombs']
+
+# The dtype of the bomb and flame maps for each obs_dtype of the envs. The
+# compact maps hold the same small integers in a byte per cell.
+OBS_DTYPES = {'float64': np.float64, 'compact': np.uint8}
+
+# The flame life seen in observations for each flames bitmask, per dtype.
+_FLAME_LIFE = {
+    np.dtype(dtype): np.array([value.bit_length() for value in range(256)],
+                              dtype=dtype)
+    for dtype in OBS_DTYPES.values()
+}
+
+
+class GameState(object):
+    """The state of one or more games with the same shape.
+
+    All attributes are arrays with a leading axis over the games:
+      - board: (N, board_size, board_size) uint8 of Item values.
+      - items: (N, board_size, board_size) uint8 with the powerup hidden under
+        each cell, 0 where there is none.
+      - flames: (N, board_size, board_size) uint8 bitmask where bit k is set
+        if a flame with life k is on that cell. A cell can carry flames of up
+        to three different ages, just like a list of characters.Flame.
+      - agent_*: (N, num_agents) attributes indexed by agent_id. Positions
+        have a trailing (row, col) axis.
+      - bomb_*: (N, bomb_capacity) attributes. The live bombs of game n are
+        the first num_bombs[n] entries in the order they were laid. A moving
+        direction of 0 means the bomb is not moving.
+
+    A Pomme env keeps its game in a GameState with a single game.
+    """
+
+    def __init__(self, board_size, num_agents, num_games=1,
+                 bomb_capacity=None):
+        self.board_size = board_size
+        self.num_agents = num_agents
+        self.num_games = num_games
+        # Two bombs never share a cell, so a bomb per cell is always enough.
+        self.bomb_capacity = bomb_capacity or board_size**2
+
+        shape = (num_games, board_size, board_size)
+        self.board = np.zeros(shape, dtype=np.uint8)
+        self.items = np.zeros(shape, dtype=np.uint8)
+        self.flames = np.zeros(shape, dtype=np.uint8)
+
+        self.agent_position = np.zeros((num_games, num_agents, 2),
+                                       dtype=np.int64)
+        self.agent_alive = np.zeros((num_games, num_agents), dtype=bool)
+        self.agent_ammo = np.zeros((num_games, num_agents), dtype=np.int64)
+        self.agent_blast_strength = np.zeros((num_games, num_agents),
+                                             dtype=np.int64)
+        self.agent_can_kick = np.zeros((num_games, num_agents), dtype=bool)
+
+        capacity = self.bomb_capacity
+        self.num_bombs = np.zeros(num_games, dtype=np.int64)
+        self.bomb_position = np.zeros((num_games, capacity, 2), dtype=np.int64)
+        self.bomb_bomber = np.zeros((num_games, capacity), dtype=np.int64)
+        self.bomb_life = np.zeros((num_games, capacity), dtype=np.int64)
+        self.bomb_blast_strength = np.zeros((num_games, capacity),
+                                            dtype=np.int64)
+        self.bomb_moving_direction = np.zeros((num_games, capacity),
+                                              dtype=np.int64)
+
+    def copy(self):
+        """Returns an independent copy of this state."""
+        ret = GameState.__new__(GameState)
+        ret.__dict__.update(self.__dict__)
+        for name in ALL_ARRAYS:
+            setattr(ret, name, getattr(self, name).copy())
+        return ret
+
+    def snapshot(self, index=0):
+        """Returns a read-only copy of game `index` as a single game state."""
+        ret = GameState.__new__(GameState)
+        ret.__dict__.update(self.__dict__)
+        ret.num_games = 1
+        for name in ALL_ARRAYS:
+            array = getattr(self, name)[index:index + 1].copy()
+            array.setflags(write=False)
+            setattr(ret, name, array)
+        return ret
+
+    def restore(self, snapshot, index=0):
+        """Overwrites game `index` with the single game state `snapshot`.
+
+        The arrays are written in place, so bound characters stay valid.
+        """
+        if snapshot.board_size != self.board_size or \
+           snapshot.num_agents != self.num_agents:
+            raise ValueError('The snapshot is of a different game shape.')
+        for name in ALL_ARRAYS:
+            getattr(self, name)[index] = getattr(snapshot, name)[0]
+
+    def __getstate__(self):
+        # Only the live bombs are pickled, the rest of the bomb arrays is
+        # padding up to bomb_capacity.
+        ret = dict(self.__dict__)
+        num_bombs = int(self.num_bombs.max(initial=0))
+        for name in BOMB_ARRAYS:
+            ret[name] = ret[name][:, :num_bombs]
+        ret['_read_only'] = not self.board.flags.writeable
+        return ret
+
+    def __setstate__(self, state):
+        state = dict(state)
+        read_only = state.pop('_read_only', False)
+        self.__dict__.update(state)
+        for name in BOMB_ARRAYS:
+            array = getattr(self, name)
+            padded = np.zeros(
+                (self.num_games, self.bomb_capacity) + array.shape[2:],
+                dtype=array.dtype)
+            padded[:, :array.shape[1]] = array
+            setattr(self, name, padded)
+        if read_only:
+            for name in ALL_ARRAYS:
+                getattr(self, name).setflags(write=False)
+
+    def bomb_mask(self):
+        """Returns the (N, bomb_capacity) mask of the live bombs."""
+        return np.arange(self.bomb_capacity)[None, :] < \
+            self.num_bombs[:, None]
+
+    def keep_bombs(self, keep):
+        """Drops the bombs not in the (N, bomb_capacity) mask `keep`.
+
+        The kept bombs stay in the order they were laid.
+        """
+        keep = keep & self.bomb_mask()
+        order = np.argsort(~keep, axis=1, kind='stable')
+        for name in BOMB_ARRAYS:
+            array = getattr(self, name)
+            index = order if array.ndim == 2 else order[..., None]
+            setattr(self, name, np.take_along_axis(array, index, axis=1))
+        self.num_bombs = keep.sum(axis=1)
+
+    @classmethod
+    def from_envs(cls, envs):
+        """Stacks the games of several Pomme envs into one GameState."""
+        states = [env._state for env in envs]
+        ret = cls(states[0].board_size, states[0].num_agents, len(states),
+                  states[0].bomb_capacity)
+        for name in ALL_ARRAYS:
+            setattr(ret, name,
+                    np.concatenate([getattr(state, name)
+                                    for state in states]))
+        return ret
+
+    def to_env(self, index, env):
+        """Writes game `index` into a Pomme env."""
+        for name in ALL_ARRAYS:
+            getattr(env._state, name)[0] = getattr(self, name)[index]
+
+    def set_game(self, index, board, agents, bombs, items, flames):
+        """Loads game `index` from the objects used by ForwardModel.step."""
+        self.board[index] = board
+        self.set_items(index, items)
+        self.set_flames(index, flames)
+        self.set_bombs(index, bombs)
+        for agent in agents:
+            id_ = agent.agent_id
+            self.agent_position[index, id_] = agent.position
+            self.agent_alive[index, id_] = agent.is_alive
+            self.agent_ammo[index, id_] = agent.ammo
+            self.agent_blast_strength[index, id_] = agent.blast_strength
+            self.agent_can_kick[index, id_] = agent.can_kick
+
+    def get_game(self, index, agents):
+        """Unpacks game `index` into the objects used by ForwardModel.step.
+
+        The agents are updated in place. The bombs and flames are new objects
+        independent of this state.
+
+        Returns:
+          board: A copy of the board.
+          bombs: The list of characters.Bomb in the order they were laid.
+          items: The dict of hidden items by position.
+          flames: The list of characters.Flame, oldest first.
+        """
+        for agent in agents:
+            id_ = agent.agent_id
+            # Write through to the character behind a BaseAgent.
+            character = getattr(agent, '_character', agent)
+            character.position = tuple(
+                int(x) for x in self.agent_position[index, id_])
+            character.is_alive = bool(self.agent_alive[index, id_])
+            character.ammo = int(self.agent_ammo[index, id_])
+            character.blast_strength = int(
+                self.agent_blast_strength[index, id_])
+            character.can_kick = bool(self.agent_can_kick[index, id_])
+
+        bombs = [
+            characters.Bomb(bomb.bomber, bomb.position, bomb.life,
+                            bomb.blast_strength, bomb.moving_direction)
+            for bomb in self.get_bombs(index, agents)
+        ]
+        return (self.board[index].copy(), bombs, self.get_items(index),
+                self.get_flames(index))
+
+    def get_observation_maps(self, index, dtype=np.float64):
+        """Makes the unfogged bomb and flame maps of game `index`.
+
+        This is ForwardModel.get_observation_maps straight from the arrays.
+        """
+        board_size = self.board_size
+        num_bombs = self.num_bombs[index]
+        rows, cols = self.bomb_position[index, :num_bombs].T
+        ret = {}
+        for name in ['bomb_blast_strength', 'bomb_life',
+                     'bomb_moving_direction']:
+            ret[name] = np.zeros((board_size, board_size), dtype=dtype)
+            ret[name][rows, cols] = getattr(self, name)[index, :num_bombs]
+        # The observed flame life is one more than the life of the newest
+        # flame of the cell, the highest set bit of its mask.
+        ret['flame_life'] = _FLAME_LIFE[np.dtype(dtype)][self.flames[index]]
+        return ret
+
+    def get_bombs(self, index, agents):
+        """Returns views of the bombs of game `index`.
+
+        The views read and write this state, and are only valid until the
+        bombs of the game are next added or removed, e.g. by a step.
+        """
+        agents_by_id = {agent.agent_id: agent for agent in agents}
+        return [
+            characters.Bomb.view(
+                agents_by_id[int(self.bomb_bomber[index, num])], self,
+                (index, num)) for num in range(self.num_bombs[index])
+        ]
+
+    def set_bombs(self, index, bombs):
+        '''Replaces the bombs of game `index`'''
+        self.num_bombs[index] = len(bombs)
+        for num, bomb in enumerate(bombs):
+            self.bomb_position[index, num] = bomb.position
+            self.bomb_bomber[index, num] = bomb.bomber.agent_id
+            self.bomb_life[index, num] = bomb.life
+            self.bomb_blast_strength[index, num] = bomb.blast_strength
+            self.bomb_moving_direction[index, num] = 0 \
+                if bomb.moving_direction is None \
+                else constants.Action(bomb.moving_direction).value
+
+    def get_items(self, index):
+        '''Returns the dict of hidden items of game `index` by position'''
+        rows, cols = np.nonzero(self.items[index])
+        return {(int(r), int(c)): int(self.items[index, r, c])
+                for r, c in zip(rows, cols)}
+
+    def set_items(self, index, items):
+        '''Replaces the hidden items of game `index`'''
+        self.items[index] = 0
+        for position, item_value in items.items():
+            self.items[index][tuple(position)] = item_value
+
+    def get_flames(self, index):
+        '''Returns the flames of game `index`, oldest first'''
+        flames = []
+        for life in range(int(self.flames[index].max()).bit_length()):
+            rows, cols = np.nonzero(self.flames[index] & (1 << life))
+            flames.extend(
+                characters.Flame((int(r), int(c)), life)
+                for r, c in zip(rows, cols))
+        return flames
+
+    def set_flames(self, index, flames):
+        '''Replaces the flames of game `index`'''
+        self.flames[index] = 0
+        for flame in flames:
+            self.flames[index][tuple(flame.position)] |= 1 << flame.life
+
+
+class Snapshot(object):
+    """An immutable snapshot of a Pomme env, made by Pomme.get_state.
+
+    Attributes:
+      state: A read-only GameState holding the game.
+      step_count: The step count of the env.
+      info: A read-only dict of whatever else the env needs to resume, e.g.
+        the collapse schedule of v1 or the radio messages of v2.
+    """
+    __slots__ = ['state', 'step_count', 'info', '_state_hash']
+
+    def __init__(self, state, step_count, info=None, state_hash=None):
+        # state_hash is a zobrist.StateHash of the state, or None to make it
+        # when first asked for.
+        object.__setattr__(self, 'state', state)
+        object.__setattr__(self, 'step_count', step_count)
+        object.__setattr__(self, 'info',
+                           types.MappingProxyType(dict(info or {})))
+        object.__setattr__(self, '_state_hash', state_hash)
+
+    def state_hash(self):
+        '''Returns the zobrist hash of the game, see Pomme.state_hash'''
+        return self._get_state_hash().value
+
+    def get_state_hash(self):
+        '''Returns a new zobrist.StateHash of the game'''
+        return self._get_state_hash().copy()
+
+    def _get_state_hash(self):
+        '''Returns the StateHash of the game, making it on first use'''
+        if self._state_hash is None:
+            object.__setattr__(
+                self, '_state_hash',
+                zobrist.StateHash(self.state, 0, self.step_count))
+        return self._state_hash
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Snapshot is immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('Snapshot is immutable.')
+
+    def __reduce__(self):
+        # The read-only info proxy cannot be pickled, its dict can.
+        return (Snapshot, (self.state, self.step_count, dict(self.info),
+                           self._state_hash))
@@ -223,6 +223,12 @@ raised or not)"""
     )
     env.reset()
     env._board = numpy.array(replay_obj["board"])
+    # Note: Matches recorded before the items were kept replay without them
+    if "items" in replay_obj:
+        env._items = {
+            tuple(position): value
+            for position, value in replay_obj["items"]
+        }
     # Note: Render FPS is set to 30 as it'll be smoother
     env._render_fps = 30
     for i in replay_obj["actions"]:
@@ -65,12 +65,15 @@ def thread(players, queue_subproc, mode):
     obs = env.reset()
     record = {
         "board": numpy.array(env._board, copy=True).tolist(),
+        "items": [[list(position), value]
+                  for position, value in env._items.items()],
         "actions": [],
         "mode": str(mode)
     }
     done = False
     while not done:
-        obs_res = resolve_classes(obs.copy())
+        obs_res = resolve_classes(
+            [pommerman.observation.materialize(agent_obs) for agent_obs in obs])
         turn_id = str(uuid.uuid4())[:5]
         try:
             obs_bytes = []
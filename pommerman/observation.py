@@ -0,0 +1,89 @@
+'''Observations that compute their fields on first access.'''
+from collections.abc import MutableMapping
+
+
+class Lazy(object):
+    """A field of an Observation that is computed by make() when first read.
+
+    Args:
+      make: The callable computing the field.
+      source: The array make copies, if make just copies one. Readers that
+        do not keep the field can read it instead, see peek.
+    """
+    __slots__ = ['make', 'source']
+
+    def __init__(self, make, source=None):
+        self.make = make
+        self.source = source
+
+
+class Observation(MutableMapping):
+    """An agent's observation, used like the dict it replaces.
+
+    Fields given as Lazy are computed from the step's shared maps the first
+    time they are read and then cached, so agents only pay for what they look
+    at. Serialization paths should call `materialize` to get a plain dict.
+    """
+    __slots__ = ['_fields']
+
+    def __init__(self, fields=None):
+        self._fields = dict(fields or {})
+
+    def __getitem__(self, key):
+        value = self._fields[key]
+        if type(value) is Lazy:
+            value = self._fields[key] = value.make()
+        return value
+
+    def __setitem__(self, key, value):
+        self._fields[key] = value
+
+    def __delitem__(self, key):
+        del self._fields[key]
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.materialize())
+
+    def copy(self):
+        '''Returns a shallow copy that shares the fields not computed yet'''
+        return Observation(self._fields)
+
+    def materialize(self):
+        '''Computes every field and returns them as a plain dict'''
+        return {key: self[key] for key in self._fields}
+
+    def peek(self, key):
+        """Returns a field for reading only, without copying it if possible.
+
+        A field not computed yet that is a copy of an array, e.g. a map
+        shared by all the agents, is read from that array. Writing to it
+        would change the other observations too. Other fields are read as
+        usual.
+        """
+        value = self._fields[key]
+        if type(value) is Lazy and value.source is not None:
+            return value.source
+        return self[key]
+
+
+def materialize(obs):
+    '''Returns obs as a plain dict, whether it is an Observation or not'''
+    if isinstance(obs, Observation):
+        return obs.materialize()
+    return obs
+
+
+def peek(obs, key):
+    '''Returns obs[key] for reading only, see Observation.peek'''
+    if isinstance(obs, Observation):
+        return obs.peek(key)
+    return obs[key]
@@ -0,0 +1,122 @@
+'''Recording games to a single append-only file.
+
+A GameRecorder writes a new file and appends the state of an env to it
+each time record is called. The game thread only takes a game_state.Snapshot. A
+background thread turns the snapshots into records and writes them, so
+recording costs the game loop little more than get_state.
+
+A recording is either JSON lines, one compact get_json_info object per
+line, or records of state_file. export_json turns either into the
+game_state.json file of utility.join_json_state.
+'''
+import json
+import queue
+import threading
+
+from . import state_file
+from . import utility
+
+# Put on the queue to stop the writer thread.
+_STOP = object()
+
+
+class GameRecorder(object):
+    """Appends the states of an env to a file from a background thread.
+
+    Args:
+      env: The Pomme env to record.
+      path: The file to write. An existing file is replaced.
+      binary: Whether to write state_file records rather than JSON lines.
+      queue_size: The number of states that can wait to be written before
+        record blocks.
+    """
+
+    def __init__(self, env, path, binary=False, queue_size=256):
+        self._env = env
+        self._binary = binary
+        self._file = open(path, 'wb' if binary else 'w')
+        self._snapshots = queue.Queue(queue_size)
+        self._error = None
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._writer.start()
+
+    def record(self):
+        '''Queues the current state of the env to be written'''
+        if self._error is not None:
+            raise self._error
+        self._snapshots.put(self._env.get_state())
+
+    def close(self):
+        '''Writes the queued states and closes the file'''
+        if self._writer is not None:
+            self._snapshots.put(_STOP)
+            self._writer.join()
+            self._writer = None
+            self._file.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write(self):
+        '''Writes the queued states until close'''
+        while True:
+            snapshot = self._snapshots.get()
+            if snapshot is _STOP:
+                break
+            if self._error is not None:
+                continue
+            try:
+                if self._binary:
+                    self._file.write(state_file.encode(snapshot))
+                else:
+                    self._file.write(
+                        json.dumps(
+                            self._env._json_info(snapshot),
+                            cls=utility.PommermanJSONEncoder,
+                            separators=(',', ':')) + '\n')
+            except Exception as error:  # pylint: disable=broad-except
+                # Raised on the game thread by the next record or close.
+                self._error = error
+
+
+def read_json_lines(path):
+    '''Returns the get_json_info dicts of a JSON lines recording'''
+    states = []
+    with open(path) as f:
+        for line in f:
+            fields = json.loads(line)
+            states.append({
+                key: json.dumps(value, cls=utility.PommermanJSONEncoder)
+                for key, value in fields.items()
+            })
+    return states
+
+
+def export_json(path, out_path, agents, finished_at, config, info, env=None):
+    """Writes a recording as a game_state.json file.
+
+    Args:
+      path: The recording of a GameRecorder.
+      out_path: The game_state.json file to write.
+      agents, finished_at, config, info: See utility.make_game_json.
+      env: An env of the recorded config, needed for binary recordings.
+    """
+    if state_file.is_state_file(path):
+        states = [
+            env.get_json_info(snapshot)
+            for snapshot in state_file.load(path)
+        ]
+    else:
+        states = read_json_lines(path)
+    with open(out_path, 'w') as f:
+        f.write(
+            json.dumps(
+                utility.make_game_json(agents, finished_at, config, info,
+                                       states),
+                sort_keys=True,
+                indent=4))
@@ -0,0 +1,210 @@
+'''A compact replay format with keyframes for seeking.
+
+A replay is a header, the initial game, the joint action of every step, and a
+keyframe of the whole game every keyframe_interval steps:
+  - the header: the magic b'POMR', the format version, the keyframe interval,
+    the number of agents, the bytes per agent action, whether there is a
+    seed, the seed, and the length of the config id, then the config id.
+  - the initial game as a state_file record, the items under the wood
+    included, so the replay does not depend on how boards are generated.
+  - for each step, the action of each agent in action size bytes: the action,
+    then the radio words in v2. After every keyframe_interval steps, the
+    game after that step as a state_file record.
+
+Replay.seek restores the last keyframe at or before a step and steps the env
+forward from there, so seeking never steps more than keyframe_interval - 1
+times whatever the length of the game.
+
+    writer = replay.ReplayWriter(env, 'game.replay', seed=seed)
+    while not done:
+        actions = env.act(obs)
+        obs, reward, done, info = env.step(actions)
+        writer.record(actions)
+    writer.close()
+
+    game = replay.load('game.replay')
+    env = pommerman.make(game.config, [agents.BaseAgent() for _ in range(4)])
+    obs = game.seek(env, 700)
+'''
+import struct
+
+import numpy as np
+
+from . import state_file
+
+MAGIC = b'POMR'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHHBBBQH')
+
+
+def _pack_actions(actions, action_size):
+    '''Packs a joint action into num_agents * action_size bytes'''
+    values = []
+    for action in actions:
+        if isinstance(action, (list, tuple)):
+            action = [int(value) for value in action[:action_size]]
+        else:
+            action = [int(action)]
+        values.extend(action + [0] * (action_size - len(action)))
+    if not all(0 <= value <= 255 for value in values):
+        raise ValueError('An action does not fit in a byte.')
+    return bytes(values)
+
+
+class ReplayWriter(object):
+    """Writes the replay of a game as it is played.
+
+    Make it right after env.reset, and call record after every env.step.
+
+    Args:
+      env: The Pomme env playing the game.
+      path: The file to write.
+      config: The config id of the env. Defaults to the id of its gym spec.
+      seed: The seed of the game, kept in the header for reference.
+      keyframe_interval: The number of steps between keyframes.
+    """
+
+    def __init__(self, env, path, config=None, seed=None,
+                 keyframe_interval=50):
+        if config is None:
+            config = env.spec.id
+        self._env = env
+        self._num_agents = len(env._agents)
+        self._action_size = 1 + (getattr(env, '_radio_num_words', 0) or 0)
+        self._keyframe_interval = keyframe_interval
+        self._num_steps = 0
+        config = config.encode('utf8')
+        self._file = open(path, 'wb')
+        self._file.write(
+            _HEADER.pack(MAGIC, VERSION, keyframe_interval, self._num_agents,
+                         self._action_size, seed is not None, seed or 0,
+                         len(config)) + config)
+        self._file.write(state_file.encode(env.get_state()))
+
+    def record(self, actions):
+        '''Writes the joint action of the step the env just took'''
+        self._file.write(_pack_actions(actions, self._action_size))
+        self._num_steps += 1
+        if self._num_steps % self._keyframe_interval == 0:
+            self._file.write(state_file.encode(self._env.get_state()))
+
+    def close(self):
+        '''Closes the file'''
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Replay(object):
+    """A decoded replay.
+
+    Attributes:
+      config: The config id of the game.
+      seed: The seed of the game, or None if it was not given.
+      keyframe_interval: The number of steps between keyframes.
+      num_agents: The number of agents.
+      actions: The joint action of each step, as passed to env.step.
+      keyframes: The game_state.Snapshots of the game after 0,
+        keyframe_interval, 2 * keyframe_interval... steps.
+    """
+
+    def __init__(self, config, seed, keyframe_interval, num_agents, actions,
+                 keyframes):
+        self.config = config
+        self.seed = seed
+        self.keyframe_interval = keyframe_interval
+        self.num_agents = num_agents
+        self.actions = actions
+        self.keyframes = keyframes
+
+    @property
+    def num_steps(self):
+        '''The number of steps of the game'''
+        return len(self.actions)
+
+    def seek(self, env, step):
+        """Sets env to the game after `step` steps of the replay.
+
+        Args:
+          env: A Pomme env of the config of the replay.
+          step: The number of steps played, from 0 to num_steps.
+
+        Returns:
+          The observations of the agents.
+        """
+        if not 0 <= step <= self.num_steps:
+            raise ValueError('Step {} is not in the replay of {} steps.'.format(
+                step, self.num_steps))
+        keyframe = min(step // self.keyframe_interval,
+                       len(self.keyframes) - 1)
+        env.set_state(self.keyframes[keyframe])
+        obs = env.get_observations()
+        for num in range(keyframe * self.keyframe_interval, step):
+            obs = env.step(self.actions[num])[0]
+        return obs
+
+
+def decode(data):
+    """Decodes a replay written by ReplayWriter.
+
+    A replay cut short, e.g. by a crash, decodes up to its last full step.
+
+    Raises:
+      ValueError: If data is not a replay of this version.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError('Truncated replay.')
+    magic, version, keyframe_interval, num_agents, action_size, has_seed, \
+        seed, config_size = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a replay.')
+    if version != VERSION:
+        raise ValueError('Replay version {} is not supported, only {}.'.format(
+            version, VERSION))
+    offset = _HEADER.size + config_size
+    config = bytes(data[_HEADER.size:offset]).decode('utf8')
+    snapshot, offset = state_file.decode(data, offset)
+    keyframes = [snapshot]
+
+    frame_size = num_agents * action_size
+    chunk_size = keyframe_interval * frame_size
+    chunks = []
+    while offset < len(data):
+        num_frames = min(len(data) - offset, chunk_size) // frame_size
+        chunks.append(
+            np.frombuffer(
+                data, dtype=np.uint8, count=num_frames * frame_size,
+                offset=offset).reshape(num_frames, num_agents, action_size))
+        offset += chunk_size
+        if offset >= len(data):
+            break
+        try:
+            snapshot, offset = state_file.decode(data, offset)
+        except ValueError:
+            break
+        keyframes.append(snapshot)
+
+    actions = np.concatenate(chunks) if chunks else np.zeros(
+        (0, num_agents, action_size), dtype=np.uint8)
+    actions = actions.tolist()
+    if action_size == 1:
+        actions = [[action[0] for action in step] for step in actions]
+    return Replay(config, seed if has_seed else None, keyframe_interval,
+                  num_agents, actions, keyframes)
+
+
+def load(path):
+    '''Returns the Replay in a file written by ReplayWriter'''
+    with open(path, 'rb') as f:
+        return decode(f.read())
+
+
+def is_replay(path):
+    '''Returns whether path starts with a replay header'''
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
@@ -9,6 +9,17 @@ from flask import Flask, jsonify, request
 LOGGER = logging.getLogger(__name__)
 
 
+def _decode_map(value):
+    '''Decodes a map of the obs JSON, keeping compact maps compact.
+
+    Float maps arrive as JSON floats and compact ones as JSON ints.
+    '''
+    value = np.array(value)
+    if value.dtype.kind in 'iu':
+        return value.astype(np.uint8)
+    return value.astype(np.float64)
+
+
 class DockerAgentRunner(metaclass=abc.ABCMeta):
     """Abstract base class to implement Docker-based agent"""
 
@@ -36,8 +47,10 @@ class DockerAgentRunner(metaclass=abc.ABCMeta):
                 observation['enemies'][enemy_id] = constants.Item(observation['enemies'][enemy_id])
             observation['position'] = tuple(observation['position'])
             observation['board'] = np.array(observation['board'], dtype=np.uint8)
-            observation['bomb_life'] = np.array(observation['bomb_life'], dtype=np.float64)
-            observation['bomb_blast_strength'] = np.array(observation['bomb_blast_strength'], dtype=np.float64)
+            for key in ['bomb_blast_strength', 'bomb_life',
+                        'bomb_moving_direction', 'flame_life']:
+                if key in observation:
+                    observation[key] = _decode_map(observation[key])
 
             action_space = data.get("action_space")
             action_space = json.loads(action_space)
@@ -0,0 +1,201 @@
+'''A compact binary format for the game states of the Pomme envs.
+
+A state is one record of little-endian fields:
+  - the header: the magic b'POMS', the format version, the board size, the
+    number of agents, the step count, the number of bombs, flags telling
+    whether the v1 collapses and the v2 radio follow, the number of collapses,
+    and the number of radio senders and words per message.
+  - the board, the items and the flames grids of game_state.GameState, each
+    board_size**2 bytes in row-major order.
+  - one (row, col, is_alive, ammo, blast_strength, can_kick) byte record per
+    agent, then the intended action of each agent as a byte.
+  - one (row, col, bomber_id, life, blast_strength, moving_direction) byte
+    record per bomb, in the order they were laid.
+  - the step of each collapse of v1 as a uint32.
+  - the message last sent by each of Agent0, Agent1... in v2, a byte per word.
+
+A file is just records one after the other, so a scenario corpus is one
+file, and states can be appended. Records decode to game_state.Snapshots,
+which Pomme.set_state loads, e.g. through `--game_state_file`.
+'''
+import struct
+
+import numpy as np
+
+from . import constants
+from . import game_state
+
+MAGIC = b'POMS'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHBBIHBBBB')
+_HAS_COLLAPSES = 1
+_HAS_RADIO = 2
+_AGENT_RECORD = 6
+_BOMB_RECORD = 6
+_COLLAPSE_DTYPE = np.dtype('<u4')
+
+
+def encode(snapshot):
+    """Encodes a game_state.Snapshot of a Pomme env as a record.
+
+    Intended actions that are lists, as in v2, keep only their first action.
+
+    Returns:
+      The bytes of the record.
+
+    Raises:
+      ValueError: If an agent or bomb attribute does not fit in a byte.
+    """
+    state = snapshot.state
+    info = snapshot.info
+    num_bombs = int(state.num_bombs[0])
+    collapses = info.get('collapses')
+    radio = info.get('radio_from_agent')
+
+    agents = np.column_stack([
+        state.agent_position[0], state.agent_alive[0], state.agent_ammo[0],
+        state.agent_blast_strength[0], state.agent_can_kick[0]
+    ])
+    bombs = np.column_stack([
+        state.bomb_position[0, :num_bombs], state.bomb_bomber[0, :num_bombs],
+        state.bomb_life[0, :num_bombs],
+        state.bomb_blast_strength[0, :num_bombs],
+        state.bomb_moving_direction[0, :num_bombs]
+    ])
+    intended_actions = [
+        action[0] if isinstance(action, (list, tuple)) else action
+        for action in info.get('intended_actions') or []
+    ] or [0] * state.num_agents
+    for name, values in [('agent', agents), ('bomb', bombs),
+                         ('intended action', intended_actions)]:
+        if len(values) and not 0 <= np.min(values) <= np.max(values) <= 255:
+            raise ValueError(
+                'A {} attribute does not fit in a byte.'.format(name))
+
+    flags = 0
+    parts = []
+    if collapses is not None:
+        flags |= _HAS_COLLAPSES
+        parts.append(np.asarray(collapses, dtype=_COLLAPSE_DTYPE).tobytes())
+    radio_num_words = 0
+    if radio is not None:
+        flags |= _HAS_RADIO
+        messages = [
+            radio[agent] for agent in sorted(radio, key=lambda x: x.value)
+        ]
+        radio_num_words = len(messages[0]) if messages else 0
+        parts.append(np.asarray(messages, dtype=np.uint8).tobytes())
+
+    header = _HEADER.pack(MAGIC, VERSION, state.board_size, state.num_agents,
+                          snapshot.step_count, num_bombs, flags,
+                          len(collapses or []), len(radio or {}),
+                          radio_num_words)
+    return b''.join([
+        header, state.board[0].tobytes(), state.items[0].tobytes(),
+        state.flames[0].tobytes(),
+        agents.astype(np.uint8).tobytes(),
+        np.asarray(intended_actions, dtype=np.uint8).tobytes(),
+        bombs.astype(np.uint8).tobytes()
+    ] + parts)
+
+
+def decode(data, offset=0):
+    """Decodes the record starting at data[offset].
+
+    Args:
+      data: The bytes holding the record.
+      offset: Where the record starts in data.
+
+    Returns:
+      snapshot: The game_state.Snapshot of the record.
+      offset: Where the record ends in data.
+
+    Raises:
+      ValueError: If there is no record of this version at offset.
+    """
+    if len(data) - offset < _HEADER.size:
+        raise ValueError('Truncated game state record.')
+    magic, version, board_size, num_agents, step_count, num_bombs, flags, \
+        num_collapses, num_radio, radio_num_words = \
+        _HEADER.unpack_from(data, offset)
+    if magic != MAGIC:
+        raise ValueError('Not a game state record.')
+    if version != VERSION:
+        raise ValueError(
+            'Game state record version {} is not supported, only {}.'.format(
+                version, VERSION))
+    offset += _HEADER.size
+
+    def read(dtype, count, shape=None):
+        '''Reads count values of dtype at offset'''
+        nonlocal offset
+        ret = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += ret.nbytes
+        return ret if shape is None else ret.reshape(shape)
+
+    num_cells = board_size**2
+    state = game_state.GameState(board_size, num_agents)
+    for name in game_state.GRID_ARRAYS:
+        getattr(state, name)[0] = read(np.uint8, num_cells,
+                                       (board_size, board_size))
+
+    agents = read(np.uint8, num_agents * _AGENT_RECORD,
+                  (num_agents, _AGENT_RECORD))
+    state.agent_position[0] = agents[:, :2]
+    state.agent_alive[0] = agents[:, 2]
+    state.agent_ammo[0] = agents[:, 3]
+    state.agent_blast_strength[0] = agents[:, 4]
+    state.agent_can_kick[0] = agents[:, 5]
+    info = {'intended_actions': read(np.uint8, num_agents).tolist()}
+
+    bombs = read(np.uint8, num_bombs * _BOMB_RECORD,
+                 (num_bombs, _BOMB_RECORD))
+    state.num_bombs[0] = num_bombs
+    state.bomb_position[0, :num_bombs] = bombs[:, :2]
+    state.bomb_bomber[0, :num_bombs] = bombs[:, 2]
+    state.bomb_life[0, :num_bombs] = bombs[:, 3]
+    state.bomb_blast_strength[0, :num_bombs] = bombs[:, 4]
+    state.bomb_moving_direction[0, :num_bombs] = bombs[:, 5]
+
+    if flags & _HAS_COLLAPSES:
+        info['collapses'] = tuple(
+            read(_COLLAPSE_DTYPE, num_collapses).tolist())
+    if flags & _HAS_RADIO:
+        messages = read(np.uint8, num_radio * radio_num_words,
+                        (num_radio, radio_num_words)).tolist()
+        info['radio_from_agent'] = {
+            constants.Item(constants.Item.Agent0.value + num): tuple(message)
+            for num, message in enumerate(messages)
+        }
+    for name in game_state.ALL_ARRAYS:
+        getattr(state, name).setflags(write=False)
+    return game_state.Snapshot(state, step_count, info), offset
+
+
+def decode_all(data):
+    '''Decodes all the records in data into a list of Snapshots'''
+    ret = []
+    offset = 0
+    while offset < len(data):
+        snapshot, offset = decode(data, offset)
+        ret.append(snapshot)
+    return ret
+
+
+def save(path, snapshots, append=False):
+    '''Writes the records of snapshots to a file, or appends them to it'''
+    with open(path, 'ab' if append else 'wb') as f:
+        f.write(b''.join(encode(snapshot) for snapshot in snapshots))
+
+
+def load(path):
+    '''Returns the list of Snapshots in a file written by save'''
+    with open(path, 'rb') as f:
+        return decode_all(f.read())
+
+
+def is_state_file(path):
+    '''Returns whether path starts with a game state record'''
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
@@ -0,0 +1,110 @@
+'''A bounded LRU cache of the transitions of a Pomme env.
+
+Search agents and counterfactual analysis step the same game with the same
+joint action over and over, especially near the root of a search. With a
+TransitionCache set on the env, Pomme.step looks the transition up first and
+on a hit restores the stored successor game instead of stepping.
+
+Entries are keyed by the zobrist hash of the game, the step count, the
+training agent and the joint action, and also keep the exact bytes of the
+game they were made from. A hit requires those bytes to match the current
+game, so a hash collision is a miss and never a wrong successor: cached
+steps give exactly the same games, rewards and done flags as uncached ones.
+'''
+from collections import OrderedDict
+
+from . import game_state
+
+# The bytes an entry takes beyond its arrays, a rough count of the Python
+# objects holding it.
+_ENTRY_OVERHEAD = 1024
+
+
+def game_bytes(state, index=0):
+    """Returns the bytes of everything step_state reads of game `index`.
+
+    These are the grids, the agents and the live bombs. The bomb arrays past
+    the live bombs are left out, as they are never read.
+    """
+    num_bombs = state.num_bombs[index]
+    return b''.join(
+        [getattr(state, name)[index].tobytes()
+         for name in game_state.GRID_ARRAYS + game_state.AGENT_ARRAYS] +
+        [getattr(state, name)[index, :num_bombs].tobytes()
+         for name in game_state.BOMB_ARRAYS])
+
+
+class TransitionCache(object):
+    """An LRU cache of the transitions of Pomme envs.
+
+    A cache only holds transitions of envs of the same config, as the
+    rewards and the done flag depend on it. The training agent, which the
+    done flag also depends on, is part of the key.
+
+    Args:
+      max_bytes: The cap on the memory taken by the entries. The least
+        recently used entries are dropped to stay under it.
+
+    Attributes:
+      hits: The number of lookups that found their transition.
+      misses: The number of lookups that did not.
+      num_bytes: The memory taken by the entries.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.num_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, before):
+        """Looks up a transition.
+
+        Args:
+          key: The (state hash, step count, training agent, joint action)
+            of the transition.
+          before: The game_bytes of the game to step.
+
+        Returns:
+          The value given to put, or None on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != before:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, before, value, num_bytes):
+        """Stores a transition, dropping the least recently used ones.
+
+        Args:
+          key: The (state hash, step count, training agent, joint action)
+            of the transition.
+          before: The game_bytes of the game before the step.
+          value: What get returns on a hit.
+          num_bytes: The memory taken by value.
+        """
+        num_bytes += len(before) + _ENTRY_OVERHEAD
+        if num_bytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.num_bytes -= old[2]
+        self._entries[key] = (before, value, num_bytes)
+        self.num_bytes += num_bytes
+        while self.num_bytes > self.max_bytes:
+            _, (_, _, dropped) = self._entries.popitem(last=False)
+            self.num_bytes -= dropped
+
+    def clear(self):
+        '''Drops every entry and resets the counters'''
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.num_bytes = 0
@@ -0,0 +1,216 @@
+'''64-bit Zobrist hashes of the games of a game_state.GameState.
+
+The hash of a game XORs one random key per piece of the state: the value of
+every cell of the board, the items and the flames, the attributes of every
+agent, the attributes of every bomb at its cell, and a key for odd step
+counts. The keys are drawn from a fixed seed, so hashes are the same in
+every process. Agent and bomb attributes of 64 or more, e.g. a huge blast
+strength, are taken modulo 64.
+
+Bombs are hashed by cell, so two games that only differ in the order the
+bombs were laid in hash the same.
+
+hash_state computes a hash from scratch. A StateHash keeps one up to date
+across ForwardModel.step_state by only XORing in the keys of the pieces that
+changed.
+'''
+import numpy as np
+
+# The seed of the keys. Changing it changes every hash.
+_SEED = 0x706f6d6d
+# The number of keys per agent or cell for the agent and bomb attributes.
+_WIDTH = 64
+# The grids of a GameState that are hashed.
+_GRIDS = ['board', 'items', 'flames']
+# The agent attributes of a GameState that are hashed.
+_AGENT_ATTRIBUTES = [
+    'agent_position', 'agent_alive', 'agent_ammo', 'agent_blast_strength',
+    'agent_can_kick'
+]
+# The bomb attributes of a GameState that are hashed with the position.
+_BOMB_ATTRIBUTES = [
+    'bomb_bomber', 'bomb_life', 'bomb_blast_strength', 'bomb_moving_direction'
+]
+
+_KEYS = {}
+
+
+class _Keys(object):
+    """The random keys of the games of one board size and number of agents.
+
+    The keys of the grids are one flat array with 256 keys per cell, one per
+    uint8 value, for the board, then the items, then the flames, so that the
+    grids are hashed from scratch in one gather. grid_list holds the same
+    keys, and it and the other keys are lists of ints, as single lookups are
+    much cheaper in lists.
+    """
+
+    def __init__(self, board_size, num_agents):
+        rng = np.random.Generator(
+            np.random.PCG64([_SEED, board_size, num_agents]))
+
+        def draw(*shape):
+            '''Draws an array of uniform 64-bit keys'''
+            return rng.integers(np.iinfo(np.uint64).max, size=shape,
+                                dtype=np.uint64, endpoint=True)
+
+        num_cells = board_size**2
+        self.grid_offsets = np.arange(0, 256 * len(_GRIDS) * num_cells, 256)
+        self.grids = np.concatenate([draw(256 * num_cells) for _ in _GRIDS])
+        self.grid_list = self.grids.tolist()
+        self.agent_position = draw(num_agents, board_size,
+                                   board_size).tolist()
+        for name in _AGENT_ATTRIBUTES[1:]:
+            setattr(self, name, draw(num_agents, _WIDTH).tolist())
+        for name in _BOMB_ATTRIBUTES:
+            setattr(self, name, draw(board_size, board_size, _WIDTH).tolist())
+        self.odd_step = int(draw(1)[0])
+
+
+def _keys(state):
+    '''Returns the keys for the shape of state, making them on first use'''
+    key = (state.board_size, state.num_agents)
+    keys = _KEYS.get(key)
+    if keys is None:
+        keys = _KEYS[key] = _Keys(*key)
+    return keys
+
+
+def _grids_hash(keys, state, index):
+    '''Hashes the board, items and flames grids of game `index`'''
+    grids = np.concatenate(
+        [getattr(state, name)[index].ravel() for name in _GRIDS])
+    return int(
+        np.bitwise_xor.reduce(keys.grids.take(keys.grid_offsets + grids)))
+
+
+def _agent_values(state, index):
+    '''Returns the lists of the agent attributes of game `index`'''
+    return [getattr(state, name)[index].tolist() for name in _AGENT_ATTRIBUTES]
+
+
+def _agent_key(keys, name, agent, value):
+    '''Returns the key of attribute `name` of an agent having value'''
+    agent_keys = getattr(keys, name)[agent]
+    if name == 'agent_position':
+        return agent_keys[value[0]][value[1]]
+    return agent_keys[value % _WIDTH]
+
+
+def _agents_hash(keys, agent_values):
+    '''Hashes the agent attributes from _agent_values'''
+    ret = 0
+    for name, values in zip(_AGENT_ATTRIBUTES, agent_values):
+        for agent, value in enumerate(values):
+            ret ^= _agent_key(keys, name, agent, value)
+    return ret
+
+
+def _bombs_hash(keys, state, index):
+    '''Hashes the live bombs of game `index`'''
+    num_bombs = state.num_bombs[index]
+    if not num_bombs:
+        return 0
+    ret = 0
+    positions = state.bomb_position[index, :num_bombs].tolist()
+    for name in _BOMB_ATTRIBUTES:
+        bomb_keys = getattr(keys, name)
+        for (row, col), value in zip(
+                positions,
+                getattr(state, name)[index, :num_bombs].tolist()):
+            ret ^= bomb_keys[row][col][value % _WIDTH]
+    return ret
+
+
+def hash_state(state, index=0, step_count=0):
+    """Computes the hash of game `index` from scratch.
+
+    Args:
+      state: The game_state.GameState.
+      index: The game of the state to hash.
+      step_count: The step count of the game. Only its parity is hashed.
+
+    Returns:
+      The hash as an int in [0, 2**64).
+    """
+    return StateHash(state, index, step_count).value
+
+
+class StateHash(object):
+    """The hash of a game, kept up to date across steps.
+
+    It remembers the pieces of the game it hashed. After a step, update XORs
+    out the keys of the grid cells and the agent attributes that changed and
+    XORs in their new keys. The bombs are rehashed whole, as every bomb
+    ticks on every step anyway.
+
+    Between two updates the game must only be changed by the step. After
+    any other change, make a new StateHash.
+
+    Args:
+      state: The game_state.GameState.
+      index: The game of the state to hash.
+      step_count: The step count of the game. Only its parity is hashed.
+
+    Attributes:
+      value: The hash as an int in [0, 2**64).
+    """
+
+    def __init__(self, state, index=0, step_count=0):
+        keys = _keys(state)
+        self._index = index
+        # The bytes of the grids as they were hashed.
+        self._grid_bytes = [
+            getattr(state, name)[index].tobytes() for name in _GRIDS
+        ]
+        self._agent_values = _agent_values(state, index)
+        self._bombs_hash = _bombs_hash(keys, state, index)
+        self.value = _grids_hash(keys, state, index) ^ \
+            _agents_hash(keys, self._agent_values) ^ self._bombs_hash
+        if step_count % 2:
+            self.value ^= keys.odd_step
+
+    def copy(self):
+        '''Returns an independent copy of this hash'''
+        ret = StateHash.__new__(StateHash)
+        ret.__dict__.update(self.__dict__)
+        ret._grid_bytes = list(self._grid_bytes)
+        return ret
+
+    def update(self, state):
+        '''Updates the hash after the state took a step, and returns it'''
+        keys = _keys(state)
+        index = self._index
+        value = self.value ^ keys.odd_step ^ self._bombs_hash
+        self._bombs_hash = _bombs_hash(keys, state, index)
+        value ^= self._bombs_hash
+
+        grid_keys = keys.grid_list
+        for num, name in enumerate(_GRIDS):
+            grid_bytes = getattr(state, name)[index].tobytes()
+            if grid_bytes == self._grid_bytes[num]:
+                continue
+            old_bytes = self._grid_bytes[num]
+            changed = np.flatnonzero(
+                np.frombuffer(old_bytes, dtype=np.uint8) !=
+                np.frombuffer(grid_bytes, dtype=np.uint8))
+            base = num * len(grid_bytes)
+            for cell in changed.tolist():
+                offset = 256 * (base + cell)
+                value ^= grid_keys[offset + old_bytes[cell]] ^ \
+                    grid_keys[offset + grid_bytes[cell]]
+            self._grid_bytes[num] = grid_bytes
+
+        agent_values = _agent_values(state, index)
+        for name, old_values, new_values in zip(
+                _AGENT_ATTRIBUTES, self._agent_values, agent_values):
+            if old_values == new_values:
+                continue
+            for agent, (old, new) in enumerate(zip(old_values, new_values)):
+                if old != new:
+                    value ^= _agent_key(keys, name, agent, old) ^ \
+                        _agent_key(keys, name, agent, new)
+        self._agent_values = agent_values
+
+        self.value = value
+        return value
@@ -0,0 +1,44 @@
+'''Tests of the board libraries and the board prefetcher'''
+import numpy as np
+
+import pommerman
+from pommerman import agents
+from pommerman import constants
+
+
+def _boards(num_games, seed=0, **prefetch):
+    '''Returns the boards and items of the first games of a prefetching env'''
+    env = pommerman.make('PommeFFACompetition-v0',
+                         [agents.BaseAgent() for _ in range(4)])
+    env.set_prefetch(3, **prefetch)
+    env.seed(seed)
+    games = []
+    for _ in range(num_games):
+        env.reset()
+        games.append((env._state.board[0].copy(), env._state.items[0].copy()))
+    env.close()
+    return games
+
+
+def _assert_same_games(games, expected):
+    '''Asserts two lists of _boards hold the same games'''
+    assert len(games) == len(expected)
+    for (board, items), (expected_board, expected_items) in zip(games,
+                                                                expected):
+        assert np.array_equal(board, expected_board)
+        assert np.array_equal(items, expected_items)
+
+
+def test_prefetched_games_are_reproducible():
+    '''A seed gives the same games in a thread or a process'''
+    games = _boards(6)
+    _assert_same_games(_boards(6), games)
+    _assert_same_games(_boards(6, use_process=True), games)
+    assert not np.array_equal(_boards(1, seed=1)[0][0], games[0][0])
+    for board, items in games:
+        assert (board == constants.Item.Rigid.value).sum() == \
+            constants.NUM_RIGID
+        assert (board == constants.Item.Wood.value).sum() == \
+            constants.NUM_WOOD
+        assert np.count_nonzero(items) == constants.NUM_ITEMS
+        assert (board[items != 0] == constants.Item.Wood.value).all()
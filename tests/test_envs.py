@@ -0,0 +1,131 @@
+'''Tests of the Pomme envs'''
+import random
+import threading
+
+import numpy as np
+import pytest
+
+import pommerman
+from pommerman import agents
+from pommerman import constants
+from pommerman import utility
+
+_CONFIGS = ['PommeFFACompetition-v0', 'PommeFFA-v1',
+            'PommeRadioCompetition-v2']
+
+
+class _BlockedAgent(agents.BaseAgent):
+    '''An agent that lays bombs, but only once it is unblocked'''
+
+    def __init__(self):
+        super(_BlockedAgent, self).__init__()
+        self.unblocked = threading.Event()
+        self.num_acts = 0
+
+    def act(self, obs, action_space):
+        self.num_acts += 1
+        self.unblocked.wait()
+        return constants.Action.Bomb.value
+
+
+def _make(config_id, seed=0, **kwargs):
+    '''Returns a reset env of SimpleAgents'''
+    env = pommerman.make(config_id,
+                         [agents.SimpleAgent() for _ in range(4)], **kwargs)
+    env.seed(seed)
+    env.reset()
+    return env
+
+
+def _play(env, num_steps, actions=None):
+    """Steps env, with the agents' actions unless actions are given.
+
+    Returns:
+      The actions, and the features, rewards and dones after each step.
+    """
+    history = []
+    obs = env.get_observations()
+    for step in range(num_steps):
+        step_actions = env.act(obs) if actions is None else actions[step]
+        obs, rewards, done, _ = env.step(step_actions)
+        history.append((step_actions, [env.featurize(o) for o in obs],
+                        rewards, done))
+        if done:
+            break
+    return history
+
+
+def _assert_same_history(history, expected):
+    '''Asserts two histories of _play are the same'''
+    assert len(history) == len(expected)
+    for step, expected_step in zip(history, expected):
+        assert step[0] == expected_step[0]
+        assert all(np.array_equal(a, b)
+                   for a, b in zip(step[1], expected_step[1]))
+        assert step[2:] == expected_step[2:]
+
+
+@pytest.mark.parametrize('config_id', _CONFIGS)
+def test_set_state_replays_the_game(config_id):
+    '''A restored snapshot plays on like the game it was taken from'''
+    env = _make(config_id)
+    _play(env, 30)
+    snapshot = env.get_state()
+    expected = _play(env, 100)
+    _play(env, 10)
+    env.set_state(snapshot)
+    _assert_same_history(
+        _play(env, 100, [step[0] for step in expected]), expected)
+
+
+def test_seed_replays_the_games():
+    '''Envs with the same seed play the same games, whatever the globals'''
+    histories = []
+    for seed in [0, 0, 1]:
+        random.seed(seed + 10)
+        np.random.seed(seed + 10)
+        env = pommerman.make('PommeFFACompetition-v0', [
+            agents.SimpleAgent(), agents.RandomAgent(), agents.SimpleAgent(),
+            agents.RandomAgent()
+        ])
+        env.seed(seed)
+        env.reset()
+        histories.append(_play(env, 200))
+    _assert_same_history(histories[1], histories[0])
+    # Another seed makes another board.
+    assert not np.array_equal(histories[2][0][1][0], histories[0][0][1][0])
+    assert utility.spawn_seeds(0, 4) == utility.spawn_seeds(0, 4)
+    assert len(set(utility.spawn_seeds(0, 4))) == 4
+
+
+@pytest.mark.parametrize('config_id', _CONFIGS)
+def test_concurrent_act_plays_like_act(config_id):
+    '''Asking the agents at once gives the actions of asking them in turn'''
+    expected = _play(_make(config_id), 100)
+    env = _make(config_id)
+    env.set_concurrent_act(4)
+    _assert_same_history(_play(env, 100), expected)
+    env.close()
+
+
+def test_late_agents_stop():
+    '''Agents past the deadline Stop, and are not asked again meanwhile'''
+    blocked = _BlockedAgent()
+    env = pommerman.make('PommeFFACompetition-v0', [
+        agents.SimpleAgent(), blocked, agents.SimpleAgent(),
+        agents.SimpleAgent()
+    ])
+    env.seed(0)
+    obs = env.reset()
+    env.set_concurrent_act(4, deadline=0.2)
+    stop = constants.Action.Stop.value
+    for _ in range(2):
+        assert env.act(obs)[1] == stop
+    assert blocked.num_acts == 1
+
+    blocked.unblocked.set()
+    assert env._running_acts[1].result() == constants.Action.Bomb.value
+    actions = env.act(obs)
+    assert actions[1] == constants.Action.Bomb.value
+    assert blocked.num_acts == 2
+    env.close()
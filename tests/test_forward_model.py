@@ -0,0 +1,496 @@
+'''Differential tests of the forward model against the rules it replaced.
+
+Each test keeps the earlier implementation as a reference and checks the
+current one against it on random inputs.
+'''
+from collections import defaultdict
+import random
+
+import numpy as np
+
+import pommerman
+from pommerman import agents
+from pommerman import characters
+from pommerman import constants
+from pommerman import forward_model
+from pommerman import game_state
+
+_WALLS = (constants.Item.Rigid.value, constants.Item.Wood.value)
+_POWERUPS = (constants.Item.ExtraBomb.value, constants.Item.IncrRange.value,
+             constants.Item.Kick.value)
+
+
+def _next_position(position, action):
+    '''Returns the position one step in the direction of action'''
+    d_row, d_col = forward_model._ACTION_OFFSETS[action]
+    return (position[0] + d_row, position[1] + d_col)
+
+
+def _on_board(board, position):
+    '''Returns whether position is on the board'''
+    return 0 <= position[0] < len(board) and 0 <= position[1] < len(board)
+
+
+def _reference_resolve_moves(board, agent_positions, desired_agent_positions,
+                             can_kick, actions, bomb_positions,
+                             desired_bomb_positions):
+    '''The collision loop of ForwardModel.step_state before _resolve_moves'''
+    desired_agent_positions = list(desired_agent_positions)
+    desired_bomb_positions = list(desired_bomb_positions)
+    crossings = {}
+
+    def crossing(current, desired):
+        '''Returns the border between two neighbouring positions'''
+        if current[0] != desired[0]:
+            return ('X', min(current[0], desired[0]), current[1])
+        return ('Y', current[0], min(current[1], desired[1]))
+
+    for num_agent, position in enumerate(agent_positions):
+        if desired_agent_positions[num_agent] != position:
+            border = crossing(position, desired_agent_positions[num_agent])
+            if border in crossings:
+                desired_agent_positions[num_agent] = position
+                num_agent2, _ = crossings[border]
+                desired_agent_positions[num_agent2] = \
+                    agent_positions[num_agent2]
+            else:
+                crossings[border] = (num_agent, True)
+
+    for num_bomb, position in enumerate(bomb_positions):
+        if desired_bomb_positions[num_bomb] != position:
+            border = crossing(position, desired_bomb_positions[num_bomb])
+            if border in crossings:
+                desired_bomb_positions[num_bomb] = position
+                num, is_agent = crossings[border]
+                if not is_agent:
+                    desired_bomb_positions[num] = bomb_positions[num]
+            else:
+                crossings[border] = (num_bomb, False)
+
+    agent_occupancy = defaultdict(int)
+    bomb_occupancy = defaultdict(int)
+    for desired_position in desired_agent_positions:
+        agent_occupancy[desired_position] += 1
+    for desired_position in desired_bomb_positions:
+        bomb_occupancy[desired_position] += 1
+
+    change = True
+    while change:
+        change = False
+        for num_agent, position in enumerate(agent_positions):
+            desired_position = desired_agent_positions[num_agent]
+            if desired_position != position and \
+               (agent_occupancy[desired_position] > 1 or
+                bomb_occupancy[desired_position] > 1):
+                desired_agent_positions[num_agent] = position
+                agent_occupancy[position] += 1
+                change = True
+
+        for num_bomb, position in enumerate(bomb_positions):
+            desired_position = desired_bomb_positions[num_bomb]
+            if desired_position != position and \
+               (bomb_occupancy[desired_position] > 1 or
+                agent_occupancy[desired_position] > 1):
+                desired_bomb_positions[num_bomb] = position
+                bomb_occupancy[position] += 1
+                change = True
+
+    agent_indexed_by_kicked_bomb = {}
+    kicked_bomb_indexed_by_agent = {}
+    delayed_bomb_updates = []
+    delayed_agent_updates = []
+
+    for num_bomb, position in enumerate(bomb_positions):
+        desired_position = desired_bomb_positions[num_bomb]
+        if agent_occupancy[desired_position] == 0:
+            continue
+
+        agent_list = [
+            num_agent
+            for num_agent, agent_position in enumerate(desired_agent_positions)
+            if agent_position == desired_position
+        ]
+        if not agent_list:
+            continue
+        num_agent = agent_list[0]
+        agent_position = agent_positions[num_agent]
+
+        if desired_position == agent_position:
+            if desired_position != position:
+                delayed_bomb_updates.append((num_bomb, position))
+            continue
+
+        if not can_kick[num_agent]:
+            delayed_bomb_updates.append((num_bomb, position))
+            delayed_agent_updates.append((num_agent, agent_position))
+            continue
+
+        target_position = _next_position(desired_position, actions[num_agent])
+        if _on_board(board, target_position) and \
+           agent_occupancy[target_position] == 0 and \
+           bomb_occupancy[target_position] == 0 and \
+           board[target_position] not in _POWERUPS and \
+           board[target_position] not in _WALLS:
+            bomb_occupancy[desired_position] = 0
+            delayed_bomb_updates.append((num_bomb, target_position))
+            agent_indexed_by_kicked_bomb[num_bomb] = num_agent
+            kicked_bomb_indexed_by_agent[num_agent] = num_bomb
+        else:
+            delayed_bomb_updates.append((num_bomb, position))
+            delayed_agent_updates.append((num_agent, agent_position))
+
+    for (num_bomb, bomb_position) in delayed_bomb_updates:
+        desired_bomb_positions[num_bomb] = bomb_position
+        bomb_occupancy[bomb_position] += 1
+        change = True
+
+    for (num_agent, agent_position) in delayed_agent_updates:
+        desired_agent_positions[num_agent] = agent_position
+        agent_occupancy[agent_position] += 1
+        change = True
+
+    while change:
+        change = False
+        for num_agent, position in enumerate(agent_positions):
+            desired_position = desired_agent_positions[num_agent]
+            if desired_position != position and \
+               (agent_occupancy[desired_position] > 1 or
+                bomb_occupancy[desired_position] != 0):
+                if num_agent in kicked_bomb_indexed_by_agent:
+                    num_bomb = kicked_bomb_indexed_by_agent[num_agent]
+                    bomb_position = bomb_positions[num_bomb]
+                    desired_bomb_positions[num_bomb] = bomb_position
+                    bomb_occupancy[bomb_position] += 1
+                    del agent_indexed_by_kicked_bomb[num_bomb]
+                    del kicked_bomb_indexed_by_agent[num_agent]
+                desired_agent_positions[num_agent] = position
+                agent_occupancy[position] += 1
+                change = True
+
+        for num_bomb, position in enumerate(bomb_positions):
+            desired_position = desired_bomb_positions[num_bomb]
+            if desired_position == position and \
+               num_bomb not in agent_indexed_by_kicked_bomb:
+                continue
+
+            if bomb_occupancy[desired_position] > 1 or \
+               agent_occupancy[desired_position] != 0:
+                desired_bomb_positions[num_bomb] = position
+                bomb_occupancy[position] += 1
+                num_agent = agent_indexed_by_kicked_bomb.get(num_bomb)
+                if num_agent is not None:
+                    agent_position = agent_positions[num_agent]
+                    desired_agent_positions[num_agent] = agent_position
+                    agent_occupancy[agent_position] += 1
+                    del kicked_bomb_indexed_by_agent[num_agent]
+                    del agent_indexed_by_kicked_bomb[num_bomb]
+                change = True
+
+    return (desired_agent_positions, desired_bomb_positions,
+            agent_indexed_by_kicked_bomb)
+
+
+def _random_moves(rng, board_size):
+    '''Returns a random crowded board with moving agents and bombs'''
+    board = np.array(
+        rng.choices([constants.Item.Passage.value] * 6 + list(_WALLS) +
+                    list(_POWERUPS),
+                    k=board_size**2),
+        dtype=np.uint8).reshape(board_size, board_size)
+    cells = [divmod(cell, board_size)
+             for cell in range(board_size**2)]
+    agent_positions = rng.sample(cells, rng.randint(1, 4))
+    bomb_positions = rng.sample(cells, rng.randint(0, 6))
+    for position in agent_positions + bomb_positions:
+        board[position] = constants.Item.Passage.value
+
+    actions = []
+    desired_agent_positions = []
+    for position in agent_positions:
+        action = rng.randrange(6)
+        desired_position = _next_position(position, action)
+        if not _on_board(board, desired_position) or \
+           board[desired_position] in _WALLS:
+            desired_position = position
+        actions.append(action)
+        desired_agent_positions.append(desired_position)
+
+    desired_bomb_positions = []
+    for position in bomb_positions:
+        desired_position = _next_position(position, rng.randrange(5))
+        if not _on_board(board, desired_position) or \
+           board[desired_position] in _WALLS + _POWERUPS:
+            desired_position = position
+        desired_bomb_positions.append(desired_position)
+
+    can_kick = [rng.random() < 0.7 for _ in agent_positions]
+    return (board, agent_positions, desired_agent_positions, can_kick,
+            actions, bomb_positions, desired_bomb_positions)
+
+
+def test_resolve_moves_matches_reference():
+    '''_resolve_moves settles random moves like the loop it replaced'''
+    rng = random.Random(0)
+    num_kicks = 0
+    for _ in range(20000):
+        board_size = rng.randint(3, 6)
+        board, agent_positions, desired_agent_positions, can_kick, actions, \
+            bomb_positions, desired_bomb_positions = \
+            _random_moves(rng, board_size)
+        expected = _reference_resolve_moves(
+            board, agent_positions, desired_agent_positions, can_kick,
+            actions, bomb_positions, desired_bomb_positions)
+
+        def cells(positions):
+            '''Returns the flat cells of positions'''
+            return [row * board_size + col for row, col in positions]
+
+        agent_cells, bomb_cells, kicks = forward_model._resolve_moves(
+            board.reshape(-1), board_size, cells(agent_positions),
+            cells(desired_agent_positions), can_kick, actions,
+            cells(bomb_positions), cells(desired_bomb_positions))
+        assert agent_cells == cells(expected[0])
+        assert bomb_cells == cells(expected[1])
+        assert kicks == expected[2]
+        num_kicks += len(kicks)
+    # The random moves must exercise the kicks.
+    assert num_kicks > 100
+
+
+def _reference_flames(board, position, blast_strength):
+    '''The flames of a bomb by the ray walk of characters.Bomb.explode'''
+    board_size = len(board)
+    row, col = position
+    rays = {
+        'up': ([row - i, col] for i in range(1, blast_strength)),
+        'down': ([row + i, col] for i in range(blast_strength)),
+        'left': ([row, col - i] for i in range(1, blast_strength)),
+        'right': ([row, col + i] for i in range(1, blast_strength))
+    }
+    flames = np.zeros_like(board)
+    for _, indices in rays.items():
+        for r, c in indices:
+            if not all([r >= 0, c >= 0, r < board_size, c < board_size]):
+                break
+            if board[r][c] == constants.Item.Rigid.value:
+                break
+            flames[r][c] = 1
+            if board[r][c] == constants.Item.Wood.value:
+                break
+    return flames
+
+
+def _random_board(rng, board_size):
+    '''Returns a random board with plenty of walls'''
+    return np.array(
+        rng.choices([constants.Item.Passage.value] * 4 + list(_WALLS) +
+                    list(_POWERUPS),
+                    k=board_size**2),
+        dtype=np.uint8).reshape(board_size, board_size)
+
+
+def test_blast_footprint_matches_reference():
+    '''_blast_footprint flames the cells the old ray walk flamed'''
+    rng = random.Random(1)
+    for _ in range(20000):
+        board_size = rng.randint(3, 13)
+        board = _random_board(rng, board_size)
+        positions = [(rng.randrange(board_size), rng.randrange(board_size))
+                     for _ in range(rng.randint(1, 7))]
+        # Strengths past the edge of the board included.
+        blast_strengths = [rng.randint(1, board_size + 2) for _ in positions]
+        expected = np.zeros_like(board)
+        for position, blast_strength in zip(positions, blast_strengths):
+            expected |= _reference_flames(board, position, blast_strength)
+
+        flames = np.zeros(board_size**2, dtype=np.uint8)
+        flames[forward_model._blast_footprint(
+            board.reshape(-1), board_size,
+            np.array([row * board_size + col for row, col in positions]),
+            np.array(blast_strengths))] = 1
+        assert np.array_equal(flames.reshape(board_size, board_size),
+                              expected)
+
+
+def test_blast_footprint_of_several_boards():
+    '''Bombs of stacked boards only flame their own board'''
+    rng = random.Random(2)
+    board_size = 8
+    boards = [_random_board(rng, board_size) for _ in range(3)]
+    positions = [(rng.randrange(board_size), rng.randrange(board_size))
+                 for _ in boards]
+    blast_strengths = [rng.randint(1, 6) for _ in boards]
+    flames = np.zeros(3 * board_size**2, dtype=np.uint8)
+    flames[forward_model._blast_footprint(
+        np.concatenate([board.reshape(-1) for board in boards]), board_size,
+        np.array([row * board_size + col for row, col in positions]),
+        np.array(blast_strengths),
+        np.arange(3) * board_size**2)] = 1
+    for num, board in enumerate(boards):
+        assert np.array_equal(
+            flames.reshape(3, board_size, board_size)[num],
+            _reference_flames(board, positions[num], blast_strengths[num]))
+
+
+def test_blast_down_ray_starts_on_the_bomb():
+    '''The 'down' ray starts at offset 0, so a bomb flames its own cell'''
+    board_size = 5
+    board = np.full((board_size, board_size), constants.Item.Rigid.value,
+                    dtype=np.uint8)
+    board[2, 2] = constants.Item.Passage.value
+    # Strength 1 reaches only the bomb's cell, through the 'down' ray.
+    footprint = forward_model._blast_footprint(
+        board.reshape(-1), board_size, np.array([12]), np.array([1]))
+    assert footprint.tolist() == [12]
+    # Walled in, a stronger bomb still flames only its own cell.
+    footprint = forward_model._blast_footprint(
+        board.reshape(-1), board_size, np.array([12]), np.array([4]))
+    assert set(footprint.tolist()) == {12}
+    # A bomb on the bottom row has a 'down' ray of just its own cell.
+    board[:] = constants.Item.Passage.value
+    footprint = forward_model._blast_footprint(
+        board.reshape(-1), board_size, np.array([22]), np.array([3]))
+    assert set(footprint.tolist()) == {20, 21, 22, 23, 24, 12, 17}
+
+
+def _assert_same_games(state, expected):
+    '''Asserts two GameStates hold the same games, bomb padding aside'''
+    mask = expected.bomb_mask()
+    for name in game_state.ALL_ARRAYS:
+        array, expected_array = getattr(state, name), getattr(expected, name)
+        if name in game_state.BOMB_ARRAYS:
+            array, expected_array = array[mask], expected_array[mask]
+        assert np.array_equal(array, expected_array), name
+
+
+def test_batch_step_matches_step():
+    '''BatchForwardModel.step on stacked envs matches ForwardModel.step'''
+    rng = random.Random(3)
+    num_envs = 8
+    envs = []
+    copies = []
+    for seed in range(2 * num_envs):
+        env = pommerman.make('PommeFFACompetition-v0',
+                             [agents.BaseAgent() for _ in range(4)])
+        env.seed(seed)
+        env.reset()
+        (envs if seed < num_envs else copies).append(env)
+    bombers = [characters.Bomber(agent_id) for agent_id in range(4)]
+
+    for _ in range(300):
+        # Start a new game where at most one agent is left. Half the agents
+        # can kick from the start.
+        for env in envs:
+            if env._state.agent_alive[0].sum() <= 1:
+                env.reset()
+                env._state.agent_can_kick[0] = [
+                    rng.random() < 0.5 for _ in range(4)]
+        # Lay bombs often, so that there are kicks and chained explosions.
+        actions = [[rng.choice([0, 1, 2, 3, 4, 5, 5]) for _ in range(4)]
+                   for _ in envs]
+        batch = game_state.GameState.from_envs(envs)
+        forward_model.BatchForwardModel.step(actions, batch)
+
+        for env, env_actions in zip(envs, actions):
+            board, bombs, items, flames = env._state.get_game(0, bombers)
+            board, bombers, bombs, items, flames = \
+                forward_model.ForwardModel.step(env_actions, board, bombers,
+                                                bombs, items, flames)
+            env._state.set_game(0, board, bombers, bombs, items, flames)
+        _assert_same_games(batch, game_state.GameState.from_envs(envs))
+
+        # Written out to other envs, the games are seen the same way.
+        for index, (env, copy) in enumerate(zip(envs, copies)):
+            batch.to_env(index, copy)
+            for obs, copy_obs in zip(env.get_observations(),
+                                     copy.get_observations()):
+                for key in ['board', 'bomb_life', 'flame_life', 'position',
+                            'ammo', 'can_kick']:
+                    assert np.array_equal(obs[key], copy_obs[key]), key
+
+
+def _random_game(rng, state, index):
+    '''Writes a random crowded game into game `index` of a GameState'''
+    size = state.board_size
+    board = _random_board(rng, size)
+    board[board == constants.Item.Wood.value] = constants.Item.Passage.value
+    cells = [divmod(cell, size) for cell in range(size**2)]
+    # Hide powerups under some wood, and put flames of up to three ages on
+    # some passages.
+    for position in rng.sample(cells, size):
+        board[position] = constants.Item.Wood.value
+        state.items[index][position] = rng.choice((0,) + _POWERUPS)
+    for position in rng.sample(cells, size // 2):
+        if board[position] == constants.Item.Passage.value:
+            board[position] = constants.Item.Flames.value
+            state.flames[index][position] = rng.randint(1, 7)
+
+    agent_positions = rng.sample(cells, state.num_agents)
+    bomb_positions = rng.sample(cells, rng.randint(0, 8))
+    for position in bomb_positions:
+        board[position] = constants.Item.Bomb.value
+    for agent_id, position in enumerate(agent_positions):
+        alive = rng.random() < 0.9
+        if alive:
+            board[position] = constants.Item.Agent0.value + agent_id
+        elif board[position] != constants.Item.Bomb.value:
+            board[position] = constants.Item.Passage.value
+        state.flames[index][position] = 0
+        state.items[index][position] = 0
+        state.agent_position[index, agent_id] = position
+        state.agent_alive[index, agent_id] = alive
+        state.agent_ammo[index, agent_id] = rng.randint(0, 2)
+        state.agent_blast_strength[index, agent_id] = rng.randint(1, 4)
+        state.agent_can_kick[index, agent_id] = rng.random() < 0.7
+    for num, position in enumerate(bomb_positions):
+        state.flames[index][position] = 0
+        state.items[index][position] = 0
+        state.bomb_position[index, num] = position
+        state.bomb_bomber[index, num] = rng.randrange(state.num_agents)
+        state.bomb_life[index, num] = rng.randint(1, 9)
+        state.bomb_blast_strength[index, num] = rng.randint(1, 4)
+        state.bomb_moving_direction[index, num] = rng.randint(0, 4)
+    state.num_bombs[index] = len(bomb_positions)
+    state.board[index] = board
+
+
+def test_batch_step_matches_step_on_crowded_boards():
+    '''BatchForwardModel.step matches ForwardModel.step on random games'''
+    rng = random.Random(4)
+    bombers = [characters.Bomber(agent_id) for agent_id in range(4)]
+    for _ in range(50):
+        num_games = 64
+        batch = game_state.GameState(6, 4, num_games)
+        for index in range(num_games):
+            _random_game(rng, batch, index)
+        expected = batch.copy()
+        actions = [[rng.randrange(6) for _ in range(4)]
+                   for _ in range(num_games)]
+        forward_model.BatchForwardModel.step(actions, batch)
+
+        for index, game_actions in enumerate(actions):
+            board, bombs, items, flames = expected.get_game(index, bombers)
+            board, bombers, bombs, items, flames = \
+                forward_model.ForwardModel.step(game_actions, board, bombers,
+                                                bombs, items, flames)
+            expected.set_game(index, board, bombers, bombs, items, flames)
+        _assert_same_games(batch, expected)
+
+
+def test_step_state_matches_step_on_crowded_boards():
+    '''ForwardModel.step_state matches ForwardModel.step on random games'''
+    rng = random.Random(5)
+    bombers = [characters.Bomber(agent_id) for agent_id in range(4)]
+    for _ in range(3000):
+        state = game_state.GameState(6, 4)
+        _random_game(rng, state, 0)
+        expected = state.copy()
+        actions = [rng.randrange(6) for _ in range(4)]
+        forward_model.ForwardModel.step_state(actions, state)
+
+        board, bombs, items, flames = expected.get_game(0, bombers)
+        board, bombers, bombs, items, flames = \
+            forward_model.ForwardModel.step(actions, board, bombers, bombs,
+                                            items, flames)
+        expected.set_game(0, board, bombers, bombs, items, flames)
+        _assert_same_games(state, expected)
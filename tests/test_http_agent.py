@@ -0,0 +1,73 @@
+'''Tests of HttpAgent against a local agent server'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+import pommerman
+from pommerman import agents
+
+
+class _Handler(BaseHTTPRequestHandler):
+    '''Answers Bomb to every action request, after the server's delay'''
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, body):
+        body = json.dumps(body).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply({'success': True})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.clients.add(self.client_address)
+        time.sleep(self.server.delay)
+        self._reply({'action': 3})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    '''Runs an agent server on a free port'''
+    ret = ThreadingHTTPServer(('localhost', 0), _Handler)
+    ret.delay = 0
+    ret.clients = set()
+    threading.Thread(target=ret.serve_forever, daemon=True).start()
+    yield ret
+    ret.shutdown()
+    ret.server_close()
+
+
+def test_act_records_latencies(server):
+    '''Action requests reuse one connection and are timed, failed or not'''
+    agent = agents.HttpAgent(port=server.server_address[1], timeout=5)
+    env = pommerman.make('PommeFFACompetition-v0',
+                         [agent] + [agents.SimpleAgent() for _ in range(3)])
+    obs = env.reset()
+    for _ in range(3):
+        assert agent.act(obs[0], env.action_space) == 3
+    assert len(agent.action_latencies) == 3
+    assert len(server.clients) == 1
+
+    # Requests time out after 0.15s and the agent Stops.
+    server.delay = 0.3
+    assert agent.act(obs[0], env.action_space) == 0
+    assert len(agent.action_latencies) == 4
+    assert agent.action_latencies[-1] >= 0.15
+
+    server.shutdown()
+    server.server_close()
+    agent._session.close()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        agent.act(obs[0], env.action_space)
+    assert len(agent.action_latencies) == 5
@@ -0,0 +1,218 @@
+'''Tests of the observations of the envs'''
+import json
+
+import numpy as np
+import pytest
+
+import pommerman
+from pommerman import agents
+from pommerman import constants
+from pommerman import observation
+from pommerman import utility
+from pommerman.runner import docker_agent_runner
+
+
+def _reference_observations(env):
+    '''The observations of env as the per agent loops before the masks'''
+    board, bombs, _, flames = env._state.get_game(0, env._agents)
+    characters = [agent._character for agent in env._agents]
+    board_size = len(board)
+    view_size = env._agent_view_size
+    fogged = env._is_partially_observable
+
+    def in_view_range(position, v_row, v_col):
+        row, col = position
+        return all([
+            row >= v_row - view_size, row <= v_row + view_size,
+            col >= v_col - view_size, col <= v_col + view_size
+        ])
+
+    observations = []
+    for agent in characters:
+        obs = {'alive': [constants.Item.Agent0.value + other.agent_id
+                         for other in characters if other.is_alive]}
+        obs['board'] = board.copy()
+        maps = {name: np.zeros((board_size, board_size)) for name in [
+            'bomb_blast_strength', 'bomb_life', 'bomb_moving_direction',
+            'flame_life'
+        ]}
+        for row in range(board_size):
+            for col in range(board_size):
+                if fogged and not in_view_range(agent.position, row, col):
+                    obs['board'][row, col] = constants.Item.Fog.value
+        for bomb in bombs:
+            if not fogged or in_view_range(agent.position, *bomb.position):
+                maps['bomb_blast_strength'][bomb.position] = \
+                    bomb.blast_strength
+                maps['bomb_life'][bomb.position] = bomb.life
+                if bomb.moving_direction is not None:
+                    maps['bomb_moving_direction'][bomb.position] = \
+                        bomb.moving_direction.value
+        for flame in flames:
+            if not fogged or in_view_range(agent.position, *flame.position):
+                maps['flame_life'][flame.position] = flame.life + 1
+        obs.update(maps)
+        for attr in ['position', 'blast_strength', 'can_kick', 'teammate',
+                     'ammo', 'enemies']:
+            obs[attr] = getattr(agent, attr)
+        observations.append(obs)
+    return observations
+
+
+def _assert_same_observations(observations, expected):
+    '''Asserts the observations have the fields of expected, equal'''
+    for obs, expected_obs in zip(observations, expected):
+        for key, value in expected_obs.items():
+            if isinstance(value, np.ndarray):
+                assert obs[key].shape == value.shape, key
+                assert np.array_equal(obs[key], value), key
+            else:
+                assert obs[key] == value, key
+
+
+@pytest.mark.parametrize('config_id',
+                         ['PommeFFACompetition-v0', 'PommeTeamCompetition-v0'])
+def test_observations_match_reference(config_id):
+    '''The masked and shared maps are what the per agent loops made'''
+    env = pommerman.make(config_id, [agents.SimpleAgent() for _ in range(4)])
+    env.seed(0)
+    for _ in range(3):
+        obs = env.reset()
+        done = False
+        while not done:
+            _assert_same_observations(obs, _reference_observations(env))
+            obs, _, done, _ = env.step(env.act(obs))
+
+
+def test_agents_do_not_share_maps():
+    '''Writing into one agent's maps leaves the others' as they were.
+
+    The board is the env's own, as it always was without fog.
+    '''
+    env = pommerman.make('PommeFFACompetition-v0',
+                         [agents.SimpleAgent() for _ in range(4)])
+    env.seed(0)
+    obs = env.reset()
+    for key in ['bomb_blast_strength', 'bomb_life', 'flame_life']:
+        obs[0][key][:] = 7
+        assert not (obs[1][key] == 7).all(), key
+        assert not (env.get_observations()[0][key] == 7).all(), key
+
+
+def test_lazy_fields_are_made_once_on_first_read():
+    '''A Lazy field is made when first read, then cached'''
+    calls = []
+
+    def make():
+        calls.append(1)
+        return np.arange(3)
+
+    obs = observation.Observation({'lazy': observation.Lazy(make), 'a': 1})
+    assert calls == []
+    assert obs['a'] == 1 and calls == []
+    copy = obs.copy()
+    assert obs['lazy'] is obs['lazy']
+    assert calls == [1]
+    # The copy was made before the read, so it still makes its own.
+    assert np.array_equal(copy['lazy'], obs['lazy']) and calls == [1, 1]
+    plain = obs.materialize()
+    assert type(plain) is dict and plain['lazy'] is obs['lazy']
+    assert observation.materialize(plain) is plain
+
+
+def test_materialized_observations_equal_read_fields():
+    '''materialize makes the same fields as reading them one by one'''
+    env = pommerman.make('PommeTeamCompetition-v0',
+                         [agents.SimpleAgent() for _ in range(4)])
+    env.seed(0)
+    obs = env.reset()
+    for _ in range(20):
+        obs, _, _, _ = env.step(env.act(obs))
+    for agent_obs in obs:
+        plain = agent_obs.copy().materialize()
+        assert set(agent_obs) == set(plain)
+        for key, value in plain.items():
+            assert np.array_equal(agent_obs[key], value), key
+
+
+def test_peek_reads_copied_arrays_without_copying():
+    '''peek reads the array a Lazy copy would copy, and no other field'''
+    shared = np.arange(3)
+    obs = observation.Observation({
+        'copy': observation.Lazy(shared.copy, shared),
+        'made': observation.Lazy(lambda: np.zeros(3)),
+        'a': 1
+    })
+    assert obs.peek('copy') is shared
+    assert type(obs._fields['copy']) is observation.Lazy
+    assert obs.peek('made') is obs['made']
+    assert obs.peek('a') == 1
+    assert observation.peek({'a': 2}, 'a') == 2
+
+
+@pytest.mark.parametrize('config_id',
+                         ['PommeTeam-v0', 'PommeRadioCompetition-v2'])
+def test_featurize_reads_the_shared_maps(config_id):
+    '''featurize gives the features of the maps without computing them'''
+    env = pommerman.make(config_id, [agents.SimpleAgent() for _ in range(4)])
+    env.seed(0)
+    obs = env.reset()
+    for _ in range(30):
+        obs, _, done, _ = env.step(env.act(obs))
+        # The agents have read the fields of obs, so take fresh ones.
+        for fresh in env.get_observations():
+            features = env.featurize(fresh)
+            assert np.array_equal(features,
+                                  env.featurize(fresh.copy().materialize()))
+            if not env._is_partially_observable:
+                assert type(fresh._fields['bomb_life']) is observation.Lazy
+        if done:
+            break
+
+
+@pytest.mark.parametrize('config_id',
+                         ['PommeFFACompetition-v0', 'PommeTeamCompetition-v0',
+                          'PommeRadioCompetition-v2'])
+def test_compact_observations_equal_float_observations(config_id):
+    '''Compact maps hold the values of the float maps in uint8'''
+    maps = ['bomb_blast_strength', 'bomb_life', 'bomb_moving_direction',
+            'flame_life']
+    envs = []
+    for obs_dtype in ['float64', 'compact']:
+        env = pommerman.make(config_id,
+                             [agents.SimpleAgent() for _ in range(4)],
+                             obs_dtype=obs_dtype)
+        env.seed(0)
+        envs.append(env)
+    obs = [env.reset() for env in envs]
+    done = False
+    while not done:
+        for float_obs, compact_obs in zip(*obs):
+            for key in maps:
+                assert float_obs[key].dtype == np.float64
+                assert compact_obs[key].dtype == np.uint8
+                assert np.array_equal(float_obs[key], compact_obs[key]), key
+            assert np.array_equal(envs[0].featurize(float_obs),
+                                  envs[1].featurize(compact_obs))
+        actions = envs[0].act(obs[0])
+        assert actions == envs[1].act(obs[1])
+        obs[0], _, done, _ = envs[0].step(actions)
+        obs[1] = envs[1].step(actions)[0]
+
+
+def test_compact_maps_survive_json():
+    '''The runner decodes JSON compact maps to uint8, float ones to float'''
+    for obs_dtype, dtype in [('float64', np.float64), ('compact', np.uint8)]:
+        env = pommerman.make('PommeFFACompetition-v0',
+                             [agents.SimpleAgent() for _ in range(4)],
+                             obs_dtype=obs_dtype)
+        env.seed(0)
+        obs = env.reset()
+        while not obs[0]['bomb_life'].any():
+            obs = env.step(env.act(obs))[0]
+        obs = obs[0]
+        decoded = json.loads(json.dumps(observation.materialize(obs),
+                                        cls=utility.PommermanJSONEncoder))
+        value = docker_agent_runner._decode_map(decoded['bomb_life'])
+        assert value.dtype == dtype
+        assert np.array_equal(value, obs['bomb_life'])
@@ -0,0 +1,78 @@
+'''Tests of the replay format'''
+import pytest
+
+import pommerman
+from pommerman import agents
+from pommerman import replay
+from pommerman import transition_cache
+
+
+def _record(config_id, path, seed=3, keep_seed=True, keyframe_interval=10,
+            num_steps=45):
+    '''Records a game of SimpleAgents and returns its games after each step'''
+    env = pommerman.make(config_id, [agents.SimpleAgent() for _ in range(4)])
+    env.seed(seed)
+    obs = env.reset()
+    games = [transition_cache.game_bytes(env._state)]
+    with replay.ReplayWriter(env, path, seed=seed if keep_seed else None,
+                             keyframe_interval=keyframe_interval) as writer:
+        for _ in range(num_steps):
+            actions = env.act(obs)
+            obs, _, done, _ = env.step(actions)
+            writer.record(actions)
+            games.append(transition_cache.game_bytes(env._state))
+            if done:
+                break
+    return games
+
+
+def _seek(game, step):
+    '''Seeks a fresh env to a step of the replay and returns its game'''
+    env = pommerman.make(game.config, [agents.BaseAgent() for _ in range(4)])
+    game.seek(env, step)
+    assert env._step_count == step
+    return transition_cache.game_bytes(env._state)
+
+
+@pytest.mark.parametrize('config_id',
+                         ['PommeFFACompetition-v0', 'PommeRadioCompetition-v2'])
+def test_seek_restores_the_game(config_id, tmp_path):
+    '''Seeking gives exactly the game recorded at every step'''
+    path = str(tmp_path / 'game.replay')
+    games = _record(config_id, path)
+    assert replay.is_replay(path)
+    game = replay.load(path)
+    assert game.config == config_id
+    assert game.seed == 3
+    assert game.num_steps == len(games) - 1
+    assert len(game.keyframes) == game.num_steps // 10 + 1
+    for step, expected in enumerate(games):
+        assert _seek(game, step) == expected
+    with pytest.raises(ValueError):
+        _seek(game, game.num_steps + 1)
+
+
+def test_truncated_replays_keep_their_full_steps(tmp_path):
+    '''A replay cut mid step decodes up to its last full step'''
+    path = str(tmp_path / 'game.replay')
+    games = _record('PommeFFACompetition-v0', path, keep_seed=False)
+    with open(path, 'rb') as f:
+        data = f.read()
+    full = replay.decode(data)
+    assert full.seed is None
+    assert full.num_steps == 45
+
+    # Steps 41 to 45 are the last 4 * 5 bytes, after the keyframe of step 40.
+    for cut, num_steps in [(2, 44), (4 * 5 + 7, 40)]:
+        game = replay.decode(data[:-cut])
+        assert game.num_steps == num_steps
+        assert game.actions == full.actions[:num_steps]
+        assert _seek(game, num_steps) == games[num_steps]
+
+
+def test_bad_replays_raise():
+    '''Data that is not a replay raises ValueError'''
+    with pytest.raises(ValueError):
+        replay.decode(b'POMR')
+    with pytest.raises(ValueError):
+        replay.decode(b'JUNK' + bytes(100))
@@ -0,0 +1,36 @@
+'''Tests of ForwardModel.run'''
+import multiprocessing
+
+import numpy as np
+
+import pommerman
+from pommerman import agents
+from pommerman import constants
+from pommerman import forward_model
+
+
+def _run(env, num_rollouts, seed, pool=None, num_tasks=None):
+    '''Runs RandomAgent rollouts from the start of the game of env'''
+    return forward_model.ForwardModel().run(
+        env.get_state(), [agents.RandomAgent() for _ in range(4)],
+        horizon=20, game_type=constants.GameType.FFA,
+        max_steps=env._max_steps, num_rollouts=num_rollouts,
+        action_space=env.action_space, pool=pool, num_tasks=num_tasks,
+        seed=seed)
+
+
+def test_pooled_rollouts_match_rollouts_without_a_pool():
+    '''Pooled rollouts differ from each other and match unpooled ones'''
+    env = pommerman.make('PommeFFACompetition-v0',
+                         [agents.BaseAgent() for _ in range(4)])
+    env.seed(0)
+    env.reset()
+    expected = _run(env, 8, seed=1)
+    with multiprocessing.Pool(2) as pool:
+        for num_tasks in [None, 3]:
+            results = _run(env, 8, seed=1, pool=pool, num_tasks=num_tasks)
+            for key in expected:
+                assert np.array_equal(results[key], expected[key]), key
+    assert len({actions.tobytes() for actions in expected['actions']}) == 8
+    assert not np.array_equal(_run(env, 8, seed=2)['actions'],
+                              expected['actions'])
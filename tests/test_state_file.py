@@ -0,0 +1,117 @@
+'''Tests of the game state file format'''
+import numpy as np
+import pytest
+
+import pommerman
+from pommerman import agents
+from pommerman import game_state
+from pommerman import state_file
+
+_CONFIGS = [
+    'PommeFFACompetition-v0', 'PommeFFA-v1', 'PommeRadioCompetition-v2'
+]
+
+
+def _make(config_id):
+    '''Returns a reset env of SimpleAgents'''
+    env = pommerman.make(config_id, [agents.SimpleAgent() for _ in range(4)])
+    env.seed(0)
+    env.reset()
+    return env
+
+
+def _snapshots(env, num_steps=60, every=5):
+    '''Plays env and returns its snapshots every few steps'''
+    ret = [env.get_state()]
+    obs = env.get_observations()
+    for step in range(1, num_steps + 1):
+        obs, _, done, _ = env.step(env.act(obs))
+        if step % every == 0:
+            ret.append(env.get_state())
+        if done:
+            break
+    return ret
+
+
+def _assert_same_snapshot(snapshot, expected):
+    '''Asserts that a decoded snapshot holds the game of expected'''
+    state = snapshot.state
+    mask = state.bomb_mask()
+    assert (mask == expected.state.bomb_mask()).all()
+    for name in game_state.ALL_ARRAYS:
+        value = getattr(state, name)
+        expected_value = getattr(expected.state, name)
+        if name in game_state.BOMB_ARRAYS:
+            value = value[mask]
+            expected_value = expected_value[mask]
+        np.testing.assert_array_equal(value, expected_value, err_msg=name)
+    assert snapshot.step_count == expected.step_count
+    # Records of fresh games, which have no intended actions yet, hold Stops.
+    info = dict(expected.info)
+    info['intended_actions'] = [
+        action[0] if isinstance(action, (list, tuple)) else action
+        for action in info['intended_actions']
+    ] or [0] * expected.state.num_agents
+    assert snapshot.info == info
+
+
+@pytest.mark.parametrize('config_id', _CONFIGS)
+def test_records_round_trip(config_id):
+    '''Decoding an encoded snapshot gives back its game'''
+    snapshots = _snapshots(_make(config_id))
+    assert any(snapshot.state.num_bombs[0] for snapshot in snapshots)
+    for expected in snapshots:
+        data = state_file.encode(expected)
+        snapshot, offset = state_file.decode(data)
+        assert offset == len(data)
+        _assert_same_snapshot(snapshot, expected)
+
+
+def test_files_round_trip(tmp_path):
+    '''Saved and appended snapshots load back in order'''
+    snapshots = _snapshots(_make('PommeFFA-v1'))
+    path = str(tmp_path / 'states.poms')
+    state_file.save(path, snapshots[:3])
+    state_file.save(path, snapshots[3:], append=True)
+    assert state_file.is_state_file(path)
+    loaded = state_file.load(path)
+    assert len(loaded) == len(snapshots)
+    for snapshot, expected in zip(loaded, snapshots):
+        _assert_same_snapshot(snapshot, expected)
+
+    state_file.save(path, snapshots[:1])
+    assert len(state_file.load(path)) == 1
+
+    other = tmp_path / 'other.json'
+    other.write_text('{}')
+    assert not state_file.is_state_file(str(other))
+
+
+def test_loaded_states_play_the_same():
+    '''An env set to a decoded snapshot plays on like the original'''
+    env = _make('PommeRadioCompetition-v2')
+    snapshot = _snapshots(env, num_steps=20)[-1]
+    loaded = _make('PommeRadioCompetition-v2')
+    loaded.set_state(state_file.decode(state_file.encode(snapshot))[0])
+    obs = env.get_observations()
+    for _ in range(20):
+        actions = env.act(obs)
+        obs, reward, done, _ = env.step(actions)
+        _, loaded_reward, loaded_done, _ = loaded.step(actions)
+        assert (reward, done) == (loaded_reward, loaded_done)
+        assert env.state_hash() == loaded.state_hash()
+        if done:
+            break
+
+
+def test_bad_records_raise():
+    '''Truncated, foreign and other version records raise ValueError'''
+    data = state_file.encode(_make('PommeFFACompetition-v0').get_state())
+    with pytest.raises(ValueError):
+        state_file.decode(data[:10])
+    with pytest.raises(ValueError):
+        state_file.decode(b'JUNK' + data[4:])
+    with pytest.raises(ValueError):
+        state_file.decode(data[:4] + b'\xff\xff' + data[6:])
+    with pytest.raises(ValueError):
+        state_file.decode_all(data + data[:-1])
@@ -0,0 +1,65 @@
+'''Tests of the transition cache'''
+import pommerman
+from pommerman import agents
+from pommerman import game_state
+from pommerman import transition_cache
+
+
+def _make(cache=None, training_agent=None):
+    '''Returns an env of SimpleAgents stepping through cache'''
+    env = pommerman.make('PommeFFACompetition-v0',
+                         [agents.SimpleAgent() for _ in range(4)])
+    env.set_transition_cache(cache)
+    if training_agent is not None:
+        env.set_training_agent(training_agent)
+    env.seed(0)
+    env.reset()
+    return env
+
+
+def _game(env):
+    '''Returns every array of the game of env as bytes'''
+    return [getattr(env._state, name).tobytes()
+            for name in game_state.ALL_ARRAYS]
+
+
+def test_cache_hits_are_bit_identical():
+    '''Steps served from the cache leave exactly the uncached games'''
+    cache = transition_cache.TransitionCache()
+    cached = _make(cache)
+    uncached = _make()
+    start = cached.get_state()
+    actions = []
+    obs = uncached.get_observations()
+    done = False
+    while not done:
+        actions.append(uncached.act(obs))
+        obs, reward, done, info = uncached.step(actions[-1])
+        assert cached.step(actions[-1])[1:] == (reward, done, info)
+        assert _game(cached) == _game(uncached)
+    assert cache.hits == 0
+
+    # Replayed, every step is a hit, and the game ends the same.
+    cached.set_state(start)
+    for step_actions in actions:
+        result = cached.step(step_actions)
+    assert cache.hits == len(actions)
+    assert result[1:] == (reward, done, info)
+    assert _game(cached) == _game(uncached)
+
+
+def test_cache_keys_on_the_training_agent():
+    '''Envs with another training agent do not share done flags'''
+    cache = transition_cache.TransitionCache()
+    envs = [_make(cache, training_agent) for training_agent in [None, 0]]
+    obs = envs[0].get_observations()
+    done = False
+    while not done:
+        actions = envs[0].act(obs)
+        obs, _, done, _ = envs[0].step(actions)
+        other_done = envs[1].step(actions)[2]
+        if not envs[0]._state.agent_alive[0, 0]:
+            # Agent 0 died, which ends the game of the env it trains.
+            assert other_done
+            break
+        assert other_done == done
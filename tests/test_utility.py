@@ -0,0 +1,95 @@
+'''Tests of the board generation and cell predicates of utility'''
+import random
+
+import numpy as np
+import pytest
+
+from pommerman import constants
+from pommerman import utility
+
+
+@pytest.mark.parametrize('size,num_rigid,num_wood,num_agents',
+                         [(11, 36, 36, 4), (8, 16, 16, 2), (11, 0, 0, 4)])
+def test_make_board_is_valid(size, num_rigid, num_wood, num_agents):
+    '''Boards are symmetric, have their walls and reachable passages'''
+    rng = random.Random(0)
+    for _ in range(200):
+        board = utility.make_board(size, num_rigid, num_wood, num_agents,
+                                   rng=rng)
+        walls = np.isin(board, [constants.Item.Rigid.value,
+                                constants.Item.Wood.value])
+        assert (walls == walls.T).all()
+        assert (board == constants.Item.Rigid.value).sum() == num_rigid
+        assert (board == constants.Item.Wood.value).sum() == \
+            max(num_wood, 4 * (size - 8) if num_agents == 4 else 0)
+        agents = utility._board_layout(size, num_agents)[1]
+        assert (board >= constants.Item.Agent0.value).sum() == num_agents
+        assert len(utility.inaccessible_passages(board, agents)) <= 4
+
+
+def test_make_board_is_reproducible():
+    '''The same rng state makes the same board'''
+    boards = [utility.make_board(11, 36, 36, rng=random.Random(1))
+              for _ in range(2)]
+    assert np.array_equal(*boards)
+
+
+def test_make_board_gives_up():
+    '''Boards that wall off their passages raise instead of looping'''
+    with pytest.raises(ValueError):
+        utility.make_board(11, 76, 0, rng=random.Random(0))
+
+
+def _reference_is_passable(value, enemies):
+    '''position_is_passable before the lookup tables'''
+    powerups = [constants.Item.ExtraBomb.value, constants.Item.IncrRange.value,
+                constants.Item.Kick.value]
+    agents = [constants.Item.Agent0.value, constants.Item.Agent1.value,
+              constants.Item.Agent2.value, constants.Item.Agent3.value]
+    return all([
+        any([value in agents, value in powerups,
+             value == constants.Item.Passage.value]),
+        not constants.Item(value) in enemies
+    ])
+
+
+_ENEMY_SETS = [[], [constants.Item.Agent1],
+               [constants.Item.Agent1, constants.Item.Agent3],
+               [constants.Item.Agent0, constants.Item.Agent2,
+                constants.Item.AgentDummy]]
+
+
+def test_cell_predicates_match_reference():
+    '''The table lookups classify every Item value as the lists did'''
+    item = constants.Item
+    powerups = [item.ExtraBomb, item.IncrRange, item.Kick]
+    agents = [item.Agent0, item.Agent1, item.Agent2, item.Agent3]
+    for value in range(len(item)):
+        board = np.array([[value]], dtype=np.uint8)
+        position = (0, 0)
+        assert utility.position_is_powerup(board, position) == \
+            (value in [i.value for i in powerups])
+        assert utility.position_is_wall(board, position) == \
+            (value in [item.Rigid.value, item.Wood.value])
+        assert utility.position_is_agent(board, position) == \
+            (value in [i.value for i in agents])
+        assert utility.position_is_fog(board, position) == \
+            (value == item.Fog.value)
+        assert utility.ITEMS_BY_VALUE[value] is item(value)
+        for enemies in _ENEMY_SETS:
+            assert utility.position_is_enemy(board, position, enemies) == \
+                (item(value) in enemies)
+            assert utility.position_is_passable(board, position, enemies) == \
+                _reference_is_passable(value, enemies)
+            assert utility.position_in_items(board, position, enemies) == \
+                any(value == i.value for i in enemies)
+
+
+def test_passable_cells_matches_position_is_passable():
+    '''passable_cells classifies whole boards as the per cell predicate'''
+    rng = np.random.RandomState(0)
+    for enemies in _ENEMY_SETS:
+        board = rng.randint(0, len(constants.Item), size=(11, 11))
+        expected = [[utility.position_is_passable(board, (row, col), enemies)
+                     for col in range(11)] for row in range(11)]
+        assert utility.passable_cells(board, enemies).tolist() == expected
@@ -0,0 +1,84 @@
+'''Tests of VecPomme'''
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from pommerman import agents
+from pommerman import envs
+
+_FACTORIES = [None, agents.SimpleAgent, agents.SimpleAgent, agents.SimpleAgent]
+
+
+def _play(seed, num_steps=30):
+    '''Returns the observations and rewards of random actions in a VecPomme'''
+    rng = np.random.RandomState(0)
+    with envs.VecPomme('PommeFFACompetition-v0', _FACTORIES, num_envs=4,
+                       num_workers=2, seed=seed) as env:
+        history = [env.reset()]
+        for _ in range(num_steps):
+            obs, rewards, dones, final_obs = env.step(
+                rng.randint(0, 6, size=(4, 1)))
+            history.extend([obs, rewards, dones, final_obs[dones]])
+    return history
+
+
+def test_vec_pomme_is_reproducible():
+    '''The same seed plays the same games, another seed other games'''
+    first = _play(0)
+    assert all(np.array_equal(a, b) for a, b in zip(first, _play(0)))
+    assert not np.array_equal(first[0], _play(1, num_steps=0)[0])
+
+
+def test_halves_step_like_every_env():
+    '''Stepping the halves in turn plays the games of stepping every env'''
+    rng = np.random.RandomState(0)
+    with envs.VecPomme('PommeFFACompetition-v0', _FACTORIES, num_envs=5,
+                       num_workers=3, seed=0) as whole, \
+            envs.VecPomme('PommeFFACompetition-v0', _FACTORIES, num_envs=5,
+                          num_workers=3, seed=0) as halved:
+        assert [half.indices(5) for half in halved.halves] == \
+            [(0, 1, 1), (1, 5, 1)]
+        assert np.array_equal(whole.reset(), halved.reset())
+        for _ in range(30):
+            actions = rng.randint(0, 6, size=(5, 1))
+            expected = whole.step(actions)
+            halved.step_async(actions[halved.halves[0]], half=0)
+            halved.step_async(actions[halved.halves[1]], half=1)
+            second = halved.step_wait(half=1)
+            first = halved.step_wait(half=0)
+            for num in range(3):
+                assert np.array_equal(
+                    expected[num], np.concatenate([first[num], second[num]]))
+
+
+def test_misordered_steps_raise():
+    '''Stepping busy envs, or waiting for idle ones, raises ValueError'''
+    with envs.VecPomme('PommeFFACompetition-v0', _FACTORIES, num_envs=2,
+                       num_workers=2, seed=0) as env:
+        env.reset()
+        with pytest.raises(ValueError):
+            env.step_wait(half=0)
+        env.step_async(np.zeros((1, 1), dtype=int), half=0)
+        with pytest.raises(ValueError):
+            env.step_async(np.zeros((1, 1), dtype=int), half=0)
+        with pytest.raises(ValueError):
+            env.step(np.zeros((2, 1), dtype=int))
+        env.step_wait(half=0)
+        env.step(np.zeros((2, 1), dtype=int))
+    with envs.VecPomme('PommeFFACompetition-v0', _FACTORIES, num_envs=2,
+                       num_workers=1, seed=0) as env:
+        env.reset()
+        with pytest.raises(ValueError):
+            env.step_async(np.zeros((0, 1), dtype=int), half=0)
+
+
+def test_import_does_not_need_shared_memory():
+    '''VecPomme, and its shared memory, are only imported on first use'''
+    code = ('import sys, pommerman; '
+            'assert "multiprocessing.shared_memory" not in sys.modules; '
+            'pommerman.envs.VecPomme')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=root)
@@ -0,0 +1,45 @@
+'''Tests of the Zobrist hashes of game states'''
+import pommerman
+from pommerman import agents
+from pommerman import zobrist
+
+
+def test_incremental_hash_equals_hash_from_scratch():
+    '''Pomme.state_hash, updated every step, is the hash of the game'''
+    env = pommerman.make('PommeFFACompetition-v0',
+                         [agents.SimpleAgent() for _ in range(4)])
+    env.seed(0)
+    hashes = set()
+    for _ in range(3):
+        obs = env.reset()
+        done = False
+        while not done:
+            value = env.state_hash()
+            assert value == zobrist.hash_state(env._state, 0,
+                                               env._step_count)
+            hashes.add(value)
+            snapshot = env.get_state()
+            obs, _, done, _ = env.step(env.act(obs))
+        # A restored snapshot carries on from its own hash.
+        env.set_state(snapshot)
+        assert env.state_hash() == snapshot.state_hash()
+        env.step(env.act(env.get_observations()))
+        assert env.state_hash() == zobrist.hash_state(env._state, 0,
+                                                      env._step_count)
+    assert len(hashes) > 100
+
+
+def test_copied_hash_is_independent():
+    '''A copy of a StateHash updates apart from the original'''
+    env = pommerman.make('PommeFFACompetition-v0',
+                         [agents.SimpleAgent() for _ in range(4)])
+    env.seed(1)
+    obs = env.reset()
+    state_hash = zobrist.StateHash(env._state)
+    state = env._state.copy()
+    copy = state_hash.copy()
+    for _ in range(20):
+        obs, _, _, _ = env.step(env.act(obs))
+        state_hash.update(env._state)
+    assert copy.value == zobrist.hash_state(state)
+    assert state_hash.value == zobrist.hash_state(env._state, 0, 20)